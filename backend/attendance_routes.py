@@ -0,0 +1,1426 @@
+"""
+Attendance Routes
+Attendance marking and correction, month and year attendance generation,
+overtime logs, late arrivals and monthly attendance summaries
+"""
+
+import os
+import json
+import logging
+import asyncio
+import socket
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from server import (
+    add_attendance_counters, AdminOTLogCreate, Attendance, attendance_removal_counters,
+    AttendanceCorrection, AttendanceMarkRequest, DashboardCounterBatch, db,
+    get_current_user, HOLIDAY_DAY, increment_dashboard_counters,
+    increment_employee_dashboard_counters, invalidate_rating_snapshots, LateArrival,
+    LateArrivalCreate, Notification, OTApprovalRequest, OTLog, OTLogCreate,
+    prepare_for_mongo, prepare_from_mongo, require_role, send_realtime_notification,
+    status_counter_deltas, User, UserRole, working_calendar, WORKING_DAY,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Attendance"])
+
+# OT (Overtime) Management Endpoints
+@router.post("/ot/log")
+async def log_overtime(
+    ot_data: OTLogCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Employee logs overtime hours with time range validation"""
+    try:
+        # Validate that OT can only be logged for today
+        today = date.today()
+        if ot_data.date != today:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"OT can only be logged for today's date ({today.strftime('%Y-%m-%d')}). Cannot log OT for past or future dates."
+            )
+        
+        # Parse times
+        from_hour, from_min = map(int, ot_data.from_time.split(':'))
+        to_hour, to_min = map(int, ot_data.to_time.split(':'))
+        from_minutes = from_hour * 60 + from_min
+        to_minutes = to_hour * 60 + to_min
+        
+        # Validate time range
+        if from_minutes >= to_minutes:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="End time must be after start time"
+            )
+        
+        # Check if date is a working day or off day (weekend/holiday)
+        is_work_day = await working_calendar.is_working_day(current_user.company_id, ot_data.date)
+        
+        # Only validate office hours for working days
+        # On weekends/holidays, allow OT for any time
+        if is_work_day:
+            # Office hours: 8:30 AM (510 minutes) to 5:30 PM (1050 minutes)
+            office_start = 8 * 60 + 30  # 510 minutes (8:30 AM)
+            office_end = 17 * 60 + 30   # 1050 minutes (5:30 PM)
+            
+            # Validate OT is outside office hours on working days
+            if from_minutes >= office_start and from_minutes < office_end:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="On working days, OT start time must be before 8:30 AM or after 5:30 PM"
+                )
+            
+            if to_minutes > office_start and to_minutes <= office_end:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="On working days, OT end time must be before 8:30 AM or after 5:30 PM"
+                )
+        
+        # Calculate OT hours
+        ot_hours = (to_minutes - from_minutes) / 60.0
+        
+        # Check for duplicate/overlapping OT entries on the same date
+        existing_ot = await db.ot_logs.find({
+            "employee_id": current_user.username,
+            "date": ot_data.date.isoformat()
+        }).to_list(length=None)
+        
+        for existing in existing_ot:
+            existing_from = existing.get("from_time", "")
+            existing_to = existing.get("to_time", "")
+            
+            if existing_from and existing_to:
+                ex_from_hour, ex_from_min = map(int, existing_from.split(':'))
+                ex_to_hour, ex_to_min = map(int, existing_to.split(':'))
+                ex_from_minutes = ex_from_hour * 60 + ex_from_min
+                ex_to_minutes = ex_to_hour * 60 + ex_to_min
+                
+                # Check for overlap
+                if not (to_minutes <= ex_from_minutes or from_minutes >= ex_to_minutes):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"OT time overlaps with existing entry ({existing_from} - {existing_to})"
+                    )
+        
+        ot_log = OTLog(
+            employee_id=current_user.username,
+            date=ot_data.date,
+            from_time=ot_data.from_time,
+            to_time=ot_data.to_time,
+            ot_hours=round(ot_hours, 2),
+            project=ot_data.project,
+            notes=ot_data.notes,
+            status="pending"
+        )
+        
+        ot_dict = prepare_for_mongo(ot_log.dict())
+        await db.ot_logs.insert_one(ot_dict)
+        
+        # Fetch employee name for notification
+        employee = await db.employees.find_one({"employee_id": current_user.username})
+        employee_name = employee.get('name', current_user.username) if employee else current_user.username
+        
+        await increment_dashboard_counters(
+            employee.get("company_id") if employee else None,
+            status_counter_deltas("ot", None, "pending")
+        )
+        
+        # Create notification for admin
+        notification = Notification(
+            recipient_role="admin",
+            title="New OT Log Submitted",
+            message=f"{employee_name} has logged {round(ot_hours, 2)} hours of overtime ({ot_data.from_time} - {ot_data.to_time}) for {ot_data.date} (Project: {ot_data.project}).",
+            category="ot",
+            related_id=ot_log.id,
+            notification_type="info"
+        )
+        notification_dict = prepare_for_mongo(notification.dict())
+        await db.notifications.insert_one(notification_dict)
+        
+        toast_message = f"OT logged successfully: {round(ot_hours, 2)} hours ({ot_data.from_time} - {ot_data.to_time})"
+        return {"message": toast_message, "ot_log": prepare_from_mongo(ot_dict)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error logging OT: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to log overtime: {str(e)}"
+        )
+
+@router.get("/ot/my-ot")
+async def get_my_ot_logs(current_user: User = Depends(get_current_user)):
+    """Employee view their OT logs"""
+    try:
+        ot_logs = await db.ot_logs.find({"employee_id": current_user.username}).to_list(length=None)
+        return [prepare_from_mongo(log) for log in ot_logs]
+    except Exception as e:
+        logging.error(f"Error fetching OT logs: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch OT logs"
+        )
+
+@router.post("/ot/admin-log")
+async def admin_log_overtime(
+    ot_data: AdminOTLogCreate,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Admin logs overtime for any employee on any date (no date restrictions)"""
+    try:
+        # Verify employee exists
+        employee = await db.employees.find_one({"employee_id": ot_data.employee_id})
+        if not employee:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Employee {ot_data.employee_id} not found"
+            )
+        
+        # Parse times
+        from_hour, from_min = map(int, ot_data.from_time.split(':'))
+        to_hour, to_min = map(int, ot_data.to_time.split(':'))
+        from_minutes = from_hour * 60 + from_min
+        to_minutes = to_hour * 60 + to_min
+        
+        # Validate time range
+        if from_minutes >= to_minutes:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="End time must be after start time"
+            )
+        
+        # Calculate OT hours
+        ot_hours = (to_minutes - from_minutes) / 60.0
+        
+        # Check for duplicate/overlapping OT entries on the same date for this employee
+        existing_ot = await db.ot_logs.find({
+            "employee_id": ot_data.employee_id,
+            "date": ot_data.date.isoformat()
+        }).to_list(length=None)
+        
+        for existing in existing_ot:
+            existing_from = existing.get("from_time", "")
+            existing_to = existing.get("to_time", "")
+            
+            if existing_from and existing_to:
+                ex_from_h, ex_from_m = map(int, existing_from.split(':'))
+                ex_to_h, ex_to_m = map(int, existing_to.split(':'))
+                ex_from_minutes = ex_from_h * 60 + ex_from_m
+                ex_to_minutes = ex_to_h * 60 + ex_to_m
+                
+                # Check for overlap
+                if not (to_minutes <= ex_from_minutes or from_minutes >= ex_to_minutes):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"OT time overlaps with existing entry ({existing_from} - {existing_to})"
+                    )
+        
+        # Create OT log
+        ot_log = OTLog(
+            employee_id=ot_data.employee_id,
+            date=ot_data.date,
+            from_time=ot_data.from_time,
+            to_time=ot_data.to_time,
+            ot_hours=ot_hours,
+            project=ot_data.project,
+            notes=ot_data.notes,
+            status="approved",  # Admin-logged OT is auto-approved
+            approved_by=current_user.username,
+            approved_date=datetime.now(timezone.utc)
+        )
+        
+        ot_dict = prepare_for_mongo(ot_log.dict())
+        await db.ot_logs.insert_one(ot_dict)
+        await invalidate_rating_snapshots(ot_data.employee_id, ot_dict["date"])
+        
+        # Create notification for employee
+        employee_name = employee.get('name', 'Unknown')
+        notification = Notification(
+            recipient_id=ot_data.employee_id,
+            recipient_role="employee",
+            title="OT Logged by Admin",
+            message=f"Admin has logged {round(ot_hours, 2)} hours of overtime for you on {ot_data.date.strftime('%d %b %Y')} ({ot_data.from_time} - {ot_data.to_time}) for project: {ot_data.project}",
+            category="ot_log",
+            related_id=ot_log.id,
+            notification_type="info"
+        )
+        notification_dict = prepare_for_mongo(notification.dict())
+        await db.notifications.insert_one(notification_dict)
+        
+        # Send real-time notification
+        await send_realtime_notification(notification_dict)
+        
+        return {
+            "message": f"OT logged successfully for {employee_name}: {round(ot_hours, 2)} hours",
+            "ot_log": prepare_from_mongo(ot_dict)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error logging OT by admin: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to log overtime: {str(e)}"
+        )
+
+@router.get("/ot/all")
+async def get_all_ot_logs(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Admin view all OT logs"""
+    try:
+        ot_logs = await db.ot_logs.find({}).to_list(length=None)
+        
+        # Enrich with employee details
+        for log in ot_logs:
+            employee = await db.employees.find_one({"employee_id": log["employee_id"]})
+            if employee:
+                log["employee_name"] = employee.get("name", "Unknown")
+                log["department"] = employee.get("department", "N/A")
+        
+        return [prepare_from_mongo(log) for log in ot_logs]
+    except Exception as e:
+        logging.error(f"Error fetching all OT logs: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch OT logs"
+        )
+
+@router.put("/ot/{ot_id}/approve")
+async def approve_reject_ot(
+    ot_id: str,
+    approval_data: OTApprovalRequest,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Admin approve or reject OT log"""
+    try:
+        ot_log = await db.ot_logs.find_one({"id": ot_id})
+        if not ot_log:
+            raise HTTPException(status_code=404, detail="OT log not found")
+        
+        update_data = {
+            "status": approval_data.status,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        
+        if approval_data.status == "approved":
+            update_data["approved_by"] = current_user.username
+            update_data["approved_date"] = datetime.now(timezone.utc).isoformat()
+        else:
+            update_data["rejected_by"] = current_user.username
+            update_data["rejected_date"] = datetime.now(timezone.utc).isoformat()
+            update_data["rejection_reason"] = approval_data.rejection_reason
+        
+        await db.ot_logs.update_one({"id": ot_id}, {"$set": update_data})
+        await increment_employee_dashboard_counters(
+            ot_log["employee_id"],
+            status_counter_deltas("ot", ot_log.get("status"), approval_data.status)
+        )
+        await invalidate_rating_snapshots(ot_log["employee_id"], ot_log["date"])
+        
+        # Create notification for employee
+        employee_id = ot_log["employee_id"]
+        status_text = "approved" if approval_data.status == "approved" else "rejected"
+        notification = Notification(
+            recipient_role="employee",
+            recipient_id=employee_id,
+            title=f"OT Log {status_text.capitalize()}",
+            message=f"Your overtime log for {ot_log['date']} ({ot_log['ot_hours']} hours, Project: {ot_log.get('project', 'N/A')}) has been {status_text}.",
+            category="ot",
+            related_id=ot_id,
+            notification_type="info" if approval_data.status == "approved" else "warning"
+        )
+        notification_dict = prepare_for_mongo(notification.dict())
+        await db.notifications.insert_one(notification_dict)
+        
+        # Send real-time notification
+        await send_realtime_notification(notification_dict)
+        
+        # Mark the OT submission notification as read using related_id
+        await db.notifications.update_many(
+            {
+                "related_id": ot_id,
+                "category": "ot",
+                "recipient_role": "admin",
+                "is_read": False
+            },
+            {"$set": {"is_read": True, "read_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        
+        return {"message": f"OT log {status_text} successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error approving/rejecting OT: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to process OT approval"
+        )
+
+# Attendance Management Endpoints
+@router.get("/attendance/my-attendance")
+async def get_my_attendance(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Get employee's attendance records"""
+    try:
+        # Default to current month if not specified
+        if not month or not year:
+            now = datetime.now()
+            month = now.month
+            year = now.year
+        
+        # Get date range for the month
+        month_start = date(year, month, 1)
+        if month == 12:
+            month_end = date(year + 1, 1, 1) - timedelta(days=1)
+        else:
+            month_end = date(year, month + 1, 1) - timedelta(days=1)
+        
+        # Fetch attendance records
+        attendance = await db.attendance.find({
+            "employee_id": current_user.username,
+            "date": {
+                "$gte": month_start.isoformat(),
+                "$lte": month_end.isoformat()
+            }
+        }).to_list(length=None)
+        
+        return [prepare_from_mongo(record) for record in attendance]
+    except Exception as e:
+        logging.error(f"Error fetching attendance: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch attendance"
+        )
+
+ATTENDANCE_STREAM_BATCH_SIZE = int(os.environ.get('ATTENDANCE_STREAM_BATCH_SIZE', 500))
+# Largest page /attendance/all serves when paging with limit
+ATTENDANCE_PAGE_MAX_LIMIT = int(os.environ.get('ATTENDANCE_PAGE_MAX_LIMIT', 1000))
+
+async def enrich_attendance_records(records: List[dict]) -> List[dict]:
+    """Attach employee_name and department with one employee fetch per batch"""
+    employee_ids = list({record["employee_id"] for record in records})
+    employees = await db.employees.find(
+        {"employee_id": {"$in": employee_ids}},
+        {"_id": 0, "employee_id": 1, "name": 1, "department": 1}
+    ).to_list(length=None)
+    employees_by_id = {employee["employee_id"]: employee for employee in employees}
+    
+    for record in records:
+        employee = employees_by_id.get(record["employee_id"])
+        if employee:
+            record["employee_name"] = employee.get("name", "Unknown")
+            record["department"] = employee.get("department", "N/A")
+    return [prepare_from_mongo(record) for record in records]
+
+@router.get("/attendance/all")
+async def get_all_attendance(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    employee_id: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=ATTENDANCE_PAGE_MAX_LIMIT),
+    stream: bool = False,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """
+    Admin view all attendance records.
+    Returns a plain list unless limit is given, in which case a page with the total is
+    returned; with stream=true the rows are sent as NDJSON, one record per line.
+    """
+    try:
+        # Default to current month if not specified
+        if not month or not year:
+            now = datetime.now()
+            month = now.month
+            year = now.year
+        
+        # Get date range for the month
+        month_start = date(year, month, 1)
+        if month == 12:
+            month_end = date(year + 1, 1, 1) - timedelta(days=1)
+        else:
+            month_end = date(year, month + 1, 1) - timedelta(days=1)
+        
+        # Build query
+        query = {
+            "date": {
+                "$gte": month_start.isoformat(),
+                "$lte": month_end.isoformat()
+            }
+        }
+        
+        if employee_id:
+            query["employee_id"] = employee_id
+        
+        cursor = db.attendance.find(query, {"_id": 0}).sort([("date", 1), ("employee_id", 1)]).skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        
+        if stream:
+            async def ndjson_rows():
+                batch = []
+                async for record in cursor:
+                    batch.append(record)
+                    if len(batch) >= ATTENDANCE_STREAM_BATCH_SIZE:
+                        for row in await enrich_attendance_records(batch):
+                            yield json.dumps(row, default=str) + "\n"
+                        batch = []
+                if batch:
+                    for row in await enrich_attendance_records(batch):
+                        yield json.dumps(row, default=str) + "\n"
+            
+            return StreamingResponse(ndjson_rows(), media_type="application/x-ndjson")
+        
+        # Fetch attendance records and enrich with employee details
+        attendance = await enrich_attendance_records(await cursor.to_list(length=None))
+        
+        if limit:
+            total = await db.attendance.count_documents(query)
+            return {
+                "records": attendance,
+                "total": total,
+                "skip": skip,
+                "limit": limit
+            }
+        return attendance
+    except Exception as e:
+        logging.error(f"Error fetching all attendance: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch attendance"
+        )
+
+@router.put("/attendance/correct")
+async def correct_attendance(
+    employee_id: str,
+    correction_data: AttendanceCorrection,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Admin manually correct attendance"""
+    try:
+        # Check if attendance record exists
+        existing = await db.attendance.find_one({
+            "employee_id": employee_id,
+            "date": correction_data.date.isoformat()
+        })
+        
+        attendance_data = {
+            "employee_id": employee_id,
+            "date": correction_data.date.isoformat(),
+            "status": correction_data.status,
+            "working_hours": correction_data.working_hours,
+            "notes": correction_data.notes,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        
+        if existing:
+            # Update existing record
+            await db.attendance.update_one(
+                {
+                    "employee_id": employee_id,
+                    "date": correction_data.date.isoformat()
+                },
+                {"$set": attendance_data}
+            )
+        else:
+            # Create new record
+            attendance = Attendance(
+                employee_id=employee_id,
+                date=correction_data.date,
+                status=correction_data.status,
+                working_hours=correction_data.working_hours,
+                notes=correction_data.notes
+            )
+            attendance_dict = prepare_for_mongo(attendance.dict())
+            await db.attendance.insert_one(attendance_dict)
+        
+        date_key = f"attendance_by_date.{correction_data.date.isoformat()}"
+        deltas = {f"{date_key}.{correction_data.status}": 1}
+        if existing:
+            previous_key = f"{date_key}.{existing.get('status') or 'unknown'}"
+            deltas[previous_key] = deltas.get(previous_key, 0) - 1
+        await increment_employee_dashboard_counters(employee_id, deltas)
+        await invalidate_rating_snapshots(employee_id, correction_data.date.isoformat())
+        
+        return {"message": "Attendance corrected successfully"}
+    except Exception as e:
+        logging.error(f"Error correcting attendance: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to correct attendance"
+        )
+
+@router.post("/attendance/mark")
+async def mark_attendance(
+    attendance_data: AttendanceMarkRequest,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Admin marks or updates attendance for an employee"""
+    try:
+        # Validate status
+        if attendance_data.status not in ['present', 'absent', 'half-day']:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Status must be 'present', 'absent', or 'half-day'"
+            )
+        
+        # Validate working hours
+        if attendance_data.working_hours < 0 or attendance_data.working_hours > 24:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Working hours must be between 0 and 24"
+            )
+        
+        # Verify employee exists
+        employee = await db.employees.find_one({"employee_id": attendance_data.employee_id})
+        if not employee:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Employee {attendance_data.employee_id} not found"
+            )
+        
+        # Check if attendance record exists for this date
+        date_str = attendance_data.date.isoformat()
+        existing_record = await db.attendance.find_one({
+            "employee_id": attendance_data.employee_id,
+            "date": date_str
+        })
+        
+        if existing_record:
+            # Update existing record
+            update_data = {
+                "status": attendance_data.status,
+                "working_hours": attendance_data.working_hours,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }
+            
+            await db.attendance.update_one(
+                {"employee_id": attendance_data.employee_id, "date": date_str},
+                {"$set": update_data}
+            )
+            
+            message = f"Attendance updated for {employee.get('name', attendance_data.employee_id)} on {date_str}"
+        else:
+            # Create new record
+            attendance_record = {
+                "id": str(uuid.uuid4()),
+                "employee_id": attendance_data.employee_id,
+                "date": date_str,
+                "status": attendance_data.status,
+                "check_in": "08:30" if attendance_data.status == 'present' else None,
+                "check_out": "18:00" if attendance_data.status == 'present' else None,
+                "working_hours": attendance_data.working_hours,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }
+            
+            await db.attendance.insert_one(attendance_record)
+            message = f"Attendance marked for {employee.get('name', attendance_data.employee_id)} on {date_str}"
+        
+        date_key = f"attendance_by_date.{date_str}"
+        deltas = {f"{date_key}.{attendance_data.status}": 1}
+        if existing_record:
+            previous_key = f"{date_key}.{existing_record.get('status') or 'unknown'}"
+            deltas[previous_key] = deltas.get(previous_key, 0) - 1
+        await increment_dashboard_counters(employee.get("company_id"), deltas)
+        await invalidate_rating_snapshots(attendance_data.employee_id, date_str)
+        
+        return {
+            "message": message,
+            "employee_id": attendance_data.employee_id,
+            "date": date_str,
+            "status": attendance_data.status,
+            "working_hours": attendance_data.working_hours
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error marking attendance: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to mark attendance: {str(e)}"
+        )
+
+# Bulk attendance writes
+ATTENDANCE_INSERT_BATCH_SIZE = int(os.environ.get('ATTENDANCE_INSERT_BATCH_SIZE', 1000))
+
+def build_attendance_record(employee_id: str, day: date, status: str, working_hours: float, timestamp: str) -> dict:
+    """Attendance document in the shape prepare_for_mongo(Attendance(...).dict()) produces"""
+    return {
+        "id": str(uuid.uuid4()),
+        "employee_id": employee_id,
+        "date": day.isoformat(),
+        "status": status,
+        "working_hours": working_hours,
+        "notes": None,
+        "created_at": timestamp,
+        "updated_at": timestamp
+    }
+
+async def insert_attendance_batch(records: List[dict], counters: Optional[DashboardCounterBatch] = None,
+                                  companies: Optional[Dict[str, Optional[str]]] = None) -> tuple:
+    """
+    Unordered insert_many of attendance records.
+    Returns (inserted, duplicates); duplicate keys are skipped rather than failing the batch.
+    With `counters`, the records actually written are counted towards the dashboard.
+    """
+    if not records:
+        return 0, 0
+    try:
+        result = await db.attendance.insert_many(records, ordered=False)
+        inserted, write_errors = len(result.inserted_ids), []
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        non_duplicates = [error for error in write_errors if error.get("code") != 11000]
+        if non_duplicates:
+            raise
+        inserted = e.details.get("nInserted", 0)
+    if counters is not None:
+        skipped = {error.get("index") for error in write_errors}
+        written = [record for index, record in enumerate(records) if index not in skipped]
+        add_attendance_counters(counters, written, companies or {})
+    return inserted, len(write_errors)
+
+@router.post("/attendance/generate")
+async def generate_attendance_for_month(
+    month: int,
+    year: int,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Admin generates attendance for all active employees for a given month"""
+    try:
+        # Get all active employees
+        employees = await db.employees.find({"status": "active"}).to_list(length=None)
+        
+        # Get approved leaves for the month
+        month_start = date(year, month, 1)
+        if month == 12:
+            month_end = date(year + 1, 1, 1) - timedelta(days=1)
+        else:
+            month_end = date(year, month + 1, 1) - timedelta(days=1)
+        
+        approved_leaves = await db.leave_requests.find({
+            "status": "approved",
+            "$or": [
+                {"start_date": {"$gte": month_start.isoformat(), "$lte": month_end.isoformat()}},
+                {"end_date": {"$gte": month_start.isoformat(), "$lte": month_end.isoformat()}},
+                {
+                    "$and": [
+                        {"start_date": {"$lte": month_start.isoformat()}},
+                        {"end_date": {"$gte": month_end.isoformat()}}
+                    ]
+                }
+            ]
+        }).to_list(length=None)
+        
+        # Map each employee's leave days within the month to whether it is a half day
+        employee_leave_days = {}
+        for leave in approved_leaves:
+            start_date = leave["start_date"]
+            end_date = leave["end_date"]
+            if isinstance(start_date, str):
+                start_date = datetime.fromisoformat(start_date).date()
+            if isinstance(end_date, str):
+                end_date = datetime.fromisoformat(end_date).date()
+            
+            leave_days = employee_leave_days.setdefault(leave["employee_id"], {})
+            current_day = max(start_date, month_start)
+            while current_day <= min(end_date, month_end):
+                is_half_day = leave.get("half_day", False) and start_date == end_date == current_day
+                # The first matching leave wins, as before
+                leave_days.setdefault(current_day, is_half_day)
+                current_day += timedelta(days=1)
+        
+        # Load every existing (employee_id, date) key for the month in one query
+        days_in_month = (month_end - month_start).days + 1
+        month_days = [month_start + timedelta(days=day_offset) for day_offset in range(days_in_month)]
+        employee_ids = [employee["employee_id"] for employee in employees]
+        
+        existing_records = await db.attendance.find(
+            {
+                "employee_id": {"$in": employee_ids},
+                "date": {"$gte": month_start.isoformat(), "$lte": month_end.isoformat()}
+            },
+            {"_id": 0, "employee_id": 1, "date": 1}
+        ).to_list(length=None)
+        existing_keys = {(record["employee_id"], str(record["date"])[:10]) for record in existing_records}
+        
+        # Build the missing records in memory
+        now_iso = datetime.now(timezone.utc).isoformat()
+        missing_records = []
+        for employee in employees:
+            employee_id = employee["employee_id"]
+            leave_days = employee_leave_days.get(employee_id, {})
+            year_calendar = await working_calendar.get(employee.get("company_id"), year)
+            
+            for current_date in month_days:
+                if (employee_id, current_date.isoformat()) in existing_keys:
+                    continue  # Skip if already exists
+                
+                day_status = year_calendar.status(current_date)
+                
+                if day_status != WORKING_DAY:
+                    attendance_status = "holiday" if day_status == HOLIDAY_DAY else "weekend"
+                    working_hours = 0.0
+                elif current_date in leave_days:
+                    half_day_leave = leave_days[current_date]
+                    attendance_status = "half-day" if half_day_leave else "leave"
+                    working_hours = 4.0 if half_day_leave else 0.0
+                else:
+                    attendance_status = "present"
+                    working_hours = 8.0
+                
+                missing_records.append(build_attendance_record(employee_id, current_date, attendance_status, working_hours, now_iso))
+        
+        # Write in chunked, unordered batches; the unique (employee_id, date) index
+        # turns records inserted concurrently by another request into skipped duplicates
+        started = time.monotonic()
+        generated_count = 0
+        duplicate_count = 0
+        counters = DashboardCounterBatch()
+        companies = {employee["employee_id"]: employee.get("company_id") for employee in employees}
+        total_batches = (len(missing_records) + ATTENDANCE_INSERT_BATCH_SIZE - 1) // ATTENDANCE_INSERT_BATCH_SIZE
+        for batch_number, batch_start in enumerate(range(0, len(missing_records), ATTENDANCE_INSERT_BATCH_SIZE), start=1):
+            batch = missing_records[batch_start:batch_start + ATTENDANCE_INSERT_BATCH_SIZE]
+            inserted, duplicates = await insert_attendance_batch(batch, counters, companies)
+            generated_count += inserted
+            duplicate_count += duplicates
+            logger.info(
+                f"Attendance generation {month:02d}/{year}: batch {batch_number}/{total_batches}, "
+                f"{generated_count}/{len(missing_records)} records written"
+            )
+        elapsed_seconds = time.monotonic() - started
+        
+        await counters.flush()
+        if generated_count:
+            await invalidate_rating_snapshots(None, month_start.isoformat())
+        
+        return {
+            "message": f"Successfully generated {generated_count} attendance records",
+            "month": month,
+            "year": year,
+            "employees_processed": len(employees),
+            "generated_count": generated_count,
+            "existing_skipped": len(existing_keys),
+            "duplicates_skipped": duplicate_count,
+            "batches": total_batches,
+            "elapsed_seconds": round(elapsed_seconds, 3),
+            "records_per_second": round(generated_count / elapsed_seconds, 1) if elapsed_seconds > 0 else generated_count
+        }
+    except Exception as e:
+        logging.error(f"Error generating attendance: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate attendance: {str(e)}"
+        )
+
+
+
+# Year attendance generation runs as a resumable background job. Progress and the
+# last fully written date are checkpointed in attendance_generation_jobs so a job
+# interrupted by a restart picks up where it stopped. A process runs a job only
+# while it holds the job's lease, renewed at every checkpoint, so with several
+# workers or during a rolling deploy a job is never run twice at once.
+ATTENDANCE_JOB_LEASE_SECONDS = int(os.environ.get('ATTENDANCE_JOB_LEASE_SECONDS', 120))
+ATTENDANCE_JOB_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+attendance_year_tasks: Dict[str, asyncio.Task] = {}
+
+def attendance_job_lease_expiry() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=ATTENDANCE_JOB_LEASE_SECONDS)
+
+async def claim_attendance_year_job(job_id: str) -> Optional[dict]:
+    """Take the job's lease if nobody else holds a live one; returns the job, or None when not claimed"""
+    return await db.attendance_generation_jobs.find_one_and_update(
+        {
+            "id": job_id,
+            "status": {"$in": ["queued", "running"]},
+            "$or": [
+                {"lease_owner": {"$in": [None, ATTENDANCE_JOB_OWNER]}},
+                {"lease_expires_at": {"$lt": datetime.now(timezone.utc)}}
+            ]
+        },
+        {"$set": {"lease_owner": ATTENDANCE_JOB_OWNER, "lease_expires_at": attendance_job_lease_expiry()}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def checkpoint_attendance_year_job(job_id: str, **fields) -> bool:
+    """Save progress and renew the lease; False when another process has taken the job over"""
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    fields["lease_expires_at"] = attendance_job_lease_expiry()
+    result = await db.attendance_generation_jobs.update_one(
+        {"id": job_id, "lease_owner": ATTENDANCE_JOB_OWNER},
+        {"$set": fields}
+    )
+    return result.matched_count == 1
+
+async def release_attendance_year_job(job_id: str, **fields):
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    update = {"$set": {**fields, "lease_owner": None, "lease_expires_at": None}}
+    if fields.get("status") not in (None, "queued", "running"):
+        # A finished job frees its year for the next one
+        update["$unset"] = {"active_year": ""}
+    await db.attendance_generation_jobs.update_one(
+        {"id": job_id, "lease_owner": ATTENDANCE_JOB_OWNER},
+        update
+    )
+
+def iter_year_attendance_records(employee_ids: List[str], day: date, timestamp: str):
+    """Yield the present-with-8-hours record for every employee on a working day"""
+    for employee_id in employee_ids:
+        yield build_attendance_record(employee_id, day, "present", 8.0, timestamp)
+
+async def update_attendance_year_job(job_id: str, **fields):
+    fields["updated_at"] = datetime.now(timezone.utc).isoformat()
+    await db.attendance_generation_jobs.update_one({"id": job_id}, {"$set": fields})
+
+async def run_attendance_year_job(job_id: str):
+    """Generate a year's attendance day by day, checkpointing after every completed date"""
+    try:
+        job = await claim_attendance_year_job(job_id)
+        if not job:
+            # Finished, or running in a process whose lease is still live
+            return
+        
+        start_date = date.fromisoformat(job["start_date"])
+        end_date = date.fromisoformat(job["end_date"])
+        resume_from = start_date
+        if job.get("checkpoint_date"):
+            resume_from = date.fromisoformat(job["checkpoint_date"]) + timedelta(days=1)
+        
+        employees = await db.employees.find(
+            {"status": "active"}, {"_id": 0, "employee_id": 1, "company_id": 1}
+        ).to_list(length=None)
+        
+        # Working days differ per company, so group employees by company
+        company_employee_ids: Dict[Optional[str], List[str]] = {}
+        for employee in employees:
+            if employee.get("employee_id"):
+                company_employee_ids.setdefault(employee.get("company_id"), []).append(employee["employee_id"])
+        employee_count = sum(len(ids) for ids in company_employee_ids.values())
+        
+        # Clear the remaining period, including anything half-written before an interruption
+        remaining_period = {"date": {"$gte": resume_from.isoformat(), "$lte": end_date.isoformat()}}
+        counters = await attendance_removal_counters(remaining_period)
+        delete_result = await db.attendance.delete_many(remaining_period)
+        await counters.flush()
+        companies = {
+            employee_id: company_id
+            for company_id, employee_ids in company_employee_ids.items()
+            for employee_id in employee_ids
+        }
+        logger.info(f"Attendance year job {job_id}: deleted {delete_result.deleted_count} existing records from {resume_from.isoformat()}")
+        
+        await checkpoint_attendance_year_job(
+            job_id,
+            status="running",
+            employees_processed=employee_count,
+            deleted_existing=job.get("deleted_existing", 0) + delete_result.deleted_count
+        )
+        
+        generated_count = job.get("generated_count", 0)
+        days_completed = (resume_from - start_date).days
+        started = time.monotonic()
+        written_this_run = 0
+        
+        current_date = resume_from
+        while current_date <= end_date:
+            now_iso = datetime.now(timezone.utc).isoformat()
+            batch = []
+            for company_id, employee_ids in company_employee_ids.items():
+                if not await working_calendar.is_working_day(company_id, current_date):
+                    continue
+                for record in iter_year_attendance_records(employee_ids, current_date, now_iso):
+                    batch.append(record)
+                    if len(batch) >= ATTENDANCE_INSERT_BATCH_SIZE:
+                        inserted, _ = await insert_attendance_batch(batch, counters, companies)
+                        generated_count += inserted
+                        written_this_run += inserted
+                        batch = []
+            if batch:
+                inserted, _ = await insert_attendance_batch(batch, counters, companies)
+                generated_count += inserted
+                written_this_run += inserted
+            
+            days_completed += 1
+            await counters.flush()
+            elapsed_seconds = time.monotonic() - started
+            still_owned = await checkpoint_attendance_year_job(
+                job_id,
+                checkpoint_date=current_date.isoformat(),
+                days_completed=days_completed,
+                generated_count=generated_count,
+                records_per_second=round(written_this_run / elapsed_seconds, 1) if elapsed_seconds > 0 else None
+            )
+            if not still_owned:
+                logger.warning(f"Attendance year job {job_id}: lease lost to another process, stopping here")
+                return
+            current_date += timedelta(days=1)
+        
+        await counters.flush()
+        await invalidate_rating_snapshots(None, start_date.isoformat())
+        
+        await release_attendance_year_job(
+            job_id,
+            status="completed",
+            completed_at=datetime.now(timezone.utc).isoformat()
+        )
+        logger.info(f"Attendance year job {job_id}: generated {generated_count} records for {job['year']}")
+    
+    except asyncio.CancelledError:
+        # Shutdown: leave the job as running; the shutdown hook releases the lease
+        # so the next process resumes it from the checkpoint
+        raise
+    except Exception as e:
+        logging.error(f"Error generating year attendance (job {job_id}): {str(e)}")
+        await release_attendance_year_job(job_id, status="failed", error=str(e))
+    finally:
+        attendance_year_tasks.pop(job_id, None)
+
+def start_attendance_year_job(job_id: str):
+    if job_id not in attendance_year_tasks:
+        attendance_year_tasks[job_id] = asyncio.create_task(run_attendance_year_job(job_id))
+
+async def resume_attendance_year_jobs():
+    """Restart unfinished year generation jobs that no live process holds"""
+    jobs = await db.attendance_generation_jobs.find(
+        {
+            "status": {"$in": ["queued", "running"]},
+            "$or": [
+                {"lease_owner": None},
+                {"lease_expires_at": {"$lt": datetime.now(timezone.utc)}}
+            ]
+        },
+        {"_id": 0, "id": 1}
+    ).to_list(length=None)
+    for job in jobs:
+        start_attendance_year_job(job["id"])
+    return len(jobs)
+
+@router.on_event("shutdown")
+async def cancel_attendance_year_jobs():
+    tasks = list(attendance_year_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Hand the interrupted jobs over right away instead of waiting for the leases to expire
+    await db.attendance_generation_jobs.update_many(
+        {"lease_owner": ATTENDANCE_JOB_OWNER},
+        {"$set": {"lease_owner": None, "lease_expires_at": None}}
+    )
+
+async def find_active_attendance_year_job(year: int) -> Optional[dict]:
+    return await db.attendance_generation_jobs.find_one({"active_year": year}, {"_id": 0})
+
+def serialize_attendance_year_job(job: dict) -> dict:
+    total_days = job.get("total_days") or 0
+    job["progress_percent"] = round(job.get("days_completed", 0) * 100 / total_days, 1) if total_days else 100.0
+    return job
+
+@router.post("/attendance/generate-year")
+async def generate_attendance_for_year(
+    year: int = 2025,
+    resume: bool = True,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """
+    Admin generates attendance for all active employees for entire year (Jan 1 to today).
+    Marks all working days (excluding weekends and holidays) as present with 8 hours.
+    Runs in the background; poll /attendance/generate-year/{job_id} for progress.
+    With resume, an unfinished job for the same year is continued instead of starting over.
+    """
+    try:
+        # Date range: Jan 1 to today
+        start_date = date(year, 1, 1)
+        end_date = date.today()
+        
+        # If end_date is before start_date (future year), return error
+        if end_date < start_date:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cannot generate attendance for future year {year}"
+            )
+        
+        employee_count = await db.employees.count_documents({"status": "active"})
+        if not employee_count:
+            return {
+                "message": "No active employees found",
+                "generated_count": 0,
+                "year": year
+            }
+        
+        unfinished = await db.attendance_generation_jobs.find_one(
+            {"year": year, "status": {"$in": ["queued", "running", "failed"]}},
+            {"_id": 0},
+            sort=[("created_at", -1)]
+        )
+        if unfinished and unfinished["status"] == "failed" and resume:
+            try:
+                await update_attendance_year_job(unfinished["id"], status="queued", error=None, active_year=year)
+                unfinished["status"] = "queued"
+            except DuplicateKeyError:
+                # Another request started or revived a job for this year first
+                unfinished = await find_active_attendance_year_job(year)
+        if unfinished and unfinished["status"] != "failed":
+            start_attendance_year_job(unfinished["id"])
+            return {
+                "message": f"Resumed attendance generation for year {year}",
+                "job": serialize_attendance_year_job(unfinished)
+            }
+        
+        now_iso = datetime.now(timezone.utc).isoformat()
+        job = {
+            "id": str(uuid.uuid4()),
+            "year": year,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "status": "queued",
+            "checkpoint_date": None,
+            "total_days": (end_date - start_date).days + 1,
+            "days_completed": 0,
+            "generated_count": 0,
+            "deleted_existing": 0,
+            "employees_processed": employee_count,
+            "records_per_second": None,
+            "error": None,
+            "created_by": current_user.username,
+            "created_at": now_iso,
+            "updated_at": now_iso,
+            "completed_at": None,
+            # Unique while the job is queued or running, so a year has one active job
+            "active_year": year
+        }
+        try:
+            await db.attendance_generation_jobs.insert_one(job.copy())
+        except DuplicateKeyError:
+            active = await find_active_attendance_year_job(year)
+            if not active:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Attendance generation for year {year} is already being started"
+                )
+            return {
+                "message": f"Attendance generation for year {year} is already in progress",
+                "job": serialize_attendance_year_job(active)
+            }
+        start_attendance_year_job(job["id"])
+        
+        return {
+            "message": f"Started attendance generation for year {year}",
+            "job": serialize_attendance_year_job(job)
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error generating year attendance: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate year attendance: {str(e)}"
+        )
+
+@router.get("/attendance/generate-year/{job_id}")
+async def get_attendance_year_job(
+    job_id: str,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Progress and status of a year attendance generation job"""
+    job = await db.attendance_generation_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Attendance generation job not found")
+    return serialize_attendance_year_job(job)
+
+
+
+@router.post("/late-arrivals")
+async def record_late_arrival(
+    late_data: LateArrivalCreate,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Admin records a late arrival"""
+    try:
+        # Parse times
+        actual_parts = late_data.actual_check_in.split(':')
+        actual_minutes = int(actual_parts[0]) * 60 + int(actual_parts[1])
+        
+        # Expected check-in: 8:30 AM = 510 minutes
+        expected_minutes = 8 * 60 + 30  # 510 minutes
+        
+        # Calculate late minutes
+        late_minutes = actual_minutes - expected_minutes
+        
+        if late_minutes <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Actual check-in time is not late. Employee arrived on time or early."
+            )
+        
+        late_arrival = LateArrival(
+            employee_id=late_data.employee_id,
+            date=late_data.date,
+            actual_check_in=late_data.actual_check_in,
+            late_minutes=late_minutes,
+            reason=late_data.reason,
+            recorded_by=current_user.username
+        )
+        
+        late_dict = prepare_for_mongo(late_arrival.dict())
+        await db.late_arrivals.insert_one(late_dict)
+        
+        # Get employee details for notification
+        employee = await db.employees.find_one({"employee_id": late_data.employee_id})
+        employee_name = employee.get("name", late_data.employee_id) if employee else late_data.employee_id
+        
+        await increment_dashboard_counters(
+            employee.get("company_id") if employee else None,
+            {f"late_arrivals_by_date.{late_dict['date']}": 1}
+        )
+        await invalidate_rating_snapshots(late_data.employee_id, late_dict['date'])
+        
+        # Create notification for employee
+        notification = Notification(
+            recipient_role="employee",
+            recipient_id=late_data.employee_id,
+            title="Late Arrival Recorded",
+            message=f"Your late arrival on {late_data.date} at {late_data.actual_check_in} has been recorded ({late_minutes} minutes late).",
+            notification_type="warning"
+        )
+        notification_dict = prepare_for_mongo(notification.dict())
+        await db.notifications.insert_one(notification_dict)
+        
+        # Send real-time notification
+        await send_realtime_notification(notification_dict)
+        
+        return {
+            "message": f"Late arrival recorded for {employee_name}",
+            "late_minutes": late_minutes,
+            "late_arrival": prepare_from_mongo(late_dict)
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error recording late arrival: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to record late arrival: {str(e)}"
+        )
+
+@router.get("/late-arrivals")
+async def get_late_arrivals(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    employee_id: Optional[str] = None,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Get late arrival records"""
+    try:
+        # Default to current month if not specified
+        if not month or not year:
+            now = datetime.now()
+            month = now.month
+            year = now.year
+        
+        # Get date range for the month
+        month_start = date(year, month, 1)
+        if month == 12:
+            month_end = date(year + 1, 1, 1) - timedelta(days=1)
+        else:
+            month_end = date(year, month + 1, 1) - timedelta(days=1)
+        
+        # Build query
+        query = {
+            "date": {
+                "$gte": month_start.isoformat(),
+                "$lte": month_end.isoformat()
+            }
+        }
+        
+        if employee_id:
+            query["employee_id"] = employee_id
+        
+        # Fetch late arrivals
+        late_arrivals = await db.late_arrivals.find(query).to_list(length=None)
+        
+        # Enrich with employee details
+        for record in late_arrivals:
+            employee = await db.employees.find_one({"employee_id": record["employee_id"]})
+            if employee:
+                record["employee_name"] = employee.get("name", "Unknown")
+                record["department"] = employee.get("department", "N/A")
+        
+        return [prepare_from_mongo(record) for record in late_arrivals]
+    except Exception as e:
+        logging.error(f"Error fetching late arrivals: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch late arrivals"
+        )
+
+@router.delete("/late-arrivals/{late_id}")
+async def delete_late_arrival(
+    late_id: str,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Delete a late arrival record"""
+    try:
+        late_arrival = await db.late_arrivals.find_one_and_delete({"id": late_id})
+        if not late_arrival:
+            raise HTTPException(status_code=404, detail="Late arrival record not found")
+        
+        await increment_employee_dashboard_counters(
+            late_arrival["employee_id"],
+            {f"late_arrivals_by_date.{late_arrival['date']}": -1}
+        )
+        await invalidate_rating_snapshots(late_arrival["employee_id"], late_arrival['date'])
+        
+        return {"message": "Late arrival record deleted successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error deleting late arrival: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete late arrival record"
+        )
+
+@router.get("/late-arrivals/my-late-arrivals")
+async def get_my_late_arrivals(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Employee view their own late arrival records"""
+    try:
+        # Default to current month if not specified
+        if not month or not year:
+            now = datetime.now()
+            month = now.month
+            year = now.year
+        
+        # Get date range for the month
+        month_start = date(year, month, 1)
+        if month == 12:
+            month_end = date(year + 1, 1, 1) - timedelta(days=1)
+        else:
+            month_end = date(year, month + 1, 1) - timedelta(days=1)
+        
+        # Build query for current employee
+        query = {
+            "employee_id": current_user.username,
+            "date": {
+                "$gte": month_start.isoformat(),
+                "$lte": month_end.isoformat()
+            }
+        }
+        
+        # Fetch late arrivals
+        late_arrivals = await db.late_arrivals.find(query).to_list(length=None)
+        
+        return [prepare_from_mongo(record) for record in late_arrivals]
+    except Exception as e:
+        logging.error(f"Error fetching my late arrivals: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch late arrivals"
+        )
+    except Exception as e:
+        logging.error(f"Error deleting late arrival: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete late arrival record"
+        )
+
+@router.get("/attendance/monthly-summary")
+async def get_monthly_attendance_summary(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    employee_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Get monthly attendance summary including regular hours and OT"""
+    try:
+        # Default to current month if not specified
+        if not month or not year:
+            now = datetime.now()
+            month = now.month
+            year = now.year
+        
+        # Determine employee_id
+        target_employee_id = employee_id if employee_id else current_user.username
+        
+        # Get date range for the month
+        month_start = date(year, month, 1)
+        if month == 12:
+            month_end = date(year + 1, 1, 1) - timedelta(days=1)
+        else:
+            month_end = date(year, month + 1, 1) - timedelta(days=1)
+        
+        # Fetch attendance records
+        attendance = await db.attendance.find({
+            "employee_id": target_employee_id,
+            "date": {
+                "$gte": month_start.isoformat(),
+                "$lte": month_end.isoformat()
+            }
+        }).to_list(length=None)
+        
+        # Calculate regular working hours
+        total_working_hours = 0
+        present_days = 0
+        leave_days = 0
+        half_days = 0
+        
+        for record in attendance:
+            status = record.get("status", "")
+            if status == "present":
+                present_days += 1
+                total_working_hours += record.get("working_hours", 0)
+            elif status == "leave":
+                leave_days += 1
+            elif status == "half-day":
+                half_days += 1
+                total_working_hours += record.get("working_hours", 0)
+        
+        # Fetch approved OT hours for the month
+        month_str = f"{year}-{str(month).zfill(2)}"
+        ot_logs = await db.ot_logs.find({
+            "employee_id": target_employee_id,
+            "status": "approved",
+            "date": {"$regex": f"^{month_str}"}
+        }).to_list(length=None)
+        
+        total_ot_hours = sum(log.get("ot_hours", 0) for log in ot_logs)
+        
+        # Calculate total hours (regular + OT)
+        total_hours = total_working_hours + total_ot_hours
+        
+        return {
+            "month": month,
+            "year": year,
+            "employee_id": target_employee_id,
+            "present_days": present_days,
+            "leave_days": leave_days,
+            "half_days": half_days,
+            "regular_working_hours": round(total_working_hours, 2),
+            "ot_hours": round(total_ot_hours, 2),
+            "total_hours": round(total_hours, 2)
+        }
+    except Exception as e:
+        logging.error(f"Error fetching monthly summary: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch monthly summary"
+        )
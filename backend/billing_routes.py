@@ -0,0 +1,1121 @@
+"""
+Billing Routes
+Subscription plans, public signup, Razorpay subscriptions, upgrades and webhooks
+
+razorpay is imported on first use so workers that never bill do not load it.
+"""
+
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+
+from server import (
+    create_access_token, create_notification_helper, create_refresh_token,
+    CreateSubscriptionRequest, db, get_current_user, get_password_hash, PlanUpdate,
+    PublicSignup, RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET, RAZORPAY_WEBHOOK_SECRET, require_super_admin,
+    subscription_cache, User, VerifyPaymentRequest,
+)
+
+router = APIRouter(tags=["Billing"])
+
+razorpay_client = None
+
+def get_razorpay_client():
+    """Razorpay client, created on first use"""
+    global razorpay_client
+    if razorpay_client is None:
+        import razorpay
+        razorpay_client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+    return razorpay_client
+
+# ============================================================================
+# SUBSCRIPTION PLAN ENDPOINTS
+# ============================================================================
+
+@router.get("/plans/public")
+async def get_public_plans():
+    """Get all active subscription plans (public endpoint - no auth required)"""
+    plans = await db.subscription_plans.find(
+        {"is_active": True},
+        {"_id": 0}
+    ).sort("display_order", 1).to_list(length=None)
+    
+    return {"plans": plans}
+
+
+@router.get("/super-admin/plans")
+async def get_all_plans(current_user = Depends(require_super_admin)):
+    """Get all subscription plans for super admin"""
+    plans = await db.subscription_plans.find({}, {"_id": 0}).sort("display_order", 1).to_list(length=None)
+    
+    # Get subscriber count for each plan
+    for plan in plans:
+        subscriber_count = await db.companies.count_documents({
+            "subscription_info.plan_id": plan["plan_id"],
+            "status": "active"
+        })
+        plan["subscriber_count"] = subscriber_count
+    
+    return {"plans": plans}
+
+
+@router.get("/super-admin/plans/{plan_id}")
+async def get_plan(
+    plan_id: str,
+    current_user = Depends(require_super_admin)
+):
+    """Get plan details"""
+    plan = await db.subscription_plans.find_one({"plan_id": plan_id}, {"_id": 0})
+    
+    if not plan:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Plan not found"
+        )
+    
+    return plan
+
+
+@router.put("/super-admin/plans/{plan_id}")
+async def update_plan(
+    plan_id: str,
+    plan_data: PlanUpdate,
+    current_user = Depends(require_super_admin)
+):
+    """Update subscription plan"""
+    # Log what we receive
+    logging.info(f"Updating plan {plan_id}")
+    logging.info(f"Received plan_data: {plan_data}")
+    if plan_data.features:
+        logging.info(f"Features dict: {plan_data.features.model_dump()}")
+    
+    plan = await db.subscription_plans.find_one({"plan_id": plan_id})
+    
+    if not plan:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Plan not found"
+        )
+    
+    # Prepare update data
+    update_data = {}
+    if plan_data.plan_name is not None:
+        update_data["plan_name"] = plan_data.plan_name
+    if plan_data.description is not None:
+        update_data["description"] = plan_data.description
+    if plan_data.price_per_user_monthly is not None:
+        update_data["price_per_user_monthly"] = plan_data.price_per_user_monthly
+    if plan_data.price_per_user_annual is not None:
+        update_data["price_per_user_annual"] = plan_data.price_per_user_annual
+    if plan_data.features is not None:
+        # Don't use .dict() - it adds default values for missing fields
+        # Instead, convert to dict and preserve only the provided fields
+        update_data["features"] = plan_data.features.model_dump(exclude_unset=False)
+    if plan_data.is_active is not None:
+        update_data["is_active"] = plan_data.is_active
+    
+    update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+    
+    if update_data:
+        await db.subscription_plans.update_one(
+            {"plan_id": plan_id},
+            {"$set": update_data}
+        )
+        # Plan features are embedded in every company snapshot on this plan
+        subscription_cache.invalidate()
+    
+    return {"message": "Plan updated successfully"}
+
+
+# ============================================================================
+# PUBLIC SIGNUP ENDPOINT
+# ============================================================================
+
+@router.post("/signup")
+async def public_signup(signup_data: PublicSignup):
+    """Public self-service signup endpoint"""
+    try:
+        # ----------------------------------------------------------------------
+        # Step 1: Prevent duplicate company or user
+        # ----------------------------------------------------------------------
+        existing_company = await db.companies.find_one({"contact_email": signup_data.contact_email})
+        if existing_company:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Company with this email already exists"
+            )
+ 
+        existing_user = await db.users.find_one({"email": signup_data.admin_email})
+        if existing_user:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="User with this email already exists"
+            )
+ 
+        # ----------------------------------------------------------------------
+        # Step 2: Validate selected plan
+        # ----------------------------------------------------------------------
+        plan = await db.subscription_plans.find_one({"plan_id": signup_data.plan_id}, {"_id": 0})
+        if not plan or not plan.get("is_active"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Selected plan not found or inactive"
+            )
+ 
+        # ----------------------------------------------------------------------
+        # Step 3: Compute plan and subscription parameters
+        # ----------------------------------------------------------------------
+        now = datetime.now(timezone.utc)
+        company_id = str(uuid.uuid4())
+ 
+        # Determine price based on billing cycle
+        billing_cycle = signup_data.billing_cycle.lower()
+        if billing_cycle not in ["monthly", "annual"]:
+            billing_cycle = "monthly"
+ 
+        amount = plan["price_per_user_annual"] if billing_cycle == "annual" else plan["price_per_user_monthly"]
+ 
+        # Trial logic
+        trial_days = plan.get("features", {}).get("trial_days", 0)
+        trial_ends_at = now + timedelta(days=trial_days) if trial_days > 0 else None
+ 
+        # Set billing dates
+        if billing_cycle == "annual":
+            next_billing_date = now + timedelta(days=365)
+        else:
+            next_billing_date = now + timedelta(days=30)
+ 
+        # If trial exists, next billing should start after trial
+        if trial_ends_at:
+            next_billing_date = trial_ends_at
+ 
+        # ----------------------------------------------------------------------
+        # Step 4: Create company record
+        # ----------------------------------------------------------------------
+        company = {
+            "company_id": company_id,
+            "company_name": signup_data.company_name,
+            "company_logo_url": None,
+            "contact_email": signup_data.contact_email,
+            "phone": signup_data.phone,
+            "address": None,
+            "industry": signup_data.industry,
+            "country": signup_data.country,
+            "admin_user_id": None,  # to be updated later
+            "settings": {
+                "working_days_config": {
+                    "sunday_off": True,
+                    "saturday_policy": "alternate",
+                    "week_start": "Monday"
+                },
+                "leave_policies": {
+                    "annual_leave": 15,
+                    "sick_leave": 10,
+                    "casual_leave": 8
+                },
+                "default_working_hours": {
+                    "start_time": "08:30",
+                    "end_time": "17:30",
+                    "total_hours": 9
+                }
+            },
+            "status": "active",
+            "subscription_info": {
+                "plan_id": plan["plan_id"],
+                "plan_name": plan["plan_name"],
+                "billing_cycle": billing_cycle,
+                "currency": plan.get("currency", "INR"),
+                "price_per_user_monthly": plan.get("price_per_user_monthly"),
+                "price_per_user_annual": plan.get("price_per_user_annual"),
+                "amount": amount,
+                "auto_renew": True,
+                "status": "trial" if trial_days > 0 else "active",
+                "start_date": now.isoformat(),
+                "trial_end_date": trial_ends_at.isoformat() if trial_ends_at else None,
+                "next_billing_date": next_billing_date.isoformat(),
+            },
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat()
+        }
+ 
+        await db.companies.insert_one(company)
+ 
+        # ----------------------------------------------------------------------
+        # Step 5: Create admin user
+        # ----------------------------------------------------------------------
+        user_id = str(uuid.uuid4())
+        username = signup_data.admin_email.split("@")[0] + "_" + company_id[:8]
+ 
+        admin_user = {
+            "id": user_id,
+            "username": username,
+            "email": signup_data.admin_email,
+            "role": "admin",
+            "company_id": company_id,
+            "employee_id": None,
+            "hashed_password": await get_password_hash(signup_data.password),
+            "pin": None,
+            "is_active": True,
+            "last_login": None,
+            "last_login_ip": None,
+            "last_login_device": None,
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat()
+        }
+ 
+        await db.users.insert_one(admin_user)
+ 
+        # Update company with admin reference
+        await db.companies.update_one(
+            {"company_id": company_id},
+            {"$set": {"admin_user_id": user_id}}
+        )
+ 
+        # ----------------------------------------------------------------------
+        # Step 6: Create tokens for immediate login
+        # ----------------------------------------------------------------------
+        access_token = create_access_token(
+            data={"sub": username, "role": "admin", "company_id": company_id}
+        )
+        refresh_token = create_refresh_token(
+            data={"sub": username, "role": "admin", "company_id": company_id}
+        )
+ 
+        # ----------------------------------------------------------------------
+        # Step 7: Return response
+        # ----------------------------------------------------------------------
+        return {
+            "message": "Account created successfully! Your free trial has started." if trial_days > 0 else "Account created successfully!",
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "token_type": "bearer",
+            "user": {
+                "id": user_id,
+                "username": username,
+                "email": signup_data.admin_email,
+                "role": "admin",
+                "company_id": company_id
+            },
+            "subscription_info": company["subscription_info"]
+        }
+ 
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error in public signup: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An error occurred during signup. Please try again."
+        )
+ 
+
+
+# ============================================================================
+# PAYMENT & SUBSCRIPTION ENDPOINTS
+# ============================================================================
+
+@router.post("/subscription/create")
+async def create_subscription(
+    request: CreateSubscriptionRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Create Razorpay subscription after trial period
+    Should be called when company wants to activate paid subscription
+    """
+    try:
+        # Fetch company
+        company = await db.companies.find_one({"company_id": request.company_id}, {"_id": 0})
+        if not company:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Company not found"
+            )
+        
+        # Verify user has access to this company
+        if current_user.role != "super_admin" and current_user.company_id != request.company_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+        
+        subscription_info = company.get("subscription_info", {})
+        plan_id = subscription_info.get("plan_id")
+        
+        # Get the plan details
+        plan = await db.subscription_plans.find_one({"plan_id": plan_id}, {"_id": 0})
+        if not plan:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Subscription plan not found"
+            )
+        
+        # Get the appropriate Razorpay plan ID
+        if request.billing_cycle == "annual":
+            razorpay_plan_id = plan.get("razorpay_plan_id_annual")
+            amount = plan["annual_price"]
+        else:
+            razorpay_plan_id = plan.get("razorpay_plan_id_monthly")
+            amount = plan["monthly_price"]
+        
+        if not razorpay_plan_id:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Razorpay plan not configured. Please contact support."
+            )
+        
+        # Create Razorpay subscription
+        subscription_data = {
+            "plan_id": razorpay_plan_id,
+            "customer_notify": 1,
+            "quantity": 1,
+            "total_count": 60 if request.billing_cycle == "monthly" else 5,  # 5 years for annual, 60 months for monthly
+            "notes": {
+                "company_id": request.company_id,
+                "company_name": company["company_name"]
+            }
+        }
+        
+        razorpay_subscription = get_razorpay_client().subscription.create(subscription_data)
+        
+        # Update company with Razorpay subscription info
+        now = datetime.now(timezone.utc)
+        next_billing_date = now + (timedelta(days=365) if request.billing_cycle == "annual" else timedelta(days=30))
+        
+        await db.companies.update_one(
+            {"company_id": request.company_id},
+            {
+                "$set": {
+                    "subscription_info.razorpay_subscription_id": razorpay_subscription["id"],
+                    "subscription_info.razorpay_plan_id": razorpay_plan_id,
+                    "subscription_info.status": "created",  # Will be updated to active after payment
+                    "subscription_info.billing_cycle": request.billing_cycle,
+                    "subscription_info.amount": amount,
+                    "subscription_info.next_billing_date": next_billing_date.isoformat(),
+                    "updated_at": now.isoformat()
+                }
+            }
+        )
+        subscription_cache.invalidate(request.company_id)
+        
+        return {
+            "subscription_id": razorpay_subscription["id"],
+            "razorpay_key": RAZORPAY_KEY_ID,
+            "amount": int(amount * 100),  # Convert to paise
+            "currency": plan["currency"],
+            "plan_name": plan["plan_name"],
+            "billing_cycle": request.billing_cycle
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error creating subscription: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.post("/subscription/verify-payment")
+async def verify_payment(
+    request: VerifyPaymentRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Verify Razorpay payment signature"""
+    from razorpay.errors import SignatureVerificationError
+    
+    try:
+        # Verify signature
+        params_dict = {
+            'razorpay_subscription_id': request.subscription_id,
+            'razorpay_payment_id': request.payment_id,
+            'razorpay_signature': request.signature
+        }
+        
+        get_razorpay_client().utility.verify_payment_signature(params_dict)
+        
+        # Find company with this subscription
+        company = await db.companies.find_one(
+            {"subscription_info.razorpay_subscription_id": request.subscription_id},
+            {"_id": 0}
+        )
+        
+        if not company:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Company not found for this subscription"
+            )
+        
+        # Update subscription status to active
+        now = datetime.now(timezone.utc)
+        await db.companies.update_one(
+            {"company_id": company["company_id"]},
+            {
+                "$set": {
+                    "subscription_info.status": "active",
+                    "subscription_info.last_payment_date": now.isoformat(),
+                    "status": "active",  # Also update company status
+                    "updated_at": now.isoformat()
+                }
+            }
+        )
+        await subscription_cache.refresh(company["company_id"])
+        
+        return {
+            "message": "Payment verified successfully",
+            "subscription_status": "active"
+        }
+        
+    except SignatureVerificationError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid payment signature"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error verifying payment: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.get("/subscription/status")
+async def get_subscription_status(current_user: User = Depends(get_current_user)):
+    """Get current subscription status for the user's company"""
+    try:
+        # Get company
+        company = await db.companies.find_one({"company_id": current_user.company_id}, {"_id": 0})
+        if not company:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Company not found"
+            )
+        
+        subscription_info = company.get("subscription_info", {})
+        
+        # Check if trial
+        trial_end_date = subscription_info.get("trial_end_date")
+        if trial_end_date:
+            trial_end = datetime.fromisoformat(trial_end_date)
+            now = datetime.now(timezone.utc)
+            
+            if now < trial_end:
+                days_left = (trial_end - now).days
+                return {
+                    "status": "trial",
+                    "trial_days_left": days_left,
+                    "trial_end_date": trial_end_date,
+                    "plan": subscription_info.get("plan_name") or subscription_info.get("plan", "Free Trial"),
+                    "requires_payment": False
+                }
+            else:
+                # Trial expired, requires payment
+                return {
+                    "status": "trial_expired",
+                    "trial_end_date": trial_end_date,
+                    "plan": subscription_info.get("plan_name") or subscription_info.get("plan", "Free Trial"),
+                    "requires_payment": True
+                }
+        
+        # Get subscription details
+        status_str = subscription_info.get("status", "unknown")
+        
+        return {
+            "status": status_str,
+            "subscription_id": subscription_info.get("razorpay_subscription_id"),
+            "current_period_end": subscription_info.get("next_billing_date"),
+            "next_billing_date": subscription_info.get("next_billing_date"),
+            "amount": subscription_info.get("amount"),
+            "billing_cycle": subscription_info.get("billing_cycle", "monthly"),
+            "auto_renew": subscription_info.get("auto_renew", True),
+            "plan": subscription_info.get("plan_name") or subscription_info.get("plan", "Unknown"),
+            "requires_payment": status_str in ["trial_expired", "expired", "payment_failed"]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting subscription status: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.get("/subscription/features")
+async def get_subscription_features(current_user: User = Depends(get_current_user)):
+    """Get subscription features for the current user's company"""
+    try:
+        # Get company subscription snapshot (plan resolved by plan_id or legacy slug)
+        subscription = await subscription_cache.get(current_user.company_id)
+        if not subscription:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Company not found"
+            )
+        
+        plan = subscription["plan"]
+        
+        # If still no plan found, return default free trial plan features
+        if not plan:
+            return {
+                "plan_name": "Free Trial",
+                "plan_slug": "free",
+                "features": {
+                    "employee_limit": 5,
+                    "admin_users_limit": 1,
+                    "employee_database": True,
+                    "payroll_processing_manual": True,
+                    "payroll_processing_automated": False,
+                    "payslip_generation": True,
+                    "attendance_tracking_basic": True,
+                    "attendance_tracking_advanced": False,
+                    "leave_management_basic": True,
+                    "leave_management_advanced": False,
+                    "salary_structure_management": False,
+                    "bank_advice_generation": False,
+                    "custom_salary_components": False,
+                    "bulk_employee_import": False,
+                    "compliance_reports_basic": False,
+                    "compliance_reports_full": False,
+                    "employee_portal": True,  # Free Trial HAS employee portal
+                    "loans_advances": False,
+                    "deductions_advanced": False,
+                    "event_management": False,
+                    "payroll_analytics": False,
+                    "multi_bank_accounts": False,
+                    "notifications": False,
+                    "dark_mode": False,
+                    "api_access": False,
+                    "white_labeling": False,
+                    "custom_integrations": False,
+                    "sso_security": False,
+                    "custom_reports": False,
+                    "audit_logs": False,
+                    "sla_guarantee": False,
+                    "support_level": "email"
+                }
+            }
+        
+        return {
+            "plan_name": plan.get("plan_name"),
+            "plan_slug": plan.get("slug"),
+            "features": plan.get("features", {})
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting subscription features: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.get("/subscription/upgrade-options")
+async def get_upgrade_options(current_user: User = Depends(get_current_user)):
+    """Get available upgrade options for current company"""
+    try:
+        # Get company
+        company = await db.companies.find_one({"company_id": current_user.company_id}, {"_id": 0})
+        if not company:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Company not found"
+            )
+        
+        subscription_info = company.get("subscription_info", {})
+        current_plan_id = subscription_info.get("plan_id")
+        
+        if not current_plan_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No active subscription found"
+            )
+        
+        # Get current plan
+        current_plan = await db.subscription_plans.find_one({"plan_id": current_plan_id}, {"_id": 0})
+        if not current_plan:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Current plan not found"
+            )
+        
+        current_display_order = current_plan.get("display_order", 0)
+        
+        # Get all plans with higher display_order (upgrades only, no downgrades)
+        upgrade_plans = await db.subscription_plans.find(
+            {
+                "display_order": {"$gt": current_display_order},
+                "is_active": True
+            },
+            {"_id": 0}
+        ).sort("display_order", 1).to_list(length=None)
+        
+        return {
+            "current_plan": current_plan,
+            "upgrade_options": upgrade_plans,
+            "billing_cycle": subscription_info.get("billing_cycle", "monthly")
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting upgrade options: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.post("/subscription/calculate-upgrade")
+async def calculate_upgrade_cost(
+    target_plan_id: str,
+    new_billing_cycle: Optional[str] = None,   # <-- keep this EXACT name
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Calculate cost for:
+      1) Upgrading to a higher plan (same billing cycle), OR
+      2) Switching billing cycle on the same plan (Monthly <-> Annual), OR
+      3) Upgrading plan AND switching billing cycle in one go.
+
+    Rules:
+      - Credit the unused remainder of the *current* period (monthly=30d, annual=365d).
+      - If switching to Annual *now*, charge: (annual_price - credit_remaining) * employees
+        and set next_billing_date_new = today + 365 days (full fresh year).
+      - If switching to Monthly from Annual, no immediate charge; the switch takes effect at renewal.
+    """
+    try:
+        # --- Load company & subscription info
+        company = await db.companies.find_one(
+            {"company_id": current_user.company_id}, {"_id": 0}
+        )
+        if not company:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Company not found")
+
+        subscription_info = company.get("subscription_info", {}) or {}
+        current_plan_id = subscription_info.get("plan_id")
+        current_cycle = subscription_info.get("billing_cycle", "monthly")
+        next_billing_date_str = subscription_info.get("next_billing_date")
+
+        if not current_plan_id or not next_billing_date_str:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid subscription information")
+
+        # --- Plans
+        current_plan = await db.subscription_plans.find_one({"plan_id": current_plan_id}, {"_id": 0})
+        target_plan  = await db.subscription_plans.find_one({"plan_id": target_plan_id}, {"_id": 0})
+        if not current_plan or not target_plan:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Plan not found")
+
+        # --- Guard against downgrade by display_order
+        if target_plan.get("display_order", 0) < current_plan.get("display_order", 0):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot downgrade plans")
+
+        # --- Employees
+        employee_count = await db.employees.count_documents({
+            "company_id": current_user.company_id,
+            "status": "active"
+        })
+
+        # --- Parse dates
+        nxt_str = next_billing_date_str.replace("Z", "+00:00")
+        try:
+            next_billing_date = datetime.fromisoformat(nxt_str)
+        except Exception:
+            # try without tz then force UTC
+            base = next_billing_date_str.split("+")[0].split("Z")[0]
+            next_billing_date = datetime.fromisoformat(base).replace(tzinfo=timezone.utc)
+        if next_billing_date.tzinfo is None:
+            next_billing_date = next_billing_date.replace(tzinfo=timezone.utc)
+
+        today = datetime.now(timezone.utc)
+        days_remaining = max((next_billing_date - today).days, 0)
+
+        # --- helpers
+        def price(plan, cycle):
+            return plan.get("price_per_user_annual", 0) if cycle == "annual" else plan.get("price_per_user_monthly", 0)
+
+        def total_days_for(cycle):
+            return 365 if cycle == "annual" else 30
+
+        # Effective target cycle (what user picked on UI, else current)
+        effective_cycle = (new_billing_cycle or current_cycle).lower()
+        if effective_cycle not in ("monthly", "annual"):
+            effective_cycle = current_cycle  # fallback safety
+
+        # Scenario flags
+        same_plan = (target_plan_id == current_plan_id)
+        cycle_change = (effective_cycle != current_cycle)
+
+        # --- CREDIT for unused portion of the *current* period
+        current_period_days = total_days_for(current_cycle)
+        current_price_per_user = price(current_plan, current_cycle)
+        credit_per_user = 0.0
+        if days_remaining > 0 and current_price_per_user > 0:
+            credit_per_user = (current_price_per_user / current_period_days) * days_remaining
+
+        # --- TARGET pricing
+        target_price_per_user = price(target_plan if not same_plan else current_plan, effective_cycle)
+
+        # --- Compute charge
+        response_type = "plan_upgrade"
+        message = None
+        new_next_billing_date = None
+        pro_rated_amount_per_user = 0.0
+        total_upgrade_cost = 0.0
+        price_difference_per_user = 0.0
+
+        if same_plan and cycle_change:
+            # (A) Switching billing cycle only
+            if current_cycle == "monthly" and effective_cycle == "annual":
+                # Charge annual minus remaining monthly credit; start a fresh 1-year term from today
+                response_type = "billing_cycle_upgrade"
+                price_difference_per_user = target_price_per_user - credit_per_user
+                pro_rated_amount_per_user = max(price_difference_per_user, 0.0)  # never negative charge
+                total_upgrade_cost = round(pro_rated_amount_per_user * employee_count, 2)
+                new_next_billing_date = (today + timedelta(days=365)).isoformat()
+
+                message = "Switching to annual now. Unused monthly time is credited; new annual cycle starts today."
+            elif current_cycle == "annual" and effective_cycle == "monthly":
+                # Make change at renewal; no immediate charge
+                response_type = "billing_cycle_downgrade_scheduled"
+                pro_rated_amount_per_user = 0.0
+                total_upgrade_cost = 0.0
+                price_difference_per_user = 0.0
+                new_next_billing_date = next_billing_date_str
+                message = "Switch to monthly will take effect at renewal. No immediate charge."
+            else:
+                # Unknown combination, fall back safe
+                response_type = "billing_cycle_change"
+                pro_rated_amount_per_user = 0.0
+                total_upgrade_cost = 0.0
+                new_next_billing_date = next_billing_date_str
+                message = "Billing cycle change processed."
+
+        else:
+            # (B) Upgrading plan (with or without cycle change)
+            if not cycle_change:
+                # Same cycle plan upgrade: prorate difference for remaining days
+                current_target_price = price(target_plan, current_cycle)
+                price_difference_per_user = current_target_price - current_price_per_user
+                per_day_diff = price_difference_per_user / total_days_for(current_cycle)
+                pro_rated_amount_per_user = max(per_day_diff * days_remaining, 0.0)
+                total_upgrade_cost = round(pro_rated_amount_per_user * employee_count, 2)
+                new_next_billing_date = next_billing_date_str
+                message = "Plan upgraded. Pro-rated difference charged for remaining days of current period."
+            else:
+                # Plan upgrade + cycle switch
+                if current_cycle == "monthly" and effective_cycle == "annual":
+                    # Credit remaining monthly; charge new annual for target plan
+                    annual_target_per_user = price(target_plan, "annual")
+                    price_difference_per_user = annual_target_per_user - credit_per_user
+                    pro_rated_amount_per_user = max(price_difference_per_user, 0.0)
+                    total_upgrade_cost = round(pro_rated_amount_per_user * employee_count, 2)
+                    new_next_billing_date = (today + timedelta(days=365)).isoformat()
+                    message = "Plan upgraded and switched to annual now. Credit applied; new annual cycle starts today."
+                elif current_cycle == "annual" and effective_cycle == "monthly":
+                    # Defer cycle change; charge only plan difference for remaining annual days (if any)
+                    current_target_price = price(target_plan, "annual")
+                    price_difference_per_user = current_target_price - current_price_per_user
+                    per_day_diff = price_difference_per_user / total_days_for("annual")
+                    pro_rated_amount_per_user = max(per_day_diff * days_remaining, 0.0)
+                    total_upgrade_cost = round(pro_rated_amount_per_user * employee_count, 2)
+                    new_next_billing_date = next_billing_date_str
+                    response_type = "plan_upgrade_with_cycle_downgrade_scheduled"
+                    message = "Plan upgraded now. Switch to monthly will take effect at renewal."
+
+        return {
+            "type": response_type,
+            "current_plan": {
+                "plan_id": current_plan.get("plan_id"),
+                "plan_name": current_plan.get("plan_name"),
+            },
+            "target_plan": {
+                "plan_id": target_plan.get("plan_id") if not same_plan else current_plan.get("plan_id"),
+                "plan_name": target_plan.get("plan_name") if not same_plan else current_plan.get("plan_name"),
+                "price_per_user": round(target_price_per_user, 2),
+            },
+            "employee_count": employee_count,
+            "current_billing_cycle": current_cycle,
+            "effective_billing_cycle": effective_cycle,
+            "days_remaining": days_remaining,
+            "credit_per_user": round(credit_per_user, 2),
+            "price_difference_per_user": round(price_difference_per_user, 2),
+            "pro_rated_amount_per_user": round(pro_rated_amount_per_user, 2),
+            "total_upgrade_cost": total_upgrade_cost,
+            "next_billing_date": next_billing_date_str,
+            "next_billing_date_new": new_next_billing_date,  # may be None if unchanged
+            "message": message,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error calculating upgrade cost: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@router.post("/subscription/upgrade")
+async def upgrade_subscription(
+    target_plan_id: str,
+    payment_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Process subscription upgrade after payment"""
+    try:
+        # Get company
+        company = await db.companies.find_one({"company_id": current_user.company_id}, {"_id": 0})
+        if not company:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Company not found"
+            )
+        
+        subscription_info = company.get("subscription_info", {})
+        current_plan_id = subscription_info.get("plan_id")
+        
+        # Get target plan
+        target_plan = await db.subscription_plans.find_one({"plan_id": target_plan_id}, {"_id": 0})
+        if not target_plan:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Target plan not found"
+            )
+        
+        # Verify payment with Razorpay
+        try:
+            payment = get_razorpay_client().payment.fetch(payment_id)
+            if payment['status'] != 'captured':
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Payment not captured"
+                )
+        except Exception as e:
+            logging.error(f"Error verifying payment: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Payment verification failed"
+            )
+        
+        # Update subscription immediately (effective immediately)
+        update_data = {
+            "subscription_info.plan_id": target_plan_id,
+            "subscription_info.plan_slug": target_plan.get("slug"),
+            "subscription_info.plan_name": target_plan.get("plan_name"),
+            "subscription_info.last_payment_date": datetime.now(timezone.utc).isoformat(),
+            "subscription_info.last_upgrade_date": datetime.now(timezone.utc).isoformat(),
+            "subscription_info.last_payment_id": payment_id,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        
+        await db.companies.update_one(
+            {"company_id": current_user.company_id},
+            {"$set": update_data}
+        )
+        await subscription_cache.refresh(current_user.company_id)
+        
+        logging.info(f"Upgraded company {current_user.company_id} from {current_plan_id} to {target_plan_id}")
+        
+        return {
+            "message": "Subscription upgraded successfully",
+            "new_plan": {
+                "plan_id": target_plan_id,
+                "plan_name": target_plan.get("plan_name"),
+                "plan_slug": target_plan.get("slug")
+            }
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error upgrading subscription: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.post("/webhooks/razorpay")
+async def razorpay_webhook(request: Request):
+    """Handle Razorpay webhook events"""
+    from razorpay.errors import SignatureVerificationError
+    
+    try:
+        # Get the webhook payload and signature
+        payload = await request.body()
+        signature = request.headers.get("X-Razorpay-Signature", "")
+        
+        # Verify webhook signature
+        get_razorpay_client().utility.verify_webhook_signature(
+            payload.decode("utf-8"),
+            signature,
+            RAZORPAY_WEBHOOK_SECRET
+        )
+        
+        # Parse the payload
+        event_data = json.loads(payload)
+        event = event_data.get("event")
+        payload_data = event_data.get("payload", {})
+        subscription_entity = payload_data.get("subscription", {}).get("entity", {})
+        payment_entity = payload_data.get("payment", {}).get("entity", {})
+        
+        subscription_id = subscription_entity.get("id") or payment_entity.get("subscription_id")
+        
+        logging.info(f"Received Razorpay webhook event: {event} for subscription: {subscription_id}")
+        
+        # Find company with this subscription
+        company = await db.companies.find_one(
+            {"subscription_info.razorpay_subscription_id": subscription_id},
+            {"_id": 0}
+        )
+        
+        if not company:
+            logging.warning(f"Company not found for subscription: {subscription_id}")
+            return {"status": "ignored"}
+        
+        now = datetime.now(timezone.utc)
+        
+        # Handle different webhook events
+        if event == "subscription.activated":
+            # Subscription activated after payment
+            await db.companies.update_one(
+                {"company_id": company["company_id"]},
+                {
+                    "$set": {
+                        "subscription_info.status": "active",
+                        "subscription_info.last_payment_date": now.isoformat(),
+                        "status": "active",
+                        "updated_at": now.isoformat()
+                    }
+                }
+            )
+            logging.info(f"Subscription activated for company: {company['company_id']}")
+            
+        elif event == "subscription.charged":
+            # Recurring payment successful
+            await db.companies.update_one(
+                {"company_id": company["company_id"]},
+                {
+                    "$set": {
+                        "subscription_info.status": "active",
+                        "subscription_info.last_payment_date": now.isoformat(),
+                        "status": "active",
+                        "updated_at": now.isoformat()
+                    }
+                }
+            )
+            
+            # Send payment success notification to admin
+            admin_user = await db.users.find_one(
+                {"company_id": company["company_id"], "role": "admin"},
+                {"_id": 0}
+            )
+            if admin_user:
+                await create_notification_helper(
+                    title="Payment Successful",
+                    message=f"Your subscription payment of ₹{subscription_entity.get('plan_id', {}).get('amount', 0)/100} was successful.",
+                    recipient_role="admin",
+                    notification_type="success",
+                    category="subscription",
+                    recipient_id=admin_user.get("id")
+                )
+            
+            logging.info(f"Subscription charged for company: {company['company_id']}")
+            
+        elif event == "payment.failed":
+            # Payment failed
+            await db.companies.update_one(
+                {"company_id": company["company_id"]},
+                {
+                    "$set": {
+                        "subscription_info.status": "payment_failed",
+                        "updated_at": now.isoformat()
+                    }
+                }
+            )
+            
+            # Send payment failed notification to admin
+            admin_user = await db.users.find_one(
+                {"company_id": company["company_id"], "role": "admin"},
+                {"_id": 0}
+            )
+            if admin_user:
+                await create_notification_helper(
+                    title="Payment Failed",
+                    message="Your subscription payment failed. Please update your payment method to continue using the service.",
+                    recipient_role="admin",
+                    notification_type="error",
+                    category="subscription",
+                    recipient_id=admin_user.get("id")
+                )
+            
+            logging.warning(f"Payment failed for company: {company['company_id']}")
+            
+        elif event == "subscription.cancelled":
+            # Subscription cancelled
+            await db.companies.update_one(
+                {"company_id": company["company_id"]},
+                {
+                    "$set": {
+                        "subscription_info.status": "cancelled",
+                        "status": "inactive",
+                        "updated_at": now.isoformat()
+                    }
+                }
+            )
+            
+            # Send cancellation notification to admin
+            admin_user = await db.users.find_one(
+                {"company_id": company["company_id"], "role": "admin"},
+                {"_id": 0}
+            )
+            if admin_user:
+                await create_notification_helper(
+                    title="Subscription Cancelled",
+                    message="Your subscription has been cancelled. Your access will be disabled at the end of the current billing cycle.",
+                    recipient_role="admin",
+                    notification_type="warning",
+                    category="subscription",
+                    recipient_id=admin_user.get("id")
+                )
+            
+            logging.info(f"Subscription cancelled for company: {company['company_id']}")
+            
+        elif event == "subscription.completed":
+            # Subscription period completed
+            await db.companies.update_one(
+                {"company_id": company["company_id"]},
+                {
+                    "$set": {
+                        "subscription_info.status": "expired",
+                        "status": "inactive",
+                        "updated_at": now.isoformat()
+                    }
+                }
+            )
+            logging.info(f"Subscription completed for company: {company['company_id']}")
+        
+        await subscription_cache.refresh(company["company_id"])
+        
+        return {"status": "processed"}
+        
+    except SignatureVerificationError:
+        logging.error("Invalid webhook signature")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid webhook signature"
+        )
+    except Exception as e:
+        logging.error(f"Error processing webhook: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
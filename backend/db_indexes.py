@@ -0,0 +1,202 @@
+"""
+Index registry and query-plan audit.
+
+INDEX_REGISTRY declares the indexes each collection needs for the queries the API
+runs most; ensure_indexes creates them at startup. Creating an index that already
+exists with the same keys and options is a no-op, so this is safe on every boot.
+Collections that carry company_id lead with it so per-tenant queries stay on the
+index. HOT_QUERIES mirrors the shapes of those queries and explain_hot_queries
+reports the plan the server picks for each, flagging collection scans.
+"""
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEX_REGISTRY: Dict[str, List[IndexModel]] = {
+    "companies": [
+        IndexModel([("company_id", ASCENDING)], unique=True),
+    ],
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)]),
+        IndexModel([("employee_id", ASCENDING)]),
+        IndexModel([("company_id", ASCENDING), ("role", ASCENDING)]),
+    ],
+    "employees": [
+        IndexModel([("employee_id", ASCENDING)]),
+        IndexModel([("company_id", ASCENDING), ("employee_id", ASCENDING)]),
+        IndexModel([("company_id", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("status", ASCENDING)]),
+    ],
+    "dashboard_counters": [
+        IndexModel([("company_id", ASCENDING)], unique=True),
+    ],
+    "salary_components": [
+        IndexModel([("company_id", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "tax_configurations": [
+        IndexModel([("company_id", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "attendance": [
+        # One record per employee per day; attendance generation relies on it
+        IndexModel([("employee_id", ASCENDING), ("date", ASCENDING)], unique=True),
+        IndexModel([("date", ASCENDING)]),
+    ],
+    "leave_requests": [
+        IndexModel([("id", ASCENDING)]),
+        IndexModel([("employee_id", ASCENDING), ("status", ASCENDING), ("start_date", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("start_date", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("end_date", ASCENDING)]),
+    ],
+    "leave_balances": [
+        IndexModel([("employee_id", ASCENDING), ("year", ASCENDING)]),
+    ],
+    "ot_logs": [
+        IndexModel([("id", ASCENDING)]),
+        IndexModel([("employee_id", ASCENDING), ("status", ASCENDING), ("date", ASCENDING)]),
+        IndexModel([("employee_id", ASCENDING), ("date", ASCENDING)]),
+    ],
+    "late_arrivals": [
+        IndexModel([("employee_id", ASCENDING), ("date", ASCENDING)]),
+    ],
+    "loan_requests": [
+        IndexModel([("id", ASCENDING)]),
+        IndexModel([("employee_id", ASCENDING), ("status", ASCENDING)]),
+    ],
+    "payslips": [
+        IndexModel([("id", ASCENDING)]),
+        IndexModel([("employee_id", ASCENDING), ("year", ASCENDING), ("month", ASCENDING)]),
+        IndexModel([("year", ASCENDING), ("month", ASCENDING)]),
+    ],
+    "payroll_runs": [
+        IndexModel([("year", ASCENDING), ("month", ASCENDING)]),
+    ],
+    "notifications": [
+        IndexModel([("recipient_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("recipient_role", ASCENDING), ("recipient_id", ASCENDING), ("created_at", DESCENDING)]),
+    ],
+    "login_history": [
+        IndexModel([("employee_id", ASCENDING), ("login_time", DESCENDING)]),
+        # Only entries still waiting for a location, which the enrichment worker polls
+        IndexModel([("location_status", ASCENDING)],
+                   partialFilterExpression={"location_status": "pending"}),
+    ],
+    "holidays": [
+        IndexModel([("date", ASCENDING)]),
+    ],
+    "attendance_generation_jobs": [
+        IndexModel([("id", ASCENDING)]),
+        IndexModel([("status", ASCENDING)]),
+        # active_year is only set while a job is queued or running
+        IndexModel([("active_year", ASCENDING)], unique=True,
+                   partialFilterExpression={"active_year": {"$exists": True}}),
+    ],
+    "email_jobs": [
+        IndexModel([("id", ASCENDING)]),
+        IndexModel([("status", ASCENDING)]),
+    ],
+    "backup_restore_jobs": [
+        IndexModel([("id", ASCENDING)]),
+    ],
+    "cache_invalidations": [
+        # Workers only look back one user cache TTL, so an hour is plenty
+        IndexModel([("at", ASCENDING)], expireAfterSeconds=3600),
+    ],
+}
+
+# Representative filters of the hot queries; the values only need the right shape
+HOT_QUERIES: List[dict] = [
+    {"name": "attendance_by_employee_day", "collection": "attendance",
+     "filter": {"employee_id": "EMP001", "date": "2025-01-15"}},
+    {"name": "attendance_by_month", "collection": "attendance",
+     "filter": {"date": {"$gte": "2025-01-01", "$lte": "2025-01-31"}},
+     "sort": [("date", ASCENDING), ("employee_id", ASCENDING)]},
+    {"name": "approved_leaves_by_employee", "collection": "leave_requests",
+     "filter": {"employee_id": {"$in": ["EMP001"]}, "status": "approved", "start_date": {"$gte": "2025-01-01"}}},
+    {"name": "approved_leaves_in_month", "collection": "leave_requests",
+     "filter": {"status": "approved", "$or": [
+         {"start_date": {"$gte": "2025-01-01", "$lte": "2025-01-31"}},
+         {"end_date": {"$gte": "2025-01-01", "$lte": "2025-01-31"}},
+     ]}},
+    {"name": "approved_ot_by_employee", "collection": "ot_logs",
+     "filter": {"employee_id": "EMP001", "status": "approved", "date": {"$gte": "2025-01-01", "$lte": "2025-01-31"}}},
+    {"name": "payslip_by_employee_period", "collection": "payslips",
+     "filter": {"employee_id": "EMP001", "year": 2025, "month": 1}},
+    {"name": "payslips_by_period", "collection": "payslips",
+     "filter": {"year": 2025, "month": 1}},
+    {"name": "notifications_for_recipient", "collection": "notifications",
+     "filter": {"$or": [
+         {"recipient_id": "EMP001"},
+         {"recipient_role": "employee", "recipient_id": None},
+     ]},
+     "sort": [("created_at", DESCENDING)]},
+    {"name": "user_by_username", "collection": "users",
+     "filter": {"username": "EMP001"}},
+    {"name": "user_by_email", "collection": "users",
+     "filter": {"email": "admin@company.com"}},
+    {"name": "company_employees_by_status", "collection": "employees",
+     "filter": {"company_id": "company", "status": "active"}},
+    {"name": "company_employee", "collection": "employees",
+     "filter": {"company_id": "company", "employee_id": "EMP001"}},
+    {"name": "recent_logins", "collection": "login_history",
+     "filter": {"employee_id": "EMP001"},
+     "sort": [("login_time", DESCENDING)]},
+    {"name": "pending_login_locations", "collection": "login_history",
+     "filter": {"location_status": "pending"}},
+]
+
+
+async def ensure_indexes(db) -> dict:
+    """
+    Create every registered index. Indexes are created one at a time so a conflict
+    (duplicate keys under a unique index, or an existing index with other options)
+    is logged and skipped without holding back the rest.
+    """
+    created, failed = 0, []
+    for collection_name, indexes in INDEX_REGISTRY.items():
+        for index in indexes:
+            try:
+                await db[collection_name].create_indexes([index])
+                created += 1
+            except OperationFailure as e:
+                name = index.document["name"]
+                logger.error(f"Could not create index {collection_name}.{name}: {e}")
+                failed.append(f"{collection_name}.{name}")
+    return {"ensured": created, "failed": failed}
+
+
+def plan_stages(plan: dict) -> List[dict]:
+    """Flatten a winning plan tree into its stages, outermost first"""
+    stages = [{"stage": plan.get("stage"), "index": plan.get("indexName")}]
+    for child_key in ("inputStage", "queryPlan"):
+        if child_key in plan:
+            stages.extend(plan_stages(plan[child_key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(plan_stages(child))
+    return stages
+
+
+async def explain_hot_queries(db) -> List[dict]:
+    """Winning plan of each hot query, with collection scans flagged"""
+    reports = []
+    for query in HOT_QUERIES:
+        cursor = db[query["collection"]].find(query["filter"])
+        if query.get("sort"):
+            cursor = cursor.sort(query["sort"])
+        explained = await cursor.explain()
+        stages = plan_stages(explained.get("queryPlanner", {}).get("winningPlan", {}))
+        stats = explained.get("executionStats", {})
+        reports.append({
+            "name": query["name"],
+            "collection": query["collection"],
+            "stages": [stage["stage"] for stage in stages],
+            "indexes": sorted({stage["index"] for stage in stages if stage["index"]}),
+            "collscan": any(stage["stage"] == "COLLSCAN" for stage in stages),
+            "docs_examined": stats.get("totalDocsExamined"),
+            "keys_examined": stats.get("totalKeysExamined"),
+        })
+    return reports
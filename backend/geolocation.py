@@ -0,0 +1,200 @@
+"""
+IP geolocation for login history.
+
+Logins are recorded with a pending location and resolved afterwards by
+enrich_pending_logins, so /auth/login never waits on the geolocation API.
+GeolocationResolver keeps one pooled HTTP client, looks IPs up through the
+ip-api.com batch endpoint (up to 100 IPs per request) and remembers answers,
+including "no location", in a bounded LRU cache with a TTL. The API base URL is
+a constructor argument, so a local stand-in serving POST /batch can replace it.
+"""
+import ipaddress
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateMany
+
+LOCATION_PENDING = "pending"
+LOCATION_RESOLVED = "resolved"
+LOCATION_UNAVAILABLE = "unavailable"
+
+LOOKUP_FIELDS = "status,message,country,regionName,city,lat,lon"
+
+
+def is_public_ip(ip_address: Optional[str]) -> bool:
+    """Private, loopback and malformed addresses have no meaningful location"""
+    try:
+        return ipaddress.ip_address(ip_address).is_global
+    except (TypeError, ValueError):
+        return False
+
+
+def location_from_lookup(data: dict) -> Optional[dict]:
+    if data.get("status") != "success":
+        return None
+    return {
+        "city": data.get("city", "Unknown"),
+        "region": data.get("regionName", "Unknown"),
+        "country": data.get("country", "Unknown"),
+        "latitude": data.get("lat"),
+        "longitude": data.get("lon")
+    }
+
+
+class GeolocationCache:
+    """Bounded LRU cache of IP locations with per-entry TTL; a cached None means "no location" """
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Optional[dict]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ip_address: str) -> Tuple[bool, Optional[dict]]:
+        """(found, location) for an IP"""
+        entry = self._entries.get(ip_address)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires_at, location = entry
+        if expires_at <= time.monotonic():
+            del self._entries[ip_address]
+            self.misses += 1
+            return False, None
+
+        self._entries.move_to_end(ip_address)
+        self.hits += 1
+        return True, location
+
+    def set(self, ip_address: str, location: Optional[dict]):
+        self._entries[ip_address] = (time.monotonic() + self.ttl_seconds, location)
+        self._entries.move_to_end(ip_address)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class GeolocationResolver:
+    """
+    Resolves IPs through a shared, pooled HTTP client. httpx is imported when
+    the client is first needed. Transport errors propagate so the caller can
+    retry later; an IP the API cannot place is cached as None.
+    """
+    def __init__(self, base_url: str, cache: GeolocationCache, batch_size: int = 100,
+                 timeout_seconds: float = 5.0, max_connections: int = 4):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.batch_size = batch_size
+        self.timeout_seconds = timeout_seconds
+        self.max_connections = max_connections
+        self._client = None
+        self.lookups = 0
+        self.requests = 0
+
+    def _http_client(self):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            )
+        return self._client
+
+    async def _lookup_batch(self, ip_addresses: List[str]) -> Dict[str, Optional[dict]]:
+        response = await self._http_client().post(
+            "/batch",
+            params={"fields": LOOKUP_FIELDS},
+            json=ip_addresses
+        )
+        response.raise_for_status()
+        self.requests += 1
+        self.lookups += len(ip_addresses)
+
+        # Answers come back in request order
+        return {
+            ip_address: location_from_lookup(data)
+            for ip_address, data in zip(ip_addresses, response.json())
+        }
+
+    async def resolve_many(self, ip_addresses: List[str]) -> Dict[str, Optional[dict]]:
+        """Location (or None) for every given IP, from the cache where possible"""
+        locations = {}
+        missing = []
+        for ip_address in dict.fromkeys(ip_addresses):
+            if not is_public_ip(ip_address):
+                locations[ip_address] = None
+                continue
+            found, location = self.cache.get(ip_address)
+            if found:
+                locations[ip_address] = location
+            else:
+                missing.append(ip_address)
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            resolved = await self._lookup_batch(batch)
+            for ip_address in batch:
+                location = resolved.get(ip_address)
+                self.cache.set(ip_address, location)
+                locations[ip_address] = location
+        return locations
+
+    async def resolve(self, ip_address: str) -> Optional[dict]:
+        return (await self.resolve_many([ip_address]))[ip_address]
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            **self.cache.stats(),
+            "lookups": self.lookups,
+            "requests": self.requests
+        }
+
+
+async def enrich_pending_logins(db, resolver: GeolocationResolver, limit: int) -> int:
+    """
+    Fill in the location of up to `limit` pending login_history entries. Entries
+    sharing an IP are updated together. Returns how many entries were pending.
+    """
+    pending = await db.login_history.find(
+        {"location_status": LOCATION_PENDING},
+        {"_id": 0, "id": 1, "ip_address": 1}
+    ).limit(limit).to_list(length=limit)
+    if not pending:
+        return 0
+
+    ids_by_ip: Dict[str, List[str]] = {}
+    for entry in pending:
+        ids_by_ip.setdefault(entry.get("ip_address"), []).append(entry["id"])
+
+    locations = await resolver.resolve_many(list(ids_by_ip))
+    updates = [
+        UpdateMany(
+            {"id": {"$in": ids}, "location_status": LOCATION_PENDING},
+            {"$set": {
+                "location": locations.get(ip_address),
+                "location_status": LOCATION_RESOLVED if locations.get(ip_address) else LOCATION_UNAVAILABLE
+            }}
+        )
+        for ip_address, ids in ids_by_ip.items()
+    ]
+    await db.login_history.bulk_write(updates, ordered=False)
+    return len(pending)
@@ -0,0 +1,993 @@
+"""
+Leave Routes
+Leave requests, approvals and cancellations, entitlements and monthly leave reports
+"""
+
+import os
+import logging
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, HTTPException, UploadFile, status
+from pymongo import UpdateOne
+
+from server import (
+    count_leave_working_days, create_notification_helper, db, get_company_filter,
+    get_current_user, increment_dashboard_counters,
+    increment_employee_dashboard_counters, leave_removal_counters, LeaveApprovalRequest,
+    LeaveCancellationRequest, LeaveEntitlementResponse, LeaveRequest,
+    LeaveRequestCreate, notify_leave_application, notify_leave_approval,
+    prepare_for_mongo, prepare_from_mongo, require_admin_or_super_admin, require_role,
+    status_counter_deltas, User, UserRole,
+)
+
+router = APIRouter(tags=["Leave"])
+
+# Leave Management Endpoints
+@router.post("/leaves/with-document")
+async def create_leave_request_with_document(
+    leave_type: str = Form(...),
+    start_date: str = Form(...),
+    end_date: str = Form(...),
+    reason: str = Form(...),
+    half_day: bool = Form(False),
+    medical_certificate: UploadFile = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """Create leave request with medical certificate upload for sick leave"""
+    try:
+        # Validate file type
+        allowed_types = ['application/pdf', 'image/jpeg', 'image/png', 'image/jpg']
+        if medical_certificate.content_type not in allowed_types:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Only PDF, JPG, and PNG files are allowed for medical certificates"
+            )
+        
+        # Validate file size (5MB limit)
+        max_size = 5 * 1024 * 1024  # 5MB
+        file_content = await medical_certificate.read()
+        if len(file_content) > max_size:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="File size must be less than 5MB"
+            )
+        
+        # Store file as base64 in database for simplicity
+        import base64
+        file_base64 = base64.b64encode(file_content).decode('utf-8')
+        medical_cert_data = {
+            "filename": medical_certificate.filename,
+            "content_type": medical_certificate.content_type,
+            "file_data": f"data:{medical_certificate.content_type};base64,{file_base64}"
+        }
+        
+        # Parse dates
+        start_date_parsed = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end_date_parsed = datetime.strptime(end_date, '%Y-%m-%d').date()
+        
+        # Calculate working days only (excluding weekends and holidays)
+        if half_day:
+            days = 0.5
+        else:
+            days = await count_leave_working_days(current_user.company_id, start_date_parsed, end_date_parsed)
+        
+        leave_data = {
+            "id": str(uuid.uuid4()),
+            "employee_id": current_user.employee_id,
+            "leave_type": leave_type,
+            "start_date": start_date_parsed.isoformat(),
+            "end_date": end_date_parsed.isoformat(),
+            "days": days,
+            "reason": reason,
+            "half_day": half_day,
+            "status": "pending",
+            "applied_date": datetime.now(timezone.utc).isoformat(),
+            "medical_certificate": medical_cert_data,  # Store medical certificate data
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        
+        # Insert into database
+        result = await db.leave_requests.insert_one(leave_data)
+        await increment_employee_dashboard_counters(
+            current_user.employee_id, status_counter_deltas("leaves", None, "pending")
+        )
+        
+        # Create notification for admin
+        await create_notification_helper(
+            title="New Leave Request",
+            message=f"Employee {current_user.employee_id} has applied for {leave_type} from {start_date} to {end_date}",
+            recipient_id="admin",
+            category="leave_request"
+        )
+        
+        # Return the created leave request
+        created_leave = await db.leave_requests.find_one({"_id": result.inserted_id})
+        return LeaveRequest(**created_leave)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error creating leave request with document: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create leave request: {str(e)}"
+        )
+
+@router.post("/leaves", response_model=LeaveRequest)
+async def create_leave_request(
+    leave_data: LeaveRequestCreate,
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        # Calculate working days only (excluding weekends and holidays)
+        start = leave_data.start_date
+        end = leave_data.end_date
+        
+        if leave_data.half_day:
+            days = 0.5
+        else:
+            days = await count_leave_working_days(current_user.company_id, start, end)
+        
+        leave_request = LeaveRequest(
+            employee_id=current_user.employee_id or current_user.username,
+            leave_type=leave_data.leave_type,
+            start_date=leave_data.start_date,
+            end_date=leave_data.end_date,
+            days=days,
+            reason=leave_data.reason,
+            half_day=leave_data.half_day
+        )
+        
+        leave_dict = prepare_for_mongo(leave_request.dict())
+        result = await db.leave_requests.insert_one(leave_dict)
+        
+        if result.inserted_id:
+            # Get employee details for notification
+            employee = await db.employees.find_one({"employee_id": current_user.employee_id or current_user.username})
+            employee_name = employee.get('name', 'Unknown') if employee else current_user.username
+            
+            await increment_dashboard_counters(
+                employee.get("company_id") if employee else None,
+                status_counter_deltas("leaves", None, "pending")
+            )
+            
+            # Notify admins about new leave application
+            await notify_leave_application(
+                employee_id=current_user.employee_id or current_user.username,
+                employee_name=employee_name,
+                leave_type=leave_data.leave_type,
+                start_date=leave_data.start_date.strftime('%Y-%m-%d'),
+                end_date=leave_data.end_date.strftime('%Y-%m-%d'),
+                leave_id=leave_request.id
+            )
+            
+            return leave_request
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to create leave request"
+            )
+    except Exception as e:
+        logging.error(f"Error creating leave request: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to create leave request"
+        )
+
+@router.get("/leaves")
+async def get_leave_requests(
+    current_user: User = Depends(get_current_user)
+):
+    try:
+        if current_user.role == UserRole.ADMIN:
+            # Admin can see all leave requests
+            leaves = await db.leave_requests.find({}).to_list(length=None)
+        else:
+            # Employee can only see their own requests
+            leaves = await db.leave_requests.find(
+                {"employee_id": current_user.employee_id}
+            ).to_list(length=None)
+        
+        # Convert MongoDB documents to JSON-serializable format
+        serialized_leaves = [prepare_from_mongo(leave) for leave in leaves]
+        
+        return serialized_leaves
+    except Exception as e:
+        logging.error(f"Error fetching leave requests: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch leave requests"
+        )
+
+@router.get("/leaves/{leave_id}/medical-certificate")
+async def get_medical_certificate(
+    leave_id: str, 
+    current_user: User = Depends(get_current_user)
+):
+    """Get medical certificate for a leave request"""
+    try:
+        # Find the leave request
+        leave_request = await db.leave_requests.find_one({"id": leave_id})
+        if not leave_request:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Leave request not found"
+            )
+        
+        # Check permissions - admin or the employee who submitted the request
+        if current_user.role != UserRole.ADMIN and current_user.employee_id != leave_request.get("employee_id"):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You don't have permission to view this medical certificate"
+            )
+        
+        # Check if medical certificate exists
+        medical_cert = leave_request.get("medical_certificate")
+        if not medical_cert:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="No medical certificate found for this leave request"
+            )
+        
+        # Return the medical certificate data
+        return {
+            "filename": medical_cert.get("filename", "medical_certificate"),
+            "content_type": medical_cert.get("content_type", "application/octet-stream"),
+            "file_data": medical_cert.get("file_data", ""),
+            "leave_id": leave_id,
+            "employee_id": leave_request.get("employee_id"),
+            "leave_type": leave_request.get("leave_type")
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error retrieving medical certificate: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to retrieve medical certificate: {str(e)}"
+        )
+
+@router.put("/leaves/{leave_id}/approve")
+async def approve_reject_leave(
+    leave_id: str,
+    approval_data: LeaveApprovalRequest,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    try:
+        update_data = {
+            "status": approval_data.status,
+            "updated_at": datetime.now(timezone.utc)
+        }
+        
+        if approval_data.status == "approved":
+            update_data["approved_by"] = current_user.username
+            update_data["approved_date"] = datetime.now(timezone.utc)
+            if approval_data.admin_comment:
+                update_data["admin_comment"] = approval_data.admin_comment
+        elif approval_data.status == "rejected":
+            update_data["rejected_by"] = current_user.username
+            update_data["rejected_date"] = datetime.now(timezone.utc)
+            if approval_data.admin_comment:
+                update_data["admin_comment"] = approval_data.admin_comment
+            # Keep backward compatibility with rejection_reason
+            if approval_data.admin_comment:
+                update_data["rejection_reason"] = approval_data.admin_comment
+        
+        # Get leave request data before updating for notification
+        leave_request = await db.leave_requests.find_one({"id": leave_id})
+        if not leave_request:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Leave request not found"
+            )
+        
+        # Update leave request
+        result = await db.leave_requests.update_one(
+            {"id": leave_id},
+            {"$set": update_data}
+        )
+        
+        if result.matched_count == 0:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Leave request not found"
+            )
+        
+        await increment_employee_dashboard_counters(
+            leave_request['employee_id'],
+            status_counter_deltas(
+                "leaves", leave_request.get('status'), approval_data.status, leave_request.get('start_date')
+            )
+        )
+        if "approved" in (leave_request.get('status'), approval_data.status):
+            invalidate_leave_excess_cache()
+            await refresh_leave_balance(leave_request['employee_id'])
+        
+        # Send notification to employee using enhanced system
+        await notify_leave_approval(
+            employee_id=leave_request['employee_id'],
+            leave_type=leave_request['leave_type'],
+            start_date=leave_request['start_date'],
+            end_date=leave_request['end_date'],
+            approved=(approval_data.status == "approved"),
+            admin_comment=approval_data.admin_comment or ""
+        )
+        
+        # Mark the leave application notification as read using related_id
+        await db.notifications.update_many(
+            {
+                "related_id": leave_id,
+                "category": "leave",
+                "is_read": False
+            },
+            {"$set": {"is_read": True, "read_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        
+        return {"message": f"Leave request {approval_data.status} successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error updating leave request: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update leave request"
+        )
+
+@router.put("/leaves/{leave_id}/cancel")
+async def cancel_leave_request(
+    leave_id: str,
+    cancellation_data: LeaveCancellationRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Cancel a leave request (employee can cancel their own pending or approved future leaves)"""
+    try:
+        # Get leave request
+        leave_request = await db.leave_requests.find_one({"id": leave_id})
+        if not leave_request:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Leave request not found"
+            )
+        
+        # Verify the leave belongs to the current user
+        if leave_request['employee_id'] != current_user.employee_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only cancel your own leave requests"
+            )
+        
+        # Check if leave can be cancelled
+        current_status = leave_request.get('status')
+        if current_status == 'cancelled':
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Leave request is already cancelled"
+            )
+        
+        if current_status == 'rejected':
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cannot cancel a rejected leave request"
+            )
+        
+        # Check if leave has started or is in the past
+        start_date = leave_request['start_date']
+        if isinstance(start_date, str):
+            start_date = datetime.fromisoformat(start_date).date()
+        
+        today = date.today()
+        if start_date < today:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cannot cancel a leave that has already started or is in the past"
+            )
+        
+        # Update leave request to cancelled
+        update_data = {
+            "status": "cancelled",
+            "cancelled_by": current_user.employee_id,
+            "cancelled_date": datetime.now(timezone.utc),
+            "cancellation_reason": cancellation_data.cancellation_reason,
+            "updated_at": datetime.now(timezone.utc)
+        }
+        
+        result = await db.leave_requests.update_one(
+            {"id": leave_id},
+            {"$set": update_data}
+        )
+        
+        if result.matched_count == 0:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Leave request not found"
+            )
+        
+        # Get employee details for notification
+        employee = await db.employees.find_one({"employee_id": current_user.employee_id})
+        employee_name = employee.get('name', 'Unknown') if employee else current_user.username
+        
+        await increment_dashboard_counters(
+            employee.get("company_id") if employee else None,
+            status_counter_deltas("leaves", current_status, "cancelled", leave_request['start_date'])
+        )
+        if current_status == 'approved':
+            invalidate_leave_excess_cache()
+            await refresh_leave_balance(leave_request['employee_id'])
+        
+        # Notify admin about cancellation (especially important for approved leaves)
+        if current_status == 'approved':
+            notification_title = "Approved Leave Cancelled"
+            notification_message = f"Employee {employee_name} ({current_user.employee_id}) has cancelled their approved {leave_request['leave_type']} from {start_date} to {leave_request['end_date']}. Reason: {cancellation_data.cancellation_reason}"
+        else:
+            notification_title = "Leave Request Cancelled"
+            notification_message = f"Employee {employee_name} ({current_user.employee_id}) has cancelled their pending {leave_request['leave_type']} from {start_date} to {leave_request['end_date']}. Reason: {cancellation_data.cancellation_reason}"
+        
+        # Create notification for admin
+        await create_notification_helper(
+            title=notification_title,
+            message=notification_message,
+            recipient_id="admin",
+            recipient_role="admin",
+            category="leave_cancellation"
+        )
+        
+        return {
+            "message": "Leave request cancelled successfully",
+            "was_approved": current_status == 'approved'
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error cancelling leave request: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to cancel leave request: {str(e)}"
+        )
+
+@router.delete("/leaves/clear-all")
+async def clear_all_leave_requests(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Delete all leave requests (admin only)"""
+    try:
+        removed_counters = await leave_removal_counters({})
+        result = await db.leave_requests.delete_many({})
+        await removed_counters.flush()
+        invalidate_leave_excess_cache()
+        return {
+            "message": f"Successfully deleted all leave requests",
+            "deleted_count": result.deleted_count
+        }
+    except Exception as e:
+        logging.error(f"Error clearing leave requests: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to clear leave requests"
+        )
+
+# Leave Entitlement
+# Persisted leave_balances fields derived from the entitlement computation
+LEAVE_BALANCE_FIELDS = [
+    "casual_leave_accrued", "casual_leave_used", "casual_leave_balance",
+    "sick_leave_total", "sick_leave_used", "sick_leave_balance",
+    "annual_leave_total", "annual_leave_used", "annual_leave_balance",
+    "carried_forward_leaves"
+]
+
+def compute_leave_entitlement(
+    employee: dict,
+    approved_leaves: List[dict],
+    previous_year_balance: Optional[dict],
+    current_year_balance: Optional[dict] = None,
+    today: Optional[date] = None
+) -> dict:
+    """
+    Compute an employee's leave entitlement and balance for the current year.
+    Pure: works only on the employee, their approved leaves this year and the stored
+    balances, so it can run for one employee or a whole tenant without touching the database.
+    """
+    today = today or date.today()
+    joining_date = None
+    
+    # Check probation status - checkbox takes priority
+    is_in_probation = employee.get('is_on_probation', False)
+    
+    # If not explicitly marked, check probation end date
+    if not is_in_probation:
+        probation_end_date = employee.get('probation_end_date')
+        if probation_end_date:
+            if isinstance(probation_end_date, str):
+                probation_end_date = datetime.fromisoformat(probation_end_date).date()
+            is_in_probation = today < probation_end_date
+    
+    # If in probation, no leaves
+    if is_in_probation:
+        months_of_service = 0
+        casual_leave_accrued = 0.0
+        sick_leave_total = 0.0
+        annual_leave_total = 0.0
+    else:
+        # Calculate casual leave starting from PROBATION END DATE
+        joining_date = employee.get('date_of_joining')
+        probation_end_date = employee.get('probation_end_date')
+        current_year_start = date(today.year, 1, 1)
+        
+        if not joining_date:
+            months_of_service = 0
+            casual_leave_accrued = 0.0
+        else:
+            if isinstance(joining_date, str):
+                joining_date = datetime.fromisoformat(joining_date).date()
+            
+            # Convert probation end date if exists
+            if probation_end_date:
+                if isinstance(probation_end_date, str):
+                    probation_end_date = datetime.fromisoformat(probation_end_date).date()
+            
+            # Leave accrual starts from probation end date (if set), otherwise from joining date
+            leave_accrual_start = probation_end_date if probation_end_date else joining_date
+            
+            # Calculate months in current year only
+            # If leave accrual started this year, count from that date, otherwise from Jan 1
+            accrual_start_this_year = max(leave_accrual_start, current_year_start)
+            
+            # Only accrue if probation has ended
+            if today >= leave_accrual_start:
+                # Months from accrual start to today in current year
+                months_this_year = (today.year - accrual_start_this_year.year) * 12 + (today.month - accrual_start_this_year.month)
+                
+                # Add partial month if mid-month
+                if today.day >= accrual_start_this_year.day:
+                    months_this_year += 1
+                
+                # Use custom casual leave rate if set, otherwise default 1.5 days per month
+                casual_rate = employee.get('custom_casual_leave_per_month', 1.5)
+                # Accrual is only for current year
+                casual_leave_accrued = round(months_this_year * casual_rate, 1)
+            else:
+                # Still in probation, no accrual
+                casual_leave_accrued = 0.0
+            
+            # Total months of service (for display purposes - from joining date)
+            months_of_service = (today.year - joining_date.year) * 12 + (today.month - joining_date.month)
+        
+        # Use custom sick leave if set, otherwise default 7 days per year
+        sick_leave_total = employee.get('custom_sick_leave_per_year', 7.0)
+        
+        # Additional annual leave days
+        annual_leave_total = employee.get('annual_leave_days', 0.0)
+    
+    # Carried forward is fixed when the year's balance is first created
+    if current_year_balance:
+        carried_forward = current_year_balance.get('carried_forward_leaves', 0.0)
+    else:
+        # Calculate carried forward from previous year (only unused Annual Leave, max 5)
+        carried_forward = 0.0
+        if previous_year_balance:
+            # Get previous year's annual leave
+            prev_annual_total = previous_year_balance.get('annual_leave_total', 0.0)
+            prev_annual_used = previous_year_balance.get('annual_leave_used', 0.0)
+            prev_annual_unused = max(0, prev_annual_total - prev_annual_used)
+            # Carry forward only Annual Leave, capped at 5 days
+            carried_forward = prev_annual_unused
+    carried_forward = min(carried_forward, 5.0)
+    
+    # Calculate used leaves from approved leave requests
+    casual_leave_used = 0.0
+    sick_leave_used = 0.0
+    annual_leave_used = 0.0
+    
+    for leave in approved_leaves:
+        days = leave.get('days', 0.0)
+        leave_type = leave.get('leave_type', '').lower()
+        
+        if 'casual' in leave_type:
+            casual_leave_used += days
+        elif 'sick' in leave_type:
+            sick_leave_used += days
+        elif 'annual' in leave_type:
+            annual_leave_used += days
+    
+    # Update balances
+    casual_leave_balance = max(0, casual_leave_accrued - casual_leave_used)
+    sick_leave_balance = max(0, sick_leave_total - sick_leave_used)
+    
+    # Annual leave balance includes current year's allocation + carried forward - used
+    annual_leave_balance = max(0, annual_leave_total + carried_forward - annual_leave_used)
+    
+    total_available = casual_leave_balance + sick_leave_balance + annual_leave_balance
+    
+    return {
+        "employee_id": employee["employee_id"],
+        "employee_name": employee.get('name', 'Unknown'),
+        "joining_date": joining_date if not is_in_probation else None,
+        "months_of_service": months_of_service,
+        "casual_leave_accrued": casual_leave_accrued,
+        "casual_leave_used": casual_leave_used,
+        "casual_leave_balance": casual_leave_balance,
+        "sick_leave_total": sick_leave_total,
+        "sick_leave_used": sick_leave_used,
+        "sick_leave_balance": sick_leave_balance,
+        "annual_leave_total": annual_leave_total,
+        "annual_leave_used": annual_leave_used,
+        "annual_leave_balance": annual_leave_balance,
+        "carried_forward_leaves": carried_forward,
+        "total_available_leaves": total_available
+    }
+
+async def load_leave_entitlement_inputs(employees: List[dict], year: int) -> dict:
+    """
+    Batch-load the inputs of compute_leave_entitlement for a set of employees.
+    Returns {employee_id: (approved_leaves, previous_year_balance, current_year_balance)}.
+    """
+    employee_ids = [employee["employee_id"] for employee in employees]
+    
+    approved_leaves = await db.leave_requests.find({
+        "employee_id": {"$in": employee_ids},
+        "status": "approved",
+        "start_date": {
+            "$gte": date(year, 1, 1).isoformat(),
+            "$lte": date(year, 12, 31).isoformat()
+        }
+    }, {"_id": 0, "employee_id": 1, "leave_type": 1, "days": 1}).to_list(length=None)
+    
+    balances = await db.leave_balances.find(
+        {"employee_id": {"$in": employee_ids}, "year": {"$in": [year - 1, year]}}, {"_id": 0}
+    ).to_list(length=None)
+    
+    leaves_by_employee: Dict[str, List[dict]] = {}
+    for leave in approved_leaves:
+        leaves_by_employee.setdefault(leave["employee_id"], []).append(leave)
+    balances_by_key = {(balance["employee_id"], balance["year"]): balance for balance in balances}
+    
+    return {
+        employee_id: (
+            leaves_by_employee.get(employee_id, []),
+            balances_by_key.get((employee_id, year - 1)),
+            balances_by_key.get((employee_id, year))
+        )
+        for employee_id in employee_ids
+    }
+
+def leave_balance_write(entitlement: dict, current_year_balance: Optional[dict], year: int) -> Optional[UpdateOne]:
+    """Upsert for the year's leave_balances document, or None when nothing changed"""
+    fields = {field: entitlement[field] for field in LEAVE_BALANCE_FIELDS}
+    now = datetime.now(timezone.utc)
+    
+    if current_year_balance and all(current_year_balance.get(field) == value for field, value in fields.items()):
+        return None
+    
+    fields["updated_at"] = now.isoformat()
+    return UpdateOne(
+        {"employee_id": entitlement["employee_id"], "year": year},
+        {
+            "$set": fields,
+            "$setOnInsert": {
+                "id": str(uuid.uuid4()),
+                "last_accrual_date": now.date().isoformat(),
+                "created_at": now.isoformat()
+            }
+        },
+        upsert=True
+    )
+
+async def persist_leave_balances(writes: List[UpdateOne]):
+    """Write-behind for leave balances; only changed balances reach the database"""
+    if not writes:
+        return
+    try:
+        await db.leave_balances.bulk_write(writes, ordered=False)
+    except Exception as e:
+        logging.error(f"Error persisting leave balances: {str(e)}")
+
+async def refresh_leave_balance(employee_id: str):
+    """Recompute and persist an employee's balance after their approved leave changed"""
+    employee = await db.employees.find_one({"employee_id": employee_id}, {"_id": 0})
+    if not employee:
+        return
+    year = date.today().year
+    approved_leaves, previous_year_balance, current_year_balance = (
+        await load_leave_entitlement_inputs([employee], year)
+    )[employee_id]
+    entitlement = compute_leave_entitlement(employee, approved_leaves, previous_year_balance, current_year_balance)
+    write = leave_balance_write(entitlement, current_year_balance, year)
+    await persist_leave_balances([write] if write else [])
+
+@router.get("/leaves/entitlements", response_model=List[LeaveEntitlementResponse])
+async def get_leave_entitlements(
+    background_tasks: BackgroundTasks,
+    employee_status: Optional[str] = None,
+    current_user: User = Depends(require_admin_or_super_admin),
+    company_filter: dict = Depends(get_company_filter)
+):
+    """Leave entitlement and balance for every employee of the company in one pass (HR reports)"""
+    try:
+        query = dict(company_filter)
+        if employee_status:
+            query["status"] = employee_status
+        employees = await db.employees.find(query, {"_id": 0}).to_list(length=None)
+        employees = [employee for employee in employees if employee.get("employee_id")]
+        
+        year = date.today().year
+        inputs = await load_leave_entitlement_inputs(employees, year)
+        
+        entitlements = []
+        writes = []
+        for employee in employees:
+            approved_leaves, previous_year_balance, current_year_balance = inputs[employee["employee_id"]]
+            entitlement = compute_leave_entitlement(employee, approved_leaves, previous_year_balance, current_year_balance)
+            entitlements.append(LeaveEntitlementResponse(**entitlement))
+            write = leave_balance_write(entitlement, current_year_balance, year)
+            if write:
+                writes.append(write)
+        
+        background_tasks.add_task(persist_leave_balances, writes)
+        return entitlements
+    except Exception as e:
+        logging.error(f"Error fetching leave entitlements: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch leave entitlements"
+        )
+
+@router.get("/leaves/entitlement/{employee_id}", response_model=LeaveEntitlementResponse)
+async def get_leave_entitlement(
+    employee_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user)
+):
+    """Get current leave entitlement and balance for an employee"""
+    try:
+        # Fetch employee
+        employee = await db.employees.find_one({"employee_id": employee_id}, {"_id": 0})
+        if not employee:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Employee not found"
+            )
+        
+        year = date.today().year
+        approved_leaves, previous_year_balance, current_year_balance = (
+            await load_leave_entitlement_inputs([employee], year)
+        )[employee_id]
+        entitlement = compute_leave_entitlement(employee, approved_leaves, previous_year_balance, current_year_balance)
+        
+        # Persist after responding, and only if the stored balance is out of date
+        write = leave_balance_write(entitlement, current_year_balance, year)
+        if write:
+            background_tasks.add_task(persist_leave_balances, [write])
+        
+        return LeaveEntitlementResponse(**entitlement)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error fetching leave entitlement: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch leave entitlement"
+        )
+
+# Per-month excess leave results used by payroll preparation. Results depend on
+# today's date through the entitlement accrual, so today is part of the key.
+LEAVE_EXCESS_CACHE_TTL_SECONDS = int(os.environ.get('LEAVE_EXCESS_CACHE_TTL_SECONDS', 300))  # 0 disables
+leave_excess_cache: Dict[tuple, tuple] = {}
+
+def invalidate_leave_excess_cache():
+    """Drop cached excess leave results; called when approved leave or an employee's entitlement inputs change"""
+    leave_excess_cache.clear()
+
+def store_leave_excess(cache_key: tuple, result: dict):
+    """Cache a result, evicting expired entries so keys from past days do not pile up"""
+    now = time.monotonic()
+    for key in [key for key, (expires_at, _) in leave_excess_cache.items() if expires_at <= now]:
+        del leave_excess_cache[key]
+    leave_excess_cache[cache_key] = (now + LEAVE_EXCESS_CACHE_TTL_SECONDS, result)
+
+def leave_category(leave_type: str) -> str:
+    """
+    Map a leave type to its entitlement category.
+    Casual: casual, annual, earned, privilege
+    Sick: sick, medical
+    """
+    leave_type = (leave_type or '').lower()
+    if any(word in leave_type for word in ['casual', 'annual', 'earned', 'privilege']):
+        return 'casual'
+    if any(word in leave_type for word in ['sick', 'medical']):
+        return 'sick'
+    return 'other'
+
+@router.get("/leaves/approved-by-month")
+async def get_approved_leaves_by_month(
+    month: int,
+    year: int,
+    use_cache: bool = True,
+    current_user: User = Depends(get_current_user)
+):
+    """Get approved leaves for all employees for a specific month, returning only excess leaves beyond entitlement"""
+    try:
+        cache_key = (year, month, date.today())
+        if use_cache and LEAVE_EXCESS_CACHE_TTL_SECONDS > 0:
+            entry = leave_excess_cache.get(cache_key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+        
+        # Get start and end dates for the month
+        month_start = date(year, month, 1)
+        if month == 12:
+            month_end = date(year + 1, 1, 1) - timedelta(days=1)
+        else:
+            month_end = date(year, month + 1, 1) - timedelta(days=1)
+        
+        # Fetch all approved leave requests that overlap with this month
+        approved_leaves = await db.leave_requests.find({
+            "status": "approved",
+            "$or": [
+                {"start_date": {"$gte": month_start.isoformat(), "$lte": month_end.isoformat()}},
+                {"end_date": {"$gte": month_start.isoformat(), "$lte": month_end.isoformat()}},
+                {
+                    "$and": [
+                        {"start_date": {"$lte": month_start.isoformat()}},
+                        {"end_date": {"$gte": month_end.isoformat()}}
+                    ]
+                }
+            ]
+        }, {"_id": 0, "employee_id": 1, "leave_type": 1, "start_date": 1, "end_date": 1, "half_day": 1}).to_list(length=None)
+        
+        # Group by employee and calculate days in the specific month
+        employee_leaves = {}
+        
+        for leave in approved_leaves:
+            employee_id = leave['employee_id']
+            
+            # Parse dates
+            start_date = leave['start_date']
+            end_date = leave['end_date']
+            if isinstance(start_date, str):
+                start_date = datetime.fromisoformat(start_date).date()
+            if isinstance(end_date, str):
+                end_date = datetime.fromisoformat(end_date).date()
+            
+            # Calculate overlap with the target month
+            overlap_start = max(start_date, month_start)
+            overlap_end = min(end_date, month_end)
+            
+            if overlap_start <= overlap_end:
+                # Calculate days in this month
+                days_in_month = (overlap_end - overlap_start).days + 1
+                
+                # Adjust for half day
+                if leave.get('half_day', False) and start_date == end_date:
+                    days_in_month = 0.5
+                
+                if employee_id not in employee_leaves:
+                    employee_leaves[employee_id] = {
+                        'casual': 0.0,
+                        'sick': 0.0,
+                        'other': 0.0
+                    }
+                
+                employee_leaves[employee_id][leave_category(leave.get('leave_type', ''))] += days_in_month
+        
+        employee_ids = list(employee_leaves)
+        
+        # One fetch for every employee with leave this month
+        employees = await db.employees.find(
+            {"employee_id": {"$in": employee_ids}},
+            {
+                "_id": 0, "employee_id": 1, "is_on_probation": 1, "probation_end_date": 1,
+                "date_of_joining": 1, "custom_casual_leave_per_month": 1, "custom_sick_leave_per_year": 1
+            }
+        ).to_list(length=None)
+        employees_by_id = {employee["employee_id"]: employee for employee in employees}
+        
+        # Year-to-date usage up to (but not including) this month, grouped by employee and leave type
+        year_start = date(year, 1, 1)
+        prev_month_end = month_start - timedelta(days=1)
+        ytd_used = {}
+        if employee_ids and prev_month_end >= year_start:
+            ytd_rows = await db.leave_requests.aggregate([
+                {"$match": {
+                    "employee_id": {"$in": employee_ids},
+                    "status": "approved",
+                    "start_date": {"$gte": year_start.isoformat(), "$lte": prev_month_end.isoformat()}
+                }},
+                {"$group": {
+                    "_id": {"employee_id": "$employee_id", "leave_type": {"$toLower": {"$ifNull": ["$leave_type", ""]}}},
+                    "days": {"$sum": {"$ifNull": ["$days", 0]}}
+                }}
+            ]).to_list(length=None)
+            for row in ytd_rows:
+                usage = ytd_used.setdefault(row["_id"]["employee_id"], {'casual': 0.0, 'sick': 0.0, 'other': 0.0})
+                usage[leave_category(row["_id"]["leave_type"])] += row["days"]
+        
+        # Now calculate excess leaves for each employee
+        result = {}
+        today = date.today()
+        
+        for employee_id, leave_data in employee_leaves.items():
+            # Get employee entitlement
+            employee = employees_by_id.get(employee_id)
+            if not employee:
+                continue
+            
+            # Check probation status - checkbox takes priority
+            is_in_probation = employee.get('is_on_probation', False)
+            
+            # If not explicitly marked, check probation end date
+            if not is_in_probation:
+                probation_end_date = employee.get('probation_end_date')
+                if probation_end_date:
+                    if isinstance(probation_end_date, str):
+                        probation_end_date = datetime.fromisoformat(probation_end_date).date()
+                    is_in_probation = today < probation_end_date
+            
+            # If in probation, all leaves are excess (unpaid)
+            if is_in_probation:
+                casual_entitled = 0.0
+                sick_entitled = 0.0
+            else:
+                # Calculate entitlement for this employee FOR CURRENT YEAR ONLY
+                joining_date = employee.get('date_of_joining')
+                
+                if not joining_date:
+                    casual_entitled = 0.0
+                else:
+                    if isinstance(joining_date, str):
+                        joining_date = datetime.fromisoformat(joining_date).date()
+                    
+                    # Calculate months in current year only
+                    accrual_start = max(joining_date, year_start)
+                    
+                    # Months from accrual start to today in current year
+                    months_this_year = (today.year - accrual_start.year) * 12 + (today.month - accrual_start.month)
+                    if today.day > accrual_start.day:
+                        months_this_year += 1
+                    
+                    # Use custom casual leave rate if set, otherwise default 1.5 days per month
+                    casual_rate = employee.get('custom_casual_leave_per_month', 1.5)
+                    casual_entitled = round(months_this_year * casual_rate, 1)
+                
+                # Use custom sick leave if set, otherwise default 7 days per year
+                sick_entitled = employee.get('custom_sick_leave_per_year', 7.0)
+            
+            usage = ytd_used.get(employee_id, {})
+            ytd_casual_used = usage.get('casual', 0.0)
+            ytd_sick_used = usage.get('sick', 0.0)
+            
+            # Calculate remaining entitlement
+            casual_remaining = max(0, casual_entitled - ytd_casual_used)
+            sick_remaining = max(0, sick_entitled - ytd_sick_used)
+            
+            # Calculate excess leaves in this month
+            casual_excess = max(0, leave_data['casual'] - casual_remaining)
+            sick_excess = max(0, leave_data['sick'] - sick_remaining)
+            other_excess = leave_data['other']  # Other leaves are always deducted
+            
+            total_excess = casual_excess + sick_excess + other_excess
+            
+            result[employee_id] = {
+                'total_excess_days': round(total_excess, 1),
+                'casual_excess': round(casual_excess, 1),
+                'sick_excess': round(sick_excess, 1),
+                'other_days': round(other_excess, 1),
+                'casual_taken': round(leave_data['casual'], 1),
+                'sick_taken': round(leave_data['sick'], 1),
+                'casual_entitled': round(casual_entitled, 1),
+                'sick_entitled': sick_entitled,
+                'casual_remaining_before': round(casual_remaining, 1),
+                'sick_remaining_before': round(sick_remaining, 1)
+            }
+        
+        if LEAVE_EXCESS_CACHE_TTL_SECONDS > 0:
+            store_leave_excess(cache_key, result)
+        
+        return result
+        
+    except Exception as e:
+        logging.error(f"Error fetching approved leaves by month: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch approved leaves"
+        )
@@ -0,0 +1,121 @@
+"""
+Login load benchmark
+Measures the latency of an unrelated endpoint on a running server, first on its
+own and then while a number of clients log in back to back, to show how much
+password hashing during a login storm slows everything else down.
+
+Usage:
+    python login_load_benchmark.py --username admin --password 'Admin$2022'
+    python login_load_benchmark.py --base-url http://127.0.0.1:8001 --logins 50 --duration 20 --max-p99-ms 250
+
+The probe endpoint defaults to GET /api/, which does no database work, so its
+latency reflects how responsive the worker's event loop is. Run the server with
+a single worker so the logins and the probe share one event loop. Exits with
+status 1 when --max-p99-ms is exceeded under load.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import httpx
+
+
+def percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples) -> dict:
+    if not samples:
+        return {"requests": 0}
+    return {
+        "requests": len(samples),
+        "p50_ms": round(statistics.median(samples), 1),
+        "p95_ms": round(percentile(samples, 0.95), 1),
+        "p99_ms": round(percentile(samples, 0.99), 1),
+        "max_ms": round(max(samples), 1),
+    }
+
+
+async def probe(client: httpx.AsyncClient, path: str, deadline: float, interval: float) -> list:
+    """Latencies of sequential probe requests until the deadline"""
+    latencies = []
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def log_in_repeatedly(client: httpx.AsyncClient, credentials: dict, deadline: float, results: dict):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.post("/api/auth/login", json=credentials)
+        results["latencies"].append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            results["failed"] += 1
+
+
+async def run(args) -> dict:
+    credentials = {"username": args.username, "password": args.password}
+    limits = httpx.Limits(max_connections=args.logins + 1)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        # Warm up connections and the server's caches before measuring
+        await client.get(args.probe_path)
+
+        deadline = time.perf_counter() + args.duration
+        idle = await probe(client, args.probe_path, deadline, args.probe_interval)
+
+        logins = {"latencies": [], "failed": 0}
+        deadline = time.perf_counter() + args.duration
+        login_clients = [
+            asyncio.create_task(log_in_repeatedly(client, credentials, deadline, logins))
+            for _ in range(args.logins)
+        ]
+        under_load = await probe(client, args.probe_path, deadline, args.probe_interval)
+        await asyncio.gather(*login_clients)
+
+    return {
+        "probe_path": args.probe_path,
+        "concurrent_logins": args.logins,
+        "duration_seconds": args.duration,
+        "probe_idle": summarize(idle),
+        "probe_under_login_load": summarize(under_load),
+        "logins": {
+            **summarize(logins["latencies"]),
+            "failed": logins["failed"],
+            "per_second": round(len(logins["latencies"]) / args.duration, 1),
+        },
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Probe endpoint latency with and without concurrent logins")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=20, help="Clients logging in concurrently")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per phase")
+    parser.add_argument("--probe-path", default="/api/")
+    parser.add_argument("--probe-interval", type=float, default=0.01, help="Pause between probe requests")
+    parser.add_argument("--max-p99-ms", type=float, default=None, help="Fail when the probe p99 under load is slower")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+
+    p99 = report["probe_under_login_load"].get("p99_ms", 0)
+    if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+        print(f"Probe p99 under login load is {p99} ms, limit {args.max_p99_ms} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Column-wise payroll calculations used by payslip generation and payroll runs.
+
+Every function takes per-employee inputs as parallel lists and computes earnings,
+deductions, pro-ration and totals for all employees at once with pandas, instead
+of one dict at a time. Database access stays in server.py.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Earnings columns of a payslip and the legacy salary_structure field each falls back to
+EARNING_FIELDS: Dict[str, Optional[str]] = {
+    "basic_salary": None,
+    "house_rent_allowance": "hra",
+    "medical_allowance": None,
+    "leave_travel_allowance": "travel_allowance",
+    "conveyance_allowance": "food_allowance",
+    "performance_incentive": "internet_allowance",
+    "other_benefits": "special_allowance",
+}
+
+DEDUCTION_FIELDS: List[str] = [
+    "pf_employee",
+    "esi_employee",
+    "professional_tax",
+    "tds",
+    "loan_deductions",
+    "others",
+]
+
+
+def _records_frame(records: List[Optional[dict]]) -> pd.DataFrame:
+    return pd.DataFrame([record or {} for record in records], index=range(len(records)))
+
+
+def _numeric(frame: pd.DataFrame, field: Optional[str]) -> pd.Series:
+    """A numeric column with missing or non-numeric values as 0"""
+    if not field or field not in frame.columns:
+        return pd.Series(0.0, index=frame.index)
+    return pd.to_numeric(frame[field], errors="coerce").fillna(0.0)
+
+
+def _numeric_array(values: List[float], size: int) -> np.ndarray:
+    array = pd.to_numeric(pd.Series(values, index=range(size), dtype=object), errors="coerce")
+    return array.fillna(0.0).to_numpy(dtype=float)
+
+
+def salary_earnings(salary_structures: List[Optional[dict]]) -> pd.DataFrame:
+    """Earnings columns from salary structures; a zero or missing field uses its legacy name"""
+    salaries = _records_frame(salary_structures)
+    earnings = pd.DataFrame(index=salaries.index)
+    for field, legacy_field in EARNING_FIELDS.items():
+        value = _numeric(salaries, field)
+        earnings[field] = value.where(value != 0, _numeric(salaries, legacy_field))
+    return earnings
+
+
+def salary_deductions(salary_structures: List[Optional[dict]]) -> pd.DataFrame:
+    """Deduction columns as configured on the salary structures"""
+    salaries = _records_frame(salary_structures)
+    deductions = pd.DataFrame(index=salaries.index)
+    for field in DEDUCTION_FIELDS:
+        deductions[field] = _numeric(salaries, field)
+    return deductions
+
+
+def _result(earnings: pd.DataFrame, deductions: pd.DataFrame, gross, total_deductions, net) -> dict:
+    return {
+        "earnings": earnings.to_dict("records"),
+        "deductions": deductions.to_dict("records"),
+        "gross_salary": np.asarray(gross, dtype=float).tolist(),
+        "total_deductions": np.asarray(total_deductions, dtype=float).tolist(),
+        "net_salary": np.asarray(net, dtype=float).tolist(),
+    }
+
+
+def compute_salary_payslips(salary_structures: List[Optional[dict]]) -> dict:
+    """
+    Payslips straight from salary structures.
+    Returns lists aligned with the input: earnings, deductions, gross_salary,
+    total_deductions and net_salary.
+    """
+    earnings = salary_earnings(salary_structures)
+    deductions = salary_deductions(salary_structures)
+    gross = earnings.sum(axis=1)
+    total_deductions = deductions.sum(axis=1)
+    return _result(earnings, deductions, gross, total_deductions, gross - total_deductions)
+
+
+def compute_payroll_run(
+    salary_structures: List[Optional[dict]],
+    tds: List[float],
+    loan_deductions: List[float],
+    bonus: List[float],
+    adjustments: List[float],
+) -> dict:
+    """
+    Payroll run rows: TDS and loan deductions come from the payroll form, and bonus
+    and adjustments are applied to the net salary.
+    """
+    size = len(salary_structures)
+    earnings = salary_earnings(salary_structures)
+    deductions = salary_deductions(salary_structures)
+    deductions["tds"] = _numeric_array(tds, size)
+    deductions["loan_deductions"] = _numeric_array(loan_deductions, size)
+
+    gross = earnings.sum(axis=1)
+    total_deductions = deductions.sum(axis=1)
+    net = gross - total_deductions + _numeric_array(bonus, size) + _numeric_array(adjustments, size)
+    return _result(earnings, deductions, gross, total_deductions, net)
+
+
+def compute_prorated_payslips(
+    earnings_records: List[Optional[dict]],
+    deductions_records: List[Optional[dict]],
+    days_worked: List[float],
+    days_in_month: int,
+    bonus: List[float],
+    adjustments: List[float],
+) -> dict:
+    """
+    Payslips from payroll run rows with pro-ration.
+    Only employees who worked less than the full month are prorated (each component
+    rounded to 2 decimals); bonus is added to other_benefits and the absolute
+    adjustment to the other deductions. Totals are rounded to 2 decimals.
+    """
+    size = len(earnings_records)
+    original_earnings = _records_frame(earnings_records)
+    original_deductions = _records_frame(deductions_records)
+    worked = _numeric_array(days_worked, size)
+    bonus_values = _numeric_array(bonus, size)
+    adjustment_values = _numeric_array(adjustments, size)
+
+    # Indian payroll logic: a full month worked keeps the full salary
+    full_month = worked >= days_in_month
+
+    earnings = pd.DataFrame(index=original_earnings.index)
+    for field in EARNING_FIELDS:
+        value = _numeric(original_earnings, field).to_numpy()
+        if field == "other_benefits":
+            prorated = np.round(value / days_in_month * worked + bonus_values, 2)
+            earnings[field] = np.where(full_month, value + bonus_values, prorated)
+        else:
+            earnings[field] = np.where(full_month, value, np.round(value / days_in_month * worked, 2))
+
+    deductions = pd.DataFrame(index=original_deductions.index)
+    for field in DEDUCTION_FIELDS:
+        deductions[field] = _numeric(original_deductions, field)
+    deductions["others"] = deductions["others"] + np.abs(adjustment_values)
+
+    gross = earnings.sum(axis=1).to_numpy()
+    total_deductions = deductions.sum(axis=1).to_numpy()
+    net = gross - total_deductions
+    return _result(earnings, deductions, np.round(gross, 2), np.round(total_deductions, 2), np.round(net, 2))
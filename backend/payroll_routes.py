@@ -0,0 +1,2165 @@
+"""
+Payroll Routes
+Payslip generation, payroll runs, payroll Excel import, payslip PDFs and
+bulk payslip email
+
+pandas (payroll_engine), reportlab (payslip_pdf), openpyxl and aiosmtplib are
+imported inside the functions that use them, so loading this module stays cheap.
+"""
+
+import os
+import json
+import logging
+import asyncio
+import time
+import uuid
+import io
+import hashlib
+import calendar
+import shutil
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+from email import encoders
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.mime.base import MIMEBase
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from pymongo import UpdateOne
+
+from server import (
+    DashboardCounterBatch, db, get_current_user, increment_employee_dashboard_counters,
+    NotificationBatch, notify_payslip_generated, notify_payslips_bulk_generated,
+    PayrollRunRequest, payslip_removal_counters, PayslipGenerate, prepare_for_mongo,
+    prepare_from_mongo, require_role, ROOT_DIR, SMTP_BCC, SMTP_FROM, SMTP_HOST,
+    SMTP_PASSWORD, SMTP_POOL_SIZE, SMTP_PORT, SMTP_RATE_BURST, SMTP_RATE_PER_SECOND,
+    SMTP_START_TLS, SMTP_USER, User, UserRole,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Payroll"])
+
+# Payslip endpoints
+@router.post("/payslips/generate")
+async def generate_payslips(
+    request: PayslipGenerate,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Generate payslips for active employees"""
+    from payroll_engine import compute_salary_payslips
+
+    try:
+        # Get active employees
+        if request.employee_ids:
+            employees = await db.employees.find(
+                {"employee_id": {"$in": request.employee_ids}, "status": "active"}
+            ).to_list(length=None)
+        else:
+            employees = await db.employees.find({"status": "active"}).to_list(length=None)
+        
+        generated_count = 0
+        updated_count = 0
+        counter_batch = DashboardCounterBatch()
+        period_field = f"payslips_by_period.{request.year}-{request.month:02d}"
+        
+        employees = [employee for employee in employees if employee.get('salary_structure')]
+        payslip_ids = [f"{employee['employee_id']}-{request.year}-{request.month:02d}" for employee in employees]
+        
+        # Check which payslips already exist
+        existing_ids = {
+            payslip["id"] for payslip in
+            await db.payslips.find({"id": {"$in": payslip_ids}}, {"_id": 0, "id": 1}).to_list(length=None)
+        }
+        
+        # Calculate earnings, deductions and totals for every employee at once
+        computed = compute_salary_payslips([employee['salary_structure'] for employee in employees])
+        
+        now = datetime.now(timezone.utc)
+        writes = []
+        for index, employee in enumerate(employees):
+            payslip_id = payslip_ids[index]
+            payslip_data = {
+                "id": payslip_id,
+                "employee_id": employee['employee_id'],
+                "month": request.month,
+                "year": request.year,
+                "gross_salary": computed["gross_salary"][index],
+                "total_deductions": computed["total_deductions"][index],
+                "net_salary": computed["net_salary"][index],
+                "earnings": computed["earnings"][index],
+                "deductions": computed["deductions"][index],
+                "status": "generated"
+            }
+            
+            if payslip_id in existing_ids:
+                payslip_data["updated_date"] = now
+                updated_count += 1
+            else:
+                payslip_data["generated_date"] = now
+                generated_count += 1
+                counter_batch.add(employee.get("company_id"), period_field)
+            writes.append(UpdateOne({"id": payslip_id}, {"$set": prepare_for_mongo(payslip_data)}, upsert=True))
+        
+        if writes:
+            await db.payslips.bulk_write(writes, ordered=False)
+        
+        await counter_batch.flush()
+        
+        # Notify employees about payslip generation (for both new and updated)
+        month_names = ["", "January", "February", "March", "April", "May", "June",
+                      "July", "August", "September", "October", "November", "December"]
+        month_name = month_names[request.month]
+        notification_batch = NotificationBatch()
+        for employee in employees:
+            await notify_payslip_generated(
+                employee_id=employee['employee_id'],
+                month=month_name,
+                year=request.year,
+                batch=notification_batch
+            )
+        
+        # Notify admins about bulk payslip generation
+        if generated_count > 0 or updated_count > 0:
+            await notify_payslips_bulk_generated(
+                employee_count=generated_count + updated_count,
+                month=month_name,
+                year=request.year,
+                batch=notification_batch
+            )
+        await notification_batch.flush()
+        
+        return {
+            "message": f"Payslips processed: {generated_count} generated, {updated_count} updated",
+            "generated_count": generated_count,
+            "updated_count": updated_count,
+            "total_employees": len(employees)
+        }
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate payslips: {str(e)}"
+        )
+
+@router.get("/payslips")
+async def get_payslips(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    employee_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Get payslips for the specified period or employee"""
+    try:
+        query = {"status": "generated"}
+        if month:
+            query["month"] = month
+        if year:
+            query["year"] = year
+        if employee_id:
+            query["employee_id"] = employee_id
+            
+        payslips = await db.payslips.find(query).to_list(length=None)
+        
+        # Get employee details for each payslip and clean MongoDB data
+        for payslip in payslips:
+            employee = await db.employees.find_one({"employee_id": payslip["employee_id"]})
+            if employee:
+                payslip["employee"] = prepare_from_mongo(employee)
+        
+        # Clean payslips data for JSON serialization
+        cleaned_payslips = [prepare_from_mongo(payslip) for payslip in payslips]
+        
+        return cleaned_payslips
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch payslips: {str(e)}"
+        )
+
+@router.delete("/payslips/{payslip_id}")
+async def delete_payslip(
+    payslip_id: str,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Delete a specific payslip"""
+    try:
+        payslip = await db.payslips.find_one_and_delete({"id": payslip_id})
+        
+        if not payslip:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Payslip not found"
+            )
+        
+        if payslip.get("year") and payslip.get("month"):
+            await increment_employee_dashboard_counters(
+                payslip["employee_id"],
+                {f"payslips_by_period.{int(payslip['year'])}-{int(payslip['month']):02d}": -1}
+            )
+            await payslip_pdf_cache.invalidate(payslip["year"], payslip["month"], payslip["employee_id"])
+        
+        return {"message": "Payslip deleted successfully"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to delete payslip: {str(e)}"
+        )
+
+@router.delete("/payslips")
+async def clear_all_payslips(
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Clear all payslips"""
+    try:
+        removed_counters = await payslip_removal_counters({})
+        result = await db.payslips.delete_many({})
+        await removed_counters.flush()
+        await payslip_pdf_cache.invalidate()
+        
+        return {
+            "message": f"Deleted {result.deleted_count} payslips",
+            "deleted_count": result.deleted_count
+        }
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to clear payslips: {str(e)}"
+        )
+
+@router.delete("/payslips/month/{month}/{year}")
+async def delete_payslips_by_month(
+    month: int,
+    year: int,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Delete all payslips for a specific month and year"""
+    try:
+        period_query = {"month": month, "year": year}
+        removed_counters = await payslip_removal_counters(period_query)
+        result = await db.payslips.delete_many(period_query)
+        await removed_counters.flush()
+        await payslip_pdf_cache.invalidate(year, month)
+        
+        return {
+            "message": f"Deleted {result.deleted_count} payslips for {month}/{year}",
+            "deleted_count": result.deleted_count,
+            "month": month,
+            "year": year
+        }
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to delete payslips: {str(e)}"
+        )
+
+@router.put("/payslips/{payslip_id}/regenerate")
+async def regenerate_payslip(
+    payslip_id: str,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Regenerate a specific payslip"""
+    try:
+        # Get existing payslip
+        payslip = await db.payslips.find_one({"id": payslip_id})
+        if not payslip:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Payslip not found"
+            )
+        
+        # Get employee data
+        employee = await db.employees.find_one({"employee_id": payslip["employee_id"]})
+        if not employee or employee.get("status") != "active":
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Employee not found or not active"
+            )
+        
+        # Regenerate payslip with current employee data
+        request_data = PayslipGenerate(
+            month=payslip["month"],
+            year=payslip["year"],
+            employee_ids=[payslip["employee_id"]]
+        )
+        
+        # This will update the existing payslip
+        result = await generate_payslips(request_data, current_user)
+        await payslip_pdf_cache.invalidate(payslip["year"], payslip["month"], payslip["employee_id"], employee.get("company_id"))
+        
+        return {"message": "Payslip regenerated successfully"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to regenerate payslip: {str(e)}"
+        )
+
+# Payroll Processing Endpoints
+@router.get("/payroll/check-exists")
+async def check_payroll_exists(
+    month: int,
+    year: int,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Check if payroll run already exists for the given month/year"""
+    try:
+        existing_run = await db.payroll_runs.find_one({
+            "month": month,
+            "year": year
+        })
+        
+        if existing_run:
+            return {
+                "exists": True,
+                "payroll_run_id": existing_run["id"],
+                "total_employees": existing_run.get("total_employees", 0),
+                "processed_date": existing_run.get("processed_date")
+            }
+        else:
+            return {"exists": False}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to check payroll existence: {str(e)}"
+        )
+
+@router.delete("/payroll/run/{payroll_run_id}")
+async def delete_payroll_run(
+    payroll_run_id: str,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Delete a payroll run and its associated payslips"""
+    try:
+        # Get payroll run details first
+        payroll_run = await db.payroll_runs.find_one({"id": payroll_run_id})
+        if not payroll_run:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Payroll run not found"
+            )
+        
+        # Delete associated payslips
+        month = payroll_run["month"]
+        year = payroll_run["year"]
+        period_query = {"month": month, "year": year}
+        removed_counters = await payslip_removal_counters(period_query)
+        await db.payslips.delete_many(period_query)
+        await removed_counters.flush()
+        
+        # Delete payroll run
+        await db.payroll_runs.delete_one({"id": payroll_run_id})
+        await payslip_pdf_cache.invalidate(year, month)
+        
+        return {
+            "message": "Payroll run and associated payslips deleted successfully"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to delete payroll run: {str(e)}"
+        )
+
+@router.post("/payroll/run")
+@router.post("/payroll-runs")
+async def run_payroll(
+    payroll_request: PayrollRunRequest,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Process and save payroll run"""
+    from payroll_engine import compute_payroll_run
+
+    try:
+        # Check for existing payroll run and delete if exists
+        existing_run = await db.payroll_runs.find_one({
+            "month": payroll_request.month,
+            "year": payroll_request.year
+        })
+        
+        if existing_run:
+            # Delete old payroll run and its payslips
+            period_query = {"month": payroll_request.month, "year": payroll_request.year}
+            removed_counters = await payslip_removal_counters(period_query)
+            await db.payslips.delete_many(period_query)
+            await removed_counters.flush()
+            await db.payroll_runs.delete_one({"id": existing_run["id"]})
+        
+        # Load every submitted employee in one query; inactive or unknown ones are skipped
+        submitted_ids = [emp_data.employee_id for emp_data in payroll_request.employees]
+        employees = await db.employees.find(
+            {"employee_id": {"$in": submitted_ids}},
+            {"_id": 0, "employee_id": 1, "status": 1, "salary_structure": 1}
+        ).to_list(length=None)
+        employees_by_id = {employee["employee_id"]: employee for employee in employees}
+        
+        payroll_rows = [
+            emp_data for emp_data in payroll_request.employees
+            if employees_by_id.get(emp_data.employee_id, {}).get('status') == 'active'
+        ]
+        
+        # Same earnings logic as payslip generation; TDS and loan deductions come from the payroll form
+        computed = compute_payroll_run(
+            [employees_by_id[emp_data.employee_id].get('salary_structure', {}) for emp_data in payroll_rows],
+            tds=[emp_data.tds for emp_data in payroll_rows],
+            loan_deductions=[emp_data.loan_deductions for emp_data in payroll_rows],
+            bonus=[emp_data.bonus for emp_data in payroll_rows],
+            adjustments=[emp_data.adjustments for emp_data in payroll_rows]
+        )
+        
+        processed_employees = []
+        for index, emp_data in enumerate(payroll_rows):
+            processed_employees.append({
+                "employee_id": emp_data.employee_id,
+                "days_worked": emp_data.days_worked,
+                "days_in_month": emp_data.days_in_month,
+                "overtime_hours": emp_data.overtime_hours,
+                "bonus": emp_data.bonus,
+                "adjustments": emp_data.adjustments,
+                "loan_deductions": emp_data.loan_deductions,
+                "tds": emp_data.tds,
+                "gross_salary": computed["gross_salary"][index],
+                "total_deductions": computed["total_deductions"][index],
+                "net_salary": computed["net_salary"][index],
+                "earnings": computed["earnings"][index],
+                "deductions": computed["deductions"][index]
+            })
+        
+        total_gross = sum(computed["gross_salary"])
+        total_deductions = sum(computed["total_deductions"])
+        total_net = sum(computed["net_salary"])
+        
+        # Create payroll run record
+        payroll_run = {
+            "id": str(uuid.uuid4()),
+            "month": payroll_request.month,
+            "year": payroll_request.year,
+            "employees": processed_employees,
+            "total_employees": len(processed_employees),
+            "total_gross": total_gross,
+            "total_deductions": total_deductions,
+            "total_net": total_net,
+            "status": "completed",
+            "processed_date": datetime.now(timezone.utc),
+            "processed_by": current_user.username
+        }
+        
+        prepared_data = prepare_for_mongo(payroll_run)
+        await db.payroll_runs.insert_one(prepared_data)
+        
+        return {
+            "message": "Payroll run completed successfully",
+            "payroll_run_id": payroll_run["id"],
+            "total_employees": len(processed_employees),
+            "total_net": total_net
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to process payroll: {str(e)}"
+        )
+
+@router.get("/payroll-runs")
+async def get_payroll_runs(
+    month: Optional[int] = None,
+    year: Optional[int] = None,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Get payroll runs, optionally filtered by month and year"""
+    try:
+        query = {}
+        if month is not None:
+            query["month"] = month
+        if year is not None:
+            query["year"] = year
+        
+        payroll_runs = await db.payroll_runs.find(query, {"_id": 0}).sort("processed_date", -1).to_list(length=None)
+        
+        # Enrich with employee details
+        for run in payroll_runs:
+            for emp_data in run.get("employees", []):
+                employee = await db.employees.find_one(
+                    {"employee_id": emp_data["employee_id"]},
+                    {"_id": 0}
+                )
+                if employee:
+                    emp_data["employee_name"] = employee.get("name", "")
+                    bank_info = employee.get("bank_info", {})
+                    emp_data["account_number"] = bank_info.get("account_number", "")
+                    emp_data["ifsc_code"] = bank_info.get("ifsc_code", "")
+                    emp_data["bank_name"] = bank_info.get("bank_name", "")
+                    emp_data["branch"] = bank_info.get("branch", "")
+        
+        return payroll_runs
+    except Exception as e:
+        logging.error(f"Error fetching payroll runs: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch payroll runs: {str(e)}"
+        )
+
+@router.get("/payroll/history")
+async def get_payroll_history(
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Get payroll run history"""
+    try:
+        # Get all payroll runs, sorted by date (newest first)
+        payroll_runs = await db.payroll_runs.find({}, {"_id": 0}).sort("processed_date", -1).to_list(length=None)
+        
+        return payroll_runs
+    except Exception as e:
+        logging.error(f"Error fetching payroll history: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch payroll history: {str(e)}"
+        )
+
+@router.get("/payroll/history/{payroll_run_id}")
+async def get_payroll_run_details(
+    payroll_run_id: str,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Get detailed information for a specific payroll run"""
+    try:
+        payroll_run = await db.payroll_runs.find_one({"id": payroll_run_id}, {"_id": 0})
+        if not payroll_run:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Payroll run not found"
+            )
+        
+        return payroll_run
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error fetching payroll run details: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to fetch payroll run details: {str(e)}"
+        )
+
+@router.post("/payroll/{payroll_run_id}/generate-payslips")
+async def generate_payslips_from_payroll(
+    payroll_run_id: str,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Generate payslips from a completed payroll run with pro-ration"""
+    from payroll_engine import compute_prorated_payslips
+
+    try:
+        # Get payroll run
+        payroll_run = await db.payroll_runs.find_one({"id": payroll_run_id})
+        if not payroll_run:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Payroll run not found"
+            )
+        
+        # Calculate actual days in the month
+        from calendar import monthrange
+        actual_days_in_month = monthrange(payroll_run["year"], payroll_run["month"])[1]
+        
+        generated_count = 0
+        updated_count = 0
+        counter_batch = DashboardCounterBatch()
+        period_field = f"payslips_by_period.{payroll_run['year']}-{payroll_run['month']:02d}"
+        
+        payroll_rows = payroll_run["employees"]
+        employee_ids = [emp_data["employee_id"] for emp_data in payroll_rows]
+        payslip_ids = [f"{employee_id}-{payroll_run['year']}-{payroll_run['month']:02d}" for employee_id in employee_ids]
+        
+        # Batch-load existing payslips and employee details (for name, designation, etc.)
+        existing_ids = {
+            payslip["id"] for payslip in
+            await db.payslips.find({"id": {"$in": payslip_ids}}, {"_id": 0, "id": 1}).to_list(length=None)
+        }
+        employees = await db.employees.find(
+            {"employee_id": {"$in": employee_ids}},
+            {
+                "_id": 0, "employee_id": 1, "company_id": 1, "name": 1, "designation": 1, "department": 1,
+                "date_of_joining": 1, "bank_info": 1, "pan_number": 1
+            }
+        ).to_list(length=None)
+        employees_by_id = {employee["employee_id"]: employee for employee in employees}
+        
+        # Pro-rate earnings and apply bonus/adjustments for every employee at once
+        days_worked = [emp_data.get("days_worked", actual_days_in_month) for emp_data in payroll_rows]
+        bonus = [emp_data.get("bonus", 0) for emp_data in payroll_rows]
+        adjustments = [emp_data.get("adjustments", 0) for emp_data in payroll_rows]
+        computed = compute_prorated_payslips(
+            [emp_data.get("earnings", {}) for emp_data in payroll_rows],
+            [emp_data.get("deductions", {}) for emp_data in payroll_rows],
+            days_worked,
+            actual_days_in_month,
+            bonus,
+            adjustments
+        )
+        
+        now = datetime.now(timezone.utc)
+        writes = []
+        for index, emp_data in enumerate(payroll_rows):
+            payslip_id = payslip_ids[index]
+            employee = employees_by_id.get(emp_data["employee_id"])
+            
+            # Create comprehensive payslip data
+            payslip_data = {
+                "id": payslip_id,
+                "employee_id": emp_data["employee_id"],
+                "month": payroll_run["month"],
+                "year": payroll_run["year"],
+                "days_worked": days_worked[index],
+                "days_in_month": actual_days_in_month,
+                "earnings": computed["earnings"][index],  # Bonus already included in other_benefits
+                "deductions": computed["deductions"][index],  # Adjustments already included in others
+                "bonus": bonus[index],  # Store for reference
+                "adjustments": adjustments[index],  # Store for reference
+                "gross_salary": computed["gross_salary"][index],
+                "total_deductions": computed["total_deductions"][index],
+                "net_salary": computed["net_salary"][index],
+                "status": "generated",
+                "employee_details": {
+                    "name": employee.get("name") if employee else "Unknown",
+                    "employee_id": emp_data["employee_id"],
+                    "designation": employee.get("designation") if employee else "N/A",
+                    "department": employee.get("department") if employee else "N/A",
+                    "date_of_joining": employee.get("date_of_joining") if employee else None,
+                    "pan": employee.get("bank_info", {}).get("pan") or employee.get("pan_number") if employee else "N/A",
+                    "bank_account": employee.get("bank_info", {}).get("account_number") if employee else "N/A",
+                    "ifsc": employee.get("bank_info", {}).get("ifsc_code") if employee else "N/A"
+                }
+            }
+            
+            if payslip_id in existing_ids:
+                payslip_data["updated_date"] = now
+                updated_count += 1
+            else:
+                payslip_data["generated_date"] = now
+                generated_count += 1
+                counter_batch.add(employee.get("company_id") if employee else None, period_field)
+            writes.append(UpdateOne({"id": payslip_id}, {"$set": prepare_for_mongo(payslip_data)}, upsert=True))
+        
+        if writes:
+            await db.payslips.bulk_write(writes, ordered=False)
+        
+        await counter_batch.flush()
+        
+        # Notify employees and admins once the payslips are stored
+        month_name = calendar.month_name[payroll_run["month"]]
+        notification_batch = NotificationBatch()
+        for employee_id in employee_ids:
+            await notify_payslip_generated(
+                employee_id=employee_id,
+                month=month_name,
+                year=payroll_run["year"],
+                batch=notification_batch
+            )
+        if writes:
+            await notify_payslips_bulk_generated(
+                employee_count=len(writes),
+                month=month_name,
+                year=payroll_run["year"],
+                batch=notification_batch
+            )
+        await notification_batch.flush()
+        
+        return {
+            "message": f"Payslips processed: {generated_count} generated, {updated_count} updated",
+            "generated_count": generated_count,
+            "updated_count": updated_count,
+            "total_employees": len(payroll_run["employees"])
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate payslips from payroll: {str(e)}"
+        )
+
+# Migration endpoint for salary structure
+@router.post("/migrate-salary-structure")
+async def migrate_salary_structure(current_user: User = Depends(require_role(UserRole.ADMIN))):
+    """Migrate existing salary structure to new field names"""
+    try:
+        employees = await db.employees.find({"salary_structure": {"$exists": True}}).to_list(length=None)
+        migrated_count = 0
+        
+        for employee in employees:
+            salary = employee.get('salary_structure', {})
+            
+            # Check if migration is needed
+            if 'hra' in salary and 'house_rent_allowance' not in salary:
+                # Migrate old field names to new ones
+                update_data = {
+                    "salary_structure.house_rent_allowance": salary.get('hra', 0),
+                    "salary_structure.leave_travel_allowance": salary.get('travel_allowance', 0),
+                    "salary_structure.conveyance_allowance": salary.get('food_allowance', 0),
+                    "salary_structure.performance_incentive": salary.get('internet_allowance', 0),
+                    "salary_structure.other_benefits": salary.get('special_allowance', 0),
+                    "salary_structure.loan_deductions": 0,
+                    "salary_structure.others": 0,
+                    "updated_at": datetime.now(timezone.utc)
+                }
+                
+                update_data = prepare_for_mongo(update_data)
+                
+                await db.employees.update_one(
+                    {"employee_id": employee['employee_id']},
+                    {"$set": update_data}
+                )
+                migrated_count += 1
+        
+        return {"message": f"Successfully migrated {migrated_count} employee salary structures"}
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Migration failed: {str(e)}"
+        )
+
+# Admin PIN management endpoints
+
+
+@router.get("/payroll/download-template")
+async def download_payroll_template(
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Download Excel template for payroll import"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+    try:
+        # Create workbook
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Payroll Data"
+        
+        # Define headers
+        headers = [
+            "Payroll Date (Last Day of Month)",
+            "Employee ID",
+            "Full Name",
+            "Basic",
+            "House Rent Allowance",
+            "Medical Allowance",
+            "Leave Travel Allowance",
+            "Bonus",
+            "Performance Incentive",
+            "Other Benefits",
+            "Provident Fund",
+            "Profession Tax",
+            "ESI",
+            "Advances/Loans",
+            "Income Tax",
+            "Other Deductions"
+        ]
+        
+        # Style for headers
+        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+        header_font = Font(bold=True, color="FFFFFF", size=11)
+        border = Border(
+            left=Side(style='thin'),
+            right=Side(style='thin'),
+            top=Side(style='thin'),
+            bottom=Side(style='thin')
+        )
+        
+        # Write headers
+        for col_num, header in enumerate(headers, 1):
+            cell = ws.cell(row=1, column=col_num)
+            cell.value = header
+            cell.fill = header_fill
+            cell.font = header_font
+            cell.alignment = Alignment(horizontal='center', vertical='center')
+            cell.border = border
+            
+            # Set column widths
+            ws.column_dimensions[cell.column_letter].width = 20
+        
+        # Add sample data row with Excel date
+        from datetime import datetime as dt
+        # Last day of October 2025 as Excel date
+        sample_date = dt(2025, 10, 31)
+        
+        sample_data = [
+            sample_date,  # Month/Year (Excel date - last day of month)
+            "ET-MUM-00001",  # Employee ID
+            "John Doe",  # Full Name
+            50000,  # Basic
+            20000,  # HRA
+            1250,  # Medical
+            2000,  # LTA
+            1600,  # Bonus
+            5000,  # Performance Incentive
+            2000,  # Other Benefits
+            6000,  # PF
+            200,  # PT
+            0,  # ESI
+            0,  # Advances/Loans
+            5000,  # Income Tax
+            0   # Other Deductions
+        ]
+        
+        for col_num, value in enumerate(sample_data, 1):
+            cell = ws.cell(row=2, column=col_num)
+            cell.value = value
+            cell.border = border
+            if col_num == 1:  # Date column
+                cell.number_format = 'DD/MM/YYYY'
+            elif col_num > 3:  # Numeric columns
+                cell.number_format = '#,##0.00'
+        
+        # Add instructions sheet
+        ws2 = wb.create_sheet("Instructions")
+        instructions = [
+            ["Payroll Import Template - Instructions", ""],
+            ["", ""],
+            ["Column", "Description"],
+            ["Month/Year", "Excel date format (use last date of payroll month, e.g., 31/10/2025 for October 2025). Can also use MM/YYYY text format."],
+            ["Employee ID", "Must match existing employee ID in the system"],
+            ["Full Name", "Employee's full name (for reference only)"],
+            ["Basic", "Basic salary amount"],
+            ["House Rent Allowance", "HRA amount"],
+            ["Medical Allowance", "Medical allowance amount"],
+            ["Leave Travel Allowance", "LTA amount"],
+            ["Bonus", "Bonus amount"],
+            ["Performance Incentive", "Performance bonus/incentive amount"],
+            ["Other Benefits", "Any other earnings"],
+            ["Provident Fund", "Employee PF contribution (deduction)"],
+            ["Profession Tax", "Professional tax (deduction)"],
+            ["ESI", "Employee ESI contribution (deduction)"],
+            ["Advances/Loans", "Loan EMI deduction for the month"],
+            ["Income Tax", "TDS/Income tax (deduction)"],
+            ["Other Deductions", "Any other deductions"],
+            ["", ""],
+            ["Important Notes:", ""],
+            ["1.", "Date Format: Use Excel date (last day of month) OR MM/YYYY text format"],
+            ["2.", "Example: For October 2025 payroll, use 31/10/2025 as an Excel date"],
+            ["3.", "Employee ID must exist in the system"],
+            ["4.", "All amounts should be numeric values only"],
+            ["5.", "Gross Salary = Sum of all earnings columns"],
+            ["6.", "Net Salary = Gross Salary - Sum of all deductions"],
+            ["7.", "Importing will create/update payslips for the specified month"],
+        ]
+        
+        for row_num, instruction in enumerate(instructions, 1):
+            ws2.cell(row=row_num, column=1).value = instruction[0]
+            ws2.cell(row=row_num, column=2).value = instruction[1]
+            if row_num == 1:
+                ws2.cell(row=row_num, column=1).font = Font(bold=True, size=14)
+            elif row_num == 3:
+                ws2.cell(row=row_num, column=1).font = Font(bold=True)
+                ws2.cell(row=row_num, column=2).font = Font(bold=True)
+        
+        ws2.column_dimensions['A'].width = 25
+        ws2.column_dimensions['B'].width = 60
+        
+        # Save to BytesIO
+        output = io.BytesIO()
+        wb.save(output)
+        output.seek(0)
+        
+        # Return as downloadable file
+        return StreamingResponse(
+            output,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": "attachment; filename=Payroll_Import_Template.xlsx"}
+        )
+        
+    except Exception as e:
+        logging.error(f"Error generating payroll template: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate template: {str(e)}"
+        )
+
+
+@router.post("/payroll/import-excel")
+async def import_payroll_from_excel(
+    file: UploadFile = File(...),
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Import payroll data from Excel file"""
+    from openpyxl import load_workbook
+
+    try:
+        # Validate file type
+        if not file.filename.endswith(('.xlsx', '.xls')):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid file type. Please upload an Excel file (.xlsx or .xls)"
+            )
+        
+        # Read Excel file
+        contents = await file.read()
+        wb = load_workbook(io.BytesIO(contents))
+        ws = wb.active
+        
+        # Parse data
+        imported_count = 0
+        error_count = 0
+        errors = []
+        
+        # Get ALL employees (including inactive) for validation
+        employees = await db.employees.find({}).to_list(length=None)
+        employee_dict = {emp["employee_id"]: emp for emp in employees}
+        counter_batch = DashboardCounterBatch()
+        notification_batch = NotificationBatch()
+        
+        # Process rows (skip header)
+        for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+            try:
+                if not row[0] or not row[1]:  # Skip empty rows
+                    continue
+                
+                # Parse month/year from Excel date
+                month_year_value = row[0]
+                try:
+                    # Check if it's an Excel date (datetime object or number)
+                    if isinstance(month_year_value, datetime):
+                        # Already a datetime object
+                        month = month_year_value.month
+                        year = month_year_value.year
+                    elif isinstance(month_year_value, (int, float)):
+                        # Excel serial date number
+                        # Excel's epoch is 1899-12-30, but Python's datetime.fromordinal starts from 0001-01-01
+                        # Excel serial 1 = 1900-01-01, but Excel incorrectly treats 1900 as a leap year
+                        # So we adjust: Excel date = Python ordinal date - 693594 + 1
+                        from datetime import datetime as dt
+                        excel_epoch = dt(1899, 12, 30)
+                        date_obj = excel_epoch + timedelta(days=month_year_value)
+                        month = date_obj.month
+                        year = date_obj.year
+                    elif isinstance(month_year_value, str):
+                        # String format MM/YYYY or similar
+                        month_year_str = month_year_value.strip()
+                        if '/' in month_year_str:
+                            parts = month_year_str.split('/')
+                            month = int(parts[0])
+                            year = int(parts[1])
+                        elif '-' in month_year_str:
+                            parts = month_year_str.split('-')
+                            month = int(parts[0])
+                            year = int(parts[1])
+                        else:
+                            errors.append(f"Row {row_num}: Invalid date format. Use MM/YYYY or Excel date")
+                            error_count += 1
+                            continue
+                    else:
+                        errors.append(f"Row {row_num}: Unrecognized date format")
+                        error_count += 1
+                        continue
+                    
+                    # Validate month and year
+                    if not (1 <= month <= 12):
+                        errors.append(f"Row {row_num}: Invalid month {month}. Must be between 1 and 12")
+                        error_count += 1
+                        continue
+                    if year < 2000 or year > 2100:
+                        errors.append(f"Row {row_num}: Invalid year {year}")
+                        error_count += 1
+                        continue
+                        
+                except Exception as e:
+                    errors.append(f"Row {row_num}: Error parsing date - {str(e)}")
+                    error_count += 1
+                    continue
+                
+                # Validate minimum columns exist (at least Employee ID)
+                if len(row) < 2:
+                    errors.append(f"Row {row_num}: Insufficient columns (need at least 2)")
+                    error_count += 1
+                    continue
+                
+                employee_id = str(row[1]).strip() if row[1] else ""
+                
+                if not employee_id:
+                    errors.append(f"Row {row_num}: Employee ID is empty")
+                    error_count += 1
+                    continue
+                
+                # Validate employee exists
+                if employee_id not in employee_dict:
+                    errors.append(f"Row {row_num}: Employee ID '{employee_id}' not found in system")
+                    error_count += 1
+                    continue
+                
+                employee = employee_dict[employee_id]
+                
+                # Helper function to safely get column value (defaults to 0 for empty/missing)
+                def get_col_value(row, index, default=0):
+                    try:
+                        if len(row) > index and row[index] is not None:
+                            value = row[index]
+                            # Handle empty strings or whitespace
+                            if isinstance(value, str):
+                                value = value.strip()
+                                if not value:
+                                    return default
+                            return float(value)
+                        return default
+                    except (ValueError, TypeError):
+                        return default
+                
+                # Parse earnings (columns 3-9)
+                basic = get_col_value(row, 3)
+                hra = get_col_value(row, 4)
+                medical = get_col_value(row, 5)
+                lta = get_col_value(row, 6)
+                conveyance = get_col_value(row, 7)
+                performance_incentive = get_col_value(row, 8)
+                other_benefits = get_col_value(row, 9)
+                
+                # Parse deductions (columns 10-15)
+                pf = get_col_value(row, 10)
+                pt = get_col_value(row, 11)
+                esi = get_col_value(row, 12)
+                loans = get_col_value(row, 13)
+                income_tax = get_col_value(row, 14)
+                other_deductions = get_col_value(row, 15)
+                
+                # Calculate totals
+                earnings = {
+                    "basic_salary": basic,
+                    "house_rent_allowance": hra,
+                    "medical_allowance": medical,
+                    "leave_travel_allowance": lta,
+                    "conveyance_allowance": conveyance,
+                    "performance_incentive": performance_incentive,
+                    "other_benefits": other_benefits
+                }
+                
+                deductions = {
+                    "pf_employee": pf,
+                    "professional_tax": pt,
+                    "esi_employee": esi,
+                    "loan_deductions": loans,
+                    "tds": income_tax,
+                    "others": other_deductions
+                }
+                
+                gross_salary = sum(earnings.values())
+                total_deductions = sum(deductions.values())
+                net_salary = gross_salary - total_deductions
+                
+                # Create or update payslip
+                payslip_data = {
+                    "id": str(uuid.uuid4()),
+                    "employee_id": employee_id,
+                    "employee_name": employee.get("name"),
+                    "month": month,
+                    "year": year,
+                    "earnings": earnings,
+                    "deductions": deductions,
+                    "gross_salary": gross_salary,
+                    "total_deductions": total_deductions,
+                    "net_salary": net_salary,
+                    "generated_date": datetime.now(timezone.utc),
+                    "status": "generated"
+                }
+                
+                # Check if payslip already exists
+                existing = await db.payslips.find_one({
+                    "employee_id": employee_id,
+                    "month": month,
+                    "year": year
+                })
+                
+                if existing:
+                    # Update existing
+                    await db.payslips.update_one(
+                        {"employee_id": employee_id, "month": month, "year": year},
+                        {"$set": payslip_data}
+                    )
+                else:
+                    # Insert new
+                    await db.payslips.insert_one(payslip_data)
+                    counter_batch.add(employee.get("company_id"), f"payslips_by_period.{year}-{month:02d}")
+                
+                # Queue notification for employee; sent once the import finishes
+                notification_batch.add(
+                    title="Payslip Generated",
+                    message=f"Your payslip for {month}/{year} has been generated",
+                    recipient_id=employee_id,
+                    recipient_role="employee",
+                    notification_type="success",
+                    category="payslip"
+                )
+                
+                imported_count += 1
+                
+            except Exception as e:
+                errors.append(f"Row {row_num}: {str(e)}")
+                error_count += 1
+        
+        await counter_batch.flush()
+        await notification_batch.flush()
+        
+        return {
+            "success": True,
+            "imported_count": imported_count,
+            "error_count": error_count,
+            "errors": errors[:20]  # Return first 20 errors
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error importing payroll from Excel: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to import payroll: {str(e)}"
+        )
+
+# Email Payslip Models
+class EmailPayslipRequest(BaseModel):
+    month: int
+    year: int
+    employee_ids: Optional[List[str]] = None  # If None, send to all
+
+class EmailStatus(BaseModel):
+    employee_id: str
+    employee_name: str
+    email: str
+    status: str  # 'sent', 'failed', 'pending'
+    error: Optional[str] = None
+
+# Payslip PDFs are rendered by payslip_pdf in worker processes, off the event loop
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', os.cpu_count() or 1))
+PDF_RENDER_BATCH_SIZE = int(os.environ.get('PDF_RENDER_BATCH_SIZE', 20))
+
+pdf_render_pool: Optional[ProcessPoolExecutor] = None
+
+def get_pdf_render_pool() -> ProcessPoolExecutor:
+    """Start the render pool on first use"""
+    global pdf_render_pool
+    if pdf_render_pool is None:
+        # Spawned workers import only payslip_pdf rather than inheriting the
+        # event loop and the Mongo client's threads through fork
+        pdf_render_pool = ProcessPoolExecutor(
+            max_workers=PDF_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return pdf_render_pool
+
+PAYSLIP_PDF_CACHE_DIR = Path(os.environ.get('PAYSLIP_PDF_CACHE_DIR', ROOT_DIR / 'payslip_pdf_cache'))
+# Entries unread for longer than the max age are evicted, then the least recently
+# read ones until the cache fits in the size cap; pruning runs at most once per interval
+PAYSLIP_PDF_CACHE_MAX_AGE_DAYS = int(os.environ.get('PAYSLIP_PDF_CACHE_MAX_AGE_DAYS', 90))
+PAYSLIP_PDF_CACHE_MAX_MB = int(os.environ.get('PAYSLIP_PDF_CACHE_MAX_MB', 1024))
+PAYSLIP_PDF_CACHE_PRUNE_SECONDS = int(os.environ.get('PAYSLIP_PDF_CACHE_PRUNE_SECONDS', 600))
+# Bump when the payslip layout changes so earlier renders are not served
+PAYSLIP_PDF_LAYOUT_VERSION = 1
+
+class PayslipPdfCache:
+    """
+    Content-addressed store of rendered payslip PDFs on disk. An entry is keyed by
+    a hash of the payslip data and the company settings it was rendered with, so
+    any change to either produces a new key. Files are laid out as
+    company_id/year/month/employee_id/<hash>.pdf and only the latest render of a
+    payslip is kept, which lets a month or a single payslip be dropped by removing
+    its directory. Reads refresh a file's mtime, which pruning uses as last use.
+    """
+    def __init__(self, root: Path, max_age_seconds: int, max_bytes: int, prune_interval: int):
+        self.root = root
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self._last_prune = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def key(payslip_data: dict, company_settings: dict) -> str:
+        content = json.dumps(
+            {"layout": PAYSLIP_PDF_LAYOUT_VERSION, "payslip": payslip_data, "company": company_settings},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+    
+    @staticmethod
+    def _segment(value) -> str:
+        return "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in str(value))
+    
+    def _company_directory(self, company_id) -> Path:
+        # Payslips of employees without a company share one directory
+        return self.root / (self._segment(company_id) if company_id else "_none")
+    
+    def _directory(self, company_directory: Path, year, month=None, employee_id=None) -> Path:
+        path = company_directory / str(year)
+        if month is not None:
+            path = path / f"{int(month):02d}"
+        if employee_id is not None:
+            path = path / self._segment(employee_id)
+        return path
+    
+    def _path(self, payslip_data: dict, company_settings: dict) -> Path:
+        directory = self._directory(
+            self._company_directory(payslip_data.get('company_id')),
+            payslip_data['year'], payslip_data['month'], payslip_data.get('employee_id')
+        )
+        return directory / f"{self.key(payslip_data, company_settings)}.pdf"
+    
+    def _read_many(self, paths: List[Path]) -> List[Optional[bytes]]:
+        pdfs = []
+        for path in paths:
+            try:
+                pdfs.append(path.read_bytes())
+                os.utime(path)
+            except OSError:
+                pdfs.append(None)
+        return pdfs
+    
+    def _write_many(self, entries: List[tuple]):
+        for path, pdf_bytes in entries:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # Drop earlier renders of this payslip
+                for stale in path.parent.glob("*.pdf"):
+                    if stale != path:
+                        stale.unlink(missing_ok=True)
+                temporary = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+                temporary.write_bytes(pdf_bytes)
+                os.replace(temporary, path)
+            except OSError as e:
+                logging.warning(f"Could not cache payslip PDF {path.name}: {e}")
+    
+    def _prune(self) -> int:
+        """Evict expired entries, then the least recently read until under max_bytes"""
+        entries = []
+        for path in self.root.glob("*/*/*/*/*.pdf"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        
+        cutoff = time.time() - self.max_age_seconds
+        total_bytes = sum(size for _, size, _ in entries)
+        evicted = 0
+        for modified, size, path in entries:
+            if modified >= cutoff and total_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            try:
+                path.parent.rmdir()
+            except OSError:
+                pass
+            total_bytes -= size
+            evicted += 1
+        return evicted
+    
+    async def get_many(self, payslips: List[dict], company_settings: dict) -> List[Optional[bytes]]:
+        """Cached PDFs aligned with `payslips`, None where a payslip has to be rendered"""
+        paths = [self._path(payslip_data, company_settings) for payslip_data in payslips]
+        pdfs = await asyncio.to_thread(self._read_many, paths)
+        found = sum(1 for pdf_bytes in pdfs if pdf_bytes is not None)
+        self.hits += found
+        self.misses += len(pdfs) - found
+        return pdfs
+    
+    async def put_many(self, payslips: List[dict], company_settings: dict, pdfs: List[bytes]):
+        entries = [(self._path(payslip_data, company_settings), pdf_bytes) for payslip_data, pdf_bytes in zip(payslips, pdfs)]
+        await asyncio.to_thread(self._write_many, entries)
+        if time.monotonic() - self._last_prune >= self.prune_interval:
+            self._last_prune = time.monotonic()
+            self.evictions += await asyncio.to_thread(self._prune)
+    
+    def _remove(self, year, month, employee_id, company_id):
+        if company_id:
+            company_directories = [self._company_directory(company_id)]
+        else:
+            company_directories = [path for path in self.root.glob("*") if path.is_dir()]
+        for company_directory in company_directories:
+            shutil.rmtree(self._directory(company_directory, year, month, employee_id), True)
+    
+    async def invalidate(self, year=None, month=None, employee_id=None, company_id=None):
+        """
+        Drop cached PDFs for one payslip, a month or a year, of one company or, without
+        company_id, of every company. With no arguments everything is dropped.
+        """
+        self.invalidations += 1
+        if year is None and company_id is None:
+            await asyncio.to_thread(shutil.rmtree, self.root, True)
+        elif year is None:
+            await asyncio.to_thread(shutil.rmtree, self._company_directory(company_id), True)
+        else:
+            await asyncio.to_thread(self._remove, year, month, employee_id, company_id)
+    
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "directory": str(self.root),
+            "max_age_seconds": self.max_age_seconds,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+payslip_pdf_cache = PayslipPdfCache(
+    PAYSLIP_PDF_CACHE_DIR,
+    max_age_seconds=PAYSLIP_PDF_CACHE_MAX_AGE_DAYS * 86400,
+    max_bytes=PAYSLIP_PDF_CACHE_MAX_MB * 1024 * 1024,
+    prune_interval=PAYSLIP_PDF_CACHE_PRUNE_SECONDS
+)
+
+async def render_payslip_pdfs(payslips: List[dict], company_settings: dict) -> List[tuple]:
+    """
+    Render payslips across the worker pool in batches of PDF_RENDER_BATCH_SIZE.
+    Returns (pdf_bytes, page_count) for each payslip, in input order.
+    """
+    from payslip_pdf import render_payslip_batch
+
+    global pdf_render_pool
+    loop = asyncio.get_running_loop()
+    pool = get_pdf_render_pool()
+    batches = [payslips[i:i + PDF_RENDER_BATCH_SIZE] for i in range(0, len(payslips), PDF_RENDER_BATCH_SIZE)]
+    try:
+        results = await asyncio.gather(*(
+            loop.run_in_executor(pool, render_payslip_batch, batch, company_settings)
+            for batch in batches
+        ))
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool for the next render
+        pdf_render_pool = None
+        raise
+    return [rendered for batch in results for rendered in batch]
+
+async def render_payslip_pdf(payslip_data: dict, company_settings: dict) -> bytes:
+    """A single payslip PDF from the cache, rendered in the worker pool on a miss"""
+    [pdf_bytes] = await payslip_pdf_cache.get_many([payslip_data], company_settings)
+    if pdf_bytes is None:
+        [(pdf_bytes, _)] = await render_payslip_pdfs([payslip_data], company_settings)
+        await payslip_pdf_cache.put_many([payslip_data], company_settings, [pdf_bytes])
+    return pdf_bytes
+
+async def iter_payslip_pdfs(batches, company_settings: dict):
+    """
+    Render batches of payslip data from an async iterator in the worker pool and
+    yield (payslip_data, pdf_bytes) as each batch finishes. Cached PDFs are yielded
+    straight away and only the misses are rendered. At most two batches per worker
+    are in flight, so memory stays flat however many batches come in.
+    """
+    from payslip_pdf import render_payslip_batch
+
+    loop = asyncio.get_running_loop()
+    pool = get_pdf_render_pool()
+    source = batches.__aiter__()
+    exhausted = False
+    in_flight = {}
+    try:
+        while True:
+            while not exhausted and len(in_flight) < PDF_RENDER_WORKERS * 2:
+                try:
+                    batch = await source.__anext__()
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                misses = []
+                for payslip_data, pdf_bytes in zip(batch, await payslip_pdf_cache.get_many(batch, company_settings)):
+                    if pdf_bytes is None:
+                        misses.append(payslip_data)
+                    else:
+                        yield payslip_data, pdf_bytes
+                if misses:
+                    in_flight[loop.run_in_executor(pool, render_payslip_batch, misses, company_settings)] = misses
+            if not in_flight:
+                return
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                batch = in_flight.pop(future)
+                pdfs = [pdf_bytes for pdf_bytes, _ in future.result()]
+                await payslip_pdf_cache.put_many(batch, company_settings, pdfs)
+                for payslip_data, pdf_bytes in zip(batch, pdfs):
+                    yield payslip_data, pdf_bytes
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+def build_payslip_pdf_data(payslip: dict, employee: dict, company_settings: dict) -> dict:
+    """Payslip fields and employee details as the PDF and the payslip email expect them"""
+    return {
+        "month": payslip['month'],
+        "year": payslip['year'],
+        "month_name": calendar.month_name[payslip['month']],
+        "employee_id": payslip.get('employee_id'),
+        "company_id": employee.get('company_id'),
+        "employee_name": employee.get('name', 'Employee'),
+        "department": employee.get('department', 'N/A'),
+        "designation": employee.get('designation', 'N/A'),
+        "pan": employee.get('pan_number', 'N/A'),
+        "bank_account": employee.get('bank_info', {}).get('account_number', 'N/A'),
+        "ifsc": employee.get('bank_info', {}).get('ifsc_code', 'N/A'),
+        "company_name": company_settings.get('company_name', 'Company Name'),
+        # Earnings
+        "basic_salary": payslip.get('basic_salary', 0),
+        "hra": payslip.get('hra', 0),
+        "medical_allowance": payslip.get('medical_allowance', 0),
+        "lta": payslip.get('lta', 0),
+        "conveyance": payslip.get('conveyance', 0),
+        "performance_incentive": payslip.get('performance_incentive', 0),
+        "other_benefits": payslip.get('other_benefits', 0),
+        "gross_salary": payslip.get('gross_salary', 0),
+        # Deductions
+        "pf_employee": payslip.get('pf_employee', 0),
+        "esi_employee": payslip.get('esi_employee', 0),
+        "professional_tax": payslip.get('professional_tax', 0),
+        "tds": payslip.get('tds', 0),
+        "loan_deductions": payslip.get('loan_deductions', 0),
+        "others": payslip.get('others', 0),
+        "total_deductions": payslip.get('total_deductions', 0),
+        # Net
+        "net_salary": payslip.get('net_salary', 0),
+        "days_worked": payslip.get('days_worked', 30),
+        "days_in_month": payslip.get('days_in_month', 30)
+    }
+
+async def load_payslip_company_settings() -> dict:
+    """Company settings used on payslip PDFs"""
+    settings = await db.settings.find_one({})
+    if settings and 'company_settings' in settings:
+        return settings['company_settings']
+    return {
+        "company_name": "Company Name",
+        "address": "Company Address"
+    }
+
+async def payslip_pdf_batches(query: dict, company_settings: dict):
+    """Payslips matching `query` as PDF data, read through a cursor in render-sized batches"""
+    async def to_pdf_data(payslips: List[dict]) -> List[dict]:
+        employees = await db.employees.find(
+            {"employee_id": {"$in": [payslip.get('employee_id') for payslip in payslips]}}, {"_id": 0}
+        ).to_list(length=None)
+        employees_by_id = {employee["employee_id"]: employee for employee in employees}
+        return [
+            build_payslip_pdf_data(payslip, employees_by_id.get(payslip.get('employee_id'), {}), company_settings)
+            for payslip in payslips
+        ]
+    
+    batch = []
+    async for payslip in db.payslips.find(query, {"_id": 0}).sort("employee_id", 1).batch_size(PDF_RENDER_BATCH_SIZE):
+        batch.append(payslip)
+        if len(batch) >= PDF_RENDER_BATCH_SIZE:
+            yield await to_pdf_data(batch)
+            batch = []
+    if batch:
+        yield await to_pdf_data(batch)
+
+class ZipStreamBuffer(io.RawIOBase):
+    """Unseekable sink for zipfile; written bytes are drained into a streaming response"""
+    def __init__(self):
+        self._chunks: List[bytes] = []
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def payslip_pdf_filename(payslip_data: dict) -> str:
+    name = "".join(ch if ch.isalnum() else "_" for ch in str(payslip_data.get('employee_name', 'Employee')))
+    return f"{payslip_data.get('employee_id')}_{name}_{payslip_data['month_name']}_{payslip_data['year']}.pdf"
+
+# Pooled SMTP delivery for bulk mail
+class TokenBucket:
+    """Token-bucket rate limiter: up to `burst` sends at once, refilled at `rate` per second"""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class SMTPConnectionPool:
+    """
+    Keeps up to `size` authenticated SMTP connections open and reuses them across
+    messages. At most `size` messages are in flight, and sends are rate limited by a
+    token bucket. A connection that fails is dropped and the message retried once
+    on a fresh connection.
+    """
+    def __init__(self, size: int, rate_limiter: TokenBucket):
+        self.size = size
+        self.rate_limiter = rate_limiter
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(size)
+    
+    async def _connect(self):
+        import aiosmtplib
+
+        smtp = aiosmtplib.SMTP(
+            hostname=SMTP_HOST,
+            port=SMTP_PORT,
+            username=SMTP_USER,
+            password=SMTP_PASSWORD,
+            start_tls=SMTP_START_TLS
+        )
+        await smtp.connect()
+        return smtp
+    
+    async def _checkout(self):
+        while not self._idle.empty():
+            smtp = self._idle.get_nowait()
+            if smtp.is_connected:
+                return smtp
+        return await self._connect()
+    
+    async def send_message(self, message):
+        import aiosmtplib
+
+        async with self._slots:
+            await self.rate_limiter.acquire()
+            for attempt in range(2):
+                smtp = await self._checkout()
+                try:
+                    await smtp.send_message(message)
+                except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, ConnectionError):
+                    smtp.close()
+                    if attempt:
+                        raise
+                    continue
+                except Exception:
+                    smtp.close()
+                    raise
+                self._idle.put_nowait(smtp)
+                return
+    
+    async def close(self):
+        while not self._idle.empty():
+            smtp = self._idle.get_nowait()
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+
+smtp_pool = SMTPConnectionPool(SMTP_POOL_SIZE, TokenBucket(SMTP_RATE_PER_SECOND, SMTP_RATE_BURST))
+
+@router.on_event("shutdown")
+async def close_payslip_workers():
+    await cancel_email_jobs()
+    await smtp_pool.close()
+    if pdf_render_pool:
+        pdf_render_pool.shutdown(wait=False, cancel_futures=True)
+
+# Email sending utility function
+async def send_payslip_email(employee_email: str, employee_name: str, employee_id: str, payslip_data: dict, pdf_bytes: bytes, company_logo_url: str = None):
+    """Send payslip email with PDF attachment"""
+    try:
+        # Create message
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = f"{employee_name} - Payslip - {payslip_data['month_name']} - {payslip_data['year']}"
+        msg['From'] = SMTP_FROM
+        msg['To'] = employee_email
+        msg['Bcc'] = SMTP_BCC
+        
+        # Create HTML email body with salary breakdown
+        logo_html = f'<img src="{company_logo_url}" alt="Company Logo" style="max-width: 150px; margin-bottom: 20px;">' if company_logo_url else ''
+        
+        html_body = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <style>
+                body {{ 
+                    font-family: 'Aptos Display', 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; 
+                    line-height: 1.6; 
+                    color: #006B5B; 
+                    margin: 0; 
+                    padding: 20px; 
+                }}
+                .container {{ 
+                    max-width: 600px; 
+                    margin: 0 auto; 
+                }}
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <p>Dear {employee_name},</p>
+                <p>Your salary slip for {payslip_data['month_name']} {payslip_data['year']} has been processed successfully.</p>
+                <p>Best regards,<br>
+                {payslip_data.get('company_name', 'Company Name')} Accounts Team</p>
+            </div>
+        </body>
+        </html>
+        """
+        
+        html_part = MIMEText(html_body, 'html')
+        msg.attach(html_part)
+        
+        # Attach PDF with proper filename
+        part = MIMEBase('application', 'octet-stream')
+        part.set_payload(pdf_bytes)
+        encoders.encode_base64(part)
+        
+        # Format: EmployeeName_Month_Year.pdf (e.g., JohnDoe_October_2025.pdf)
+        safe_name = employee_name.replace(' ', '_')
+        pdf_filename = f"{safe_name}_{payslip_data['month_name']}_{payslip_data['year']}.pdf"
+        
+        part.add_header(
+            'Content-Disposition',
+            f'attachment; filename="{pdf_filename}"'
+        )
+        msg.attach(part)
+        
+        # Send email over a pooled connection
+        await smtp_pool.send_message(msg)
+        
+        return True, None
+        
+    except Exception as e:
+        logging.error(f"Error sending email to {employee_email}: {str(e)}")
+        return False, str(e)
+
+# Bulk payslip emails run as background jobs; progress is kept in email_jobs
+EMAIL_JOB_PROGRESS_INTERVAL = int(os.environ.get('EMAIL_JOB_PROGRESS_INTERVAL', 25))
+# Running jobs refresh heartbeat_at; a queued or running job whose heartbeat is older
+# than EMAIL_JOB_STALE_SECONDS belonged to a process that died and is marked failed
+EMAIL_JOB_HEARTBEAT_SECONDS = int(os.environ.get('EMAIL_JOB_HEARTBEAT_SECONDS', 30))
+EMAIL_JOB_STALE_SECONDS = int(os.environ.get('EMAIL_JOB_STALE_SECONDS', 120))
+email_job_tasks: Dict[str, asyncio.Task] = {}
+
+class PayslipEmailJob:
+    """Tracks one bulk payslip email run and flushes progress and email_sent flags in batches"""
+    def __init__(self, total: int, month: int, year: int, created_by: str, request_id: Optional[str] = None):
+        self.id = str(uuid.uuid4())
+        self.month = month
+        self.year = year
+        self.total = total
+        self.results: List[dict] = []
+        self.successful = 0
+        self.failed = 0
+        self._sent_ids: List[str] = []
+        self._flushed = 0
+        self._flush_lock = asyncio.Lock()
+        now_iso = datetime.now(timezone.utc).isoformat()
+        self.doc = {
+            "id": self.id,
+            "request_id": request_id,
+            "month": month,
+            "year": year,
+            "status": "queued",
+            "total": total,
+            "processed": 0,
+            "successful": 0,
+            "failed": 0,
+            "results": [],
+            "error": None,
+            "created_by": created_by,
+            "created_at": now_iso,
+            "updated_at": now_iso,
+            "heartbeat_at": now_iso,
+            "completed_at": None
+        }
+    
+    async def create(self):
+        await db.email_jobs.insert_one(self.doc.copy())
+    
+    async def record(self, result: dict):
+        self.results.append(result)
+        if result["status"] == "sent":
+            self.successful += 1
+            self._sent_ids.append(result["employee_id"])
+        else:
+            self.failed += 1
+        if len(self.results) % EMAIL_JOB_PROGRESS_INTERVAL == 0:
+            await self.flush()
+    
+    async def flush(self, **fields):
+        async with self._flush_lock:
+            sent_ids, self._sent_ids = self._sent_ids, []
+            if sent_ids:
+                # Update payslips with email sent status in one write
+                await db.payslips.update_many(
+                    {"employee_id": {"$in": sent_ids}, "month": self.month, "year": self.year},
+                    {"$set": {"email_sent": True, "email_sent_at": datetime.now(timezone.utc).isoformat()}}
+                )
+            # Append only the results recorded since the last flush
+            new_results = self.results[self._flushed:]
+            processed = self._flushed + len(new_results)
+            now_iso = datetime.now(timezone.utc).isoformat()
+            await db.email_jobs.update_one({"id": self.id}, {
+                "$set": {
+                    "processed": processed,
+                    "successful": self.successful,
+                    "failed": self.failed,
+                    "updated_at": now_iso,
+                    "heartbeat_at": now_iso,
+                    **fields
+                },
+                "$push": {"results": {"$each": new_results}}
+            })
+            self._flushed = processed
+    
+    def summary(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": "queued",
+            "total": self.total,
+            "message": f"Sending {self.total} payslip emails in the background"
+        }
+
+async def send_in_slots(job: PayslipEmailJob, items, send_one):
+    """Run send_one(job, item) for every item, bounding in-flight PDFs to what the SMTP pool can send"""
+    slots = asyncio.Semaphore(SMTP_POOL_SIZE * 2)
+    
+    async def bounded(item):
+        async with slots:
+            await send_one(job, item)
+    
+    await asyncio.gather(*(bounded(item) for item in items))
+
+def start_email_job(job: PayslipEmailJob, worker):
+    """Run worker(job) in the background, marking the job completed or failed"""
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(EMAIL_JOB_HEARTBEAT_SECONDS)
+            try:
+                await db.email_jobs.update_one(
+                    {"id": job.id},
+                    {"$set": {"heartbeat_at": datetime.now(timezone.utc).isoformat()}}
+                )
+            except Exception as e:
+                logging.error(f"Error refreshing heartbeat of email job {job.id}: {str(e)}")
+    
+    async def run():
+        beat = asyncio.create_task(heartbeat())
+        try:
+            await db.email_jobs.update_one({"id": job.id}, {"$set": {"status": "running"}})
+            await worker(job)
+            await job.flush(status="completed", completed_at=datetime.now(timezone.utc).isoformat())
+            logger.info(f"Email job {job.id}: {job.successful} sent, {job.failed} failed")
+        except asyncio.CancelledError:
+            await job.flush(status="failed", error="Interrupted by a server shutdown")
+            raise
+        except Exception as e:
+            logging.error(f"Error in email job {job.id}: {str(e)}")
+            await job.flush(status="failed", error=str(e))
+        finally:
+            beat.cancel()
+            email_job_tasks.pop(job.id, None)
+    
+    email_job_tasks[job.id] = asyncio.create_task(run())
+
+async def fail_stale_email_jobs(query: Optional[dict] = None) -> int:
+    """Mark queued or running email jobs whose process stopped sending heartbeats as failed"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=EMAIL_JOB_STALE_SECONDS)).isoformat()
+    result = await db.email_jobs.update_many(
+        {
+            **(query or {}),
+            "status": {"$in": ["queued", "running"]},
+            "id": {"$nin": list(email_job_tasks)},
+            "$or": [{"heartbeat_at": {"$lt": cutoff}}, {"heartbeat_at": None}]
+        },
+        {"$set": {
+            "status": "failed",
+            "error": "Interrupted by a server restart",
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }}
+    )
+    if result.modified_count:
+        logger.info(f"Marked {result.modified_count} interrupted email jobs as failed")
+    return result.modified_count
+
+async def cancel_email_jobs():
+    """Cancel running email jobs on shutdown; each marks itself failed as it stops"""
+    tasks = list(email_job_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+@router.get("/payslips/email-jobs/{job_id}")
+async def get_email_job(
+    job_id: str,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Progress, counts and per-employee results of a bulk payslip email job"""
+    await fail_stale_email_jobs({"id": job_id})
+    job = await db.email_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Email job not found")
+    job["progress_percent"] = round(job["processed"] * 100 / job["total"], 1) if job["total"] else 100.0
+    return job
+
+@router.post("/payslips/email-with-pdfs")
+async def email_payslips_with_pdfs(
+    pdfs: List[UploadFile] = File(...),
+    employee_ids: List[str] = Form(...),
+    employee_names: List[str] = Form(...),
+    employee_emails: List[str] = Form(...),
+    month: int = Form(...),
+    year: int = Form(...),
+    request_id: str = Form(None),
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """
+    Send payslips via email with pre-generated PDFs from frontend.
+    Runs as a background job; poll /payslips/email-jobs/{job_id} for progress and results.
+    """
+    try:
+        # Log request for debugging
+        if request_id:
+            logger.info(f"Processing email request with ID: {request_id}")
+        else:
+            logger.info(f"Processing email request without ID for {len(employee_ids)} employees")
+        if len(pdfs) != len(employee_ids):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Mismatch between number of PDFs and employees"
+            )
+        
+        # Get company settings from the settings collection
+        settings = await db.settings.find_one({})
+        logger.info(f"Retrieved settings from DB: {settings}")
+        if settings and 'company_settings' in settings:
+            company_settings = settings['company_settings']
+            logger.info(f"Using company_settings: {company_settings}")
+        else:
+            company_settings = {"company_name": "Company Name", "address": "N/A"}
+            logger.info("Using fallback company settings")
+        
+        company_logo_url = company_settings.get('logo_url')
+        
+        month_names = ['', 'January', 'February', 'March', 'April', 'May', 'June',
+                      'July', 'August', 'September', 'October', 'November', 'December']
+        
+        # Read the uploads now; they are closed once the request returns
+        pdf_contents = [await pdf_file.read() for pdf_file in pdfs]
+        
+        # Get payslip data for every employee in one query
+        payslips = await db.payslips.find(
+            {"employee_id": {"$in": list(employee_ids)}, "month": month, "year": year}, {"_id": 0}
+        ).to_list(length=None)
+        payslips_by_employee = {payslip["employee_id"]: payslip for payslip in payslips}
+        
+        async def send_one(job: PayslipEmailJob, i: int):
+            employee_id = employee_ids[i]
+            employee_name = employee_names[i]
+            employee_email = employee_emails[i]
+            
+            if not employee_email or employee_email == 'N/A':
+                await job.record({
+                    "employee_id": employee_id,
+                    "employee_name": employee_name,
+                    "email": "N/A",
+                    "status": "failed",
+                    "error": "No email address"
+                })
+                return
+            
+            payslip = payslips_by_employee.get(employee_id)
+            if not payslip:
+                await job.record({
+                    "employee_id": employee_id,
+                    "employee_name": employee_name,
+                    "email": employee_email,
+                    "status": "failed",
+                    "error": "Payslip not found"
+                })
+                return
+            
+            # Prepare payslip data for email body
+            payslip_data = {
+                "month": month,
+                "year": year,
+                "month_name": month_names[month],
+                "company_name": company_settings.get('company_name', 'Company Name'),
+                "basic_salary": payslip.get('basic_salary', 0),
+                "hra": payslip.get('hra', 0),
+                "medical_allowance": payslip.get('medical_allowance', 0),
+                "lta": payslip.get('lta', 0),
+                "conveyance": payslip.get('conveyance', 0),
+                "performance_incentive": payslip.get('performance_incentive', 0),
+                "other_benefits": payslip.get('other_benefits', 0),
+                "gross_salary": payslip.get('gross_salary', 0),
+                "pf_employee": payslip.get('pf_employee', 0),
+                "esi_employee": payslip.get('esi_employee', 0),
+                "professional_tax": payslip.get('professional_tax', 0),
+                "tds": payslip.get('tds', 0),
+                "loan_deductions": payslip.get('loan_deductions', 0),
+                "others": payslip.get('others', 0),
+                "total_deductions": payslip.get('total_deductions', 0),
+                "net_salary": payslip.get('net_salary', 0),
+                "days_worked": payslip.get('days_worked', 30),
+                "days_in_month": payslip.get('days_in_month', 30)
+            }
+            
+            # Send email; the SMTP pool bounds concurrency and rate
+            success, error = await send_payslip_email(
+                employee_email,
+                employee_name,
+                employee_id,
+                payslip_data,
+                pdf_contents[i],
+                company_logo_url
+            )
+            
+            await job.record({
+                "employee_id": employee_id,
+                "employee_name": employee_name,
+                "email": employee_email,
+                "status": "sent" if success else "failed",
+                "error": error
+            })
+        
+        async def send_all(job: PayslipEmailJob):
+            await send_in_slots(job, range(len(pdf_contents)), send_one)
+        
+        job = PayslipEmailJob(len(pdfs), month, year, current_user.username, request_id)
+        await job.create()
+        start_email_job(job, send_all)
+        
+        return job.summary()
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error sending payslip emails: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to send emails: {str(e)}"
+        )
+
+@router.post("/payslips/email")
+async def email_payslips(
+    request: EmailPayslipRequest,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """
+    Send payslips via email to employees (OLD - kept for compatibility).
+    Runs as a background job; poll /payslips/email-jobs/{job_id} for progress and results.
+    """
+    try:
+        # Get payslips for the specified month/year
+        query = {"month": request.month, "year": request.year}
+        if request.employee_ids:
+            query["employee_id"] = {"$in": request.employee_ids}
+        
+        payslips = await db.payslips.find(query).to_list(length=None)
+        
+        if not payslips:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No payslips found for {request.month}/{request.year}"
+            )
+        
+        # Get company settings for PDF generation
+        company_settings = await load_payslip_company_settings()
+        
+        # Get employee details for every payslip in one query
+        employees = await db.employees.find(
+            {"employee_id": {"$in": [payslip.get('employee_id') for payslip in payslips]}}, {"_id": 0}
+        ).to_list(length=None)
+        employees_by_id = {employee["employee_id"]: employee for employee in employees}
+        
+        # Get company logo URL if available
+        company_logo_url = company_settings.get('logo_url')
+        
+        async def send_one(job: PayslipEmailJob, payslip: dict):
+            employee_id = payslip.get('employee_id')
+            
+            employee = employees_by_id.get(employee_id)
+            if not employee or not employee.get('email'):
+                await job.record({
+                    "employee_id": employee_id,
+                    "employee_name": employee.get('name', 'Unknown') if employee else 'Unknown',
+                    "email": "N/A",
+                    "status": "failed",
+                    "error": "No email address"
+                })
+                return
+            
+            payslip_data = build_payslip_pdf_data(payslip, employee, company_settings)
+            
+            # Render the PDF in the worker pool
+            try:
+                pdf_bytes = await render_payslip_pdf(payslip_data, company_settings)
+            except Exception as pdf_error:
+                logging.error(f"Error generating PDF for {employee_id}: {str(pdf_error)}")
+                await job.record({
+                    "employee_id": employee_id,
+                    "employee_name": employee.get('name'),
+                    "email": employee.get('email'),
+                    "status": "failed",
+                    "error": f"PDF generation failed: {str(pdf_error)}"
+                })
+                return
+            
+            # Send email; the SMTP pool bounds concurrency and rate
+            success, error = await send_payslip_email(
+                employee.get('email'),
+                employee.get('name', 'Employee'),
+                employee_id,
+                payslip_data,
+                pdf_bytes,
+                company_logo_url
+            )
+            
+            await job.record({
+                "employee_id": employee_id,
+                "employee_name": employee.get('name'),
+                "email": employee.get('email'),
+                "status": "sent" if success else "failed",
+                "error": error
+            })
+        
+        async def send_all(job: PayslipEmailJob):
+            await send_in_slots(job, payslips, send_one)
+        
+        job = PayslipEmailJob(len(payslips), request.month, request.year, current_user.username)
+        await job.create()
+        start_email_job(job, send_all)
+        
+        return job.summary()
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error sending payslip emails: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to send emails: {str(e)}"
+        )
+
+@router.post("/payslips/render/{month}/{year}")
+async def render_payslips_for_month(
+    month: int,
+    year: int,
+    use_cache: bool = True,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """
+    Render every payslip PDF of a month across the worker pool into the PDF cache
+    and report throughput. Cached payslips are skipped unless use_cache is false.
+    """
+    try:
+        payslips = await db.payslips.find({"month": month, "year": year}, {"_id": 0}).to_list(length=None)
+        if not payslips:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No payslips found for {month}/{year}"
+            )
+        
+        company_settings = await load_payslip_company_settings()
+        employees = await db.employees.find(
+            {"employee_id": {"$in": [payslip.get('employee_id') for payslip in payslips]}}, {"_id": 0}
+        ).to_list(length=None)
+        employees_by_id = {employee["employee_id"]: employee for employee in employees}
+        
+        payslip_data = [
+            build_payslip_pdf_data(payslip, employees_by_id.get(payslip.get('employee_id'), {}), company_settings)
+            for payslip in payslips
+        ]
+        
+        if use_cache:
+            cached = await payslip_pdf_cache.get_many(payslip_data, company_settings)
+            payslip_data = [data for data, pdf_bytes in zip(payslip_data, cached) if pdf_bytes is None]
+        
+        started = time.monotonic()
+        rendered = await render_payslip_pdfs(payslip_data, company_settings)
+        elapsed_seconds = time.monotonic() - started
+        await payslip_pdf_cache.put_many(payslip_data, company_settings, [pdf_bytes for pdf_bytes, _ in rendered])
+        
+        pages = sum(page_count for _, page_count in rendered)
+        return {
+            "month": month,
+            "year": year,
+            "rendered": len(rendered),
+            "cached": len(payslips) - len(rendered),
+            "pages": pages,
+            "total_bytes": sum(len(pdf_bytes) for pdf_bytes, _ in rendered),
+            "workers": PDF_RENDER_WORKERS,
+            "elapsed_seconds": round(elapsed_seconds, 3),
+            "pages_per_second": round(pages / elapsed_seconds, 1) if elapsed_seconds > 0 else pages
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error rendering payslip PDFs: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to render payslips: {str(e)}"
+        )
+
+@router.get("/payslips/download/{month}/{year}")
+async def download_payslips_zip(
+    month: int,
+    year: int,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """
+    Download every payslip PDF of a month as a ZIP archive. PDFs are rendered in the
+    worker pool and written to the archive as they finish, and the archive is
+    streamed out entry by entry rather than built in memory.
+    """
+    query = {"month": month, "year": year}
+    if not await db.payslips.count_documents(query, limit=1):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No payslips found for {month}/{year}"
+        )
+    
+    company_settings = await load_payslip_company_settings()
+    
+    async def zip_chunks():
+        sink = ZipStreamBuffer()
+        # PDFs are already compressed, so entries are stored as-is
+        archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+        try:
+            async for payslip_data, pdf_bytes in iter_payslip_pdfs(payslip_pdf_batches(query, company_settings), company_settings):
+                entry = zipfile.ZipInfo(payslip_pdf_filename(payslip_data), date_time=time.localtime()[:6])
+                archive.writestr(entry, pdf_bytes)
+                yield sink.drain()
+        except Exception as e:
+            # Headers are already sent; abort the response without the central directory,
+            # so the client sees a broken download instead of a valid but partial archive
+            logging.error(f"Error streaming payslip archive for {month}/{year}: {str(e)}")
+            raise
+        # Only a complete archive is finalized
+        archive.close()
+        yield sink.drain()
+    
+    return StreamingResponse(
+        zip_chunks(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=payslips_{year}_{month:02d}.zip"}
+    )
@@ -0,0 +1,192 @@
+"""
+Payslip PDF rendering with reportlab.
+
+The renderer is CPU bound and runs in worker processes, so everything here is
+plain module-level functions over dicts that pickle cheaply. The paragraph
+styles, which are identical for every payslip, are built once per worker
+process and reused across renders.
+"""
+import io
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Tuple
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+MONTH_NAMES = ['', 'January', 'February', 'March', 'April', 'May', 'June',
+               'July', 'August', 'September', 'October', 'November', 'December']
+
+DETAILS_STYLE = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('TEXTCOLOR', (0, 1), (0, -1), colors.HexColor('#6b7280')),
+    ('TOPPADDING', (0, 0), (-1, -1), 3),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+])
+
+TOP_ALIGNED_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+
+HEADER_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 15),
+    ('LINEBELOW', (0, 1), (-1, 1), 2, colors.HexColor('#e5e7eb')),
+])
+
+NET_SALARY_STYLE = TableStyle([
+    ('LINEABOVE', (0, 0), (-1, 0), 2, colors.HexColor('#e5e7eb')),
+    ('TOPPADDING', (0, 0), (-1, -1), 15),
+])
+
+
+def _amount_table_style(background: str, title_color: str, border: str) -> TableStyle:
+    return TableStyle([
+        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor(background)),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor(title_color)),
+        ('ALIGN', (1, 1), (1, -1), 'RIGHT'),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.HexColor('#e5e7eb')),
+        ('BOX', (0, 0), (-1, -1), 0.5, colors.HexColor(border)),
+        ('LEFTPADDING', (0, 0), (0, -1), 4),
+    ])
+
+
+EARNINGS_STYLE = _amount_table_style('#ecfdf5', '#065f46', '#10b981')
+DEDUCTIONS_STYLE = _amount_table_style('#fef2f2', '#991b1b', '#dc2626')
+
+
+@lru_cache(maxsize=1)
+def _paragraph_styles() -> Tuple[ParagraphStyle, ParagraphStyle]:
+    styles = getSampleStyleSheet()
+    normal = styles['Normal']
+    return normal, ParagraphStyle('Right', parent=normal, alignment=TA_RIGHT)
+
+
+def _money(value) -> str:
+    return f"₹{value:,.2f}"
+
+
+def render_payslip(payslip_data: dict, company_settings: dict) -> Tuple[bytes, int]:
+    """Render one payslip; returns the PDF bytes and its page count"""
+    buffer = io.BytesIO()
+    normal, right = _paragraph_styles()
+
+    # Same margins as the frontend
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.7*inch, bottomMargin=0.7*inch, leftMargin=0.7*inch, rightMargin=0.7*inch)
+    elements = []
+
+    # Company Header Section
+    header_table = Table([
+        [Paragraph(f"<b><font size=18 color='#10b981'>{company_settings.get('company_name', 'Company Name')}</font></b>", normal),
+         Paragraph("<b><font size=14>SALARY SLIP</font></b>", right)],
+        [Paragraph(f"<font size=9 color='#6b7280'>{company_settings.get('address', 'N/A')}</font>", normal),
+         Paragraph(f"<font size=9 color='#6b7280'>For the month of {MONTH_NAMES[payslip_data['month']]} {payslip_data['year']}</font>", right)],
+    ], colWidths=[4*inch, 3.2*inch])
+    header_table.setStyle(HEADER_STYLE)
+    elements.append(header_table)
+    elements.append(Spacer(1, 0.2*inch))
+
+    # Employee Details - Two Column Layout
+    emp_details_left = [
+        ['<b>Employee Details</b>', ''],
+        ['Name:', payslip_data['employee_name']],
+        ['Employee ID:', payslip_data['employee_id']],
+        ['Designation:', payslip_data.get('designation', 'N/A')],
+        ['Department:', payslip_data.get('department', 'N/A')],
+    ]
+
+    emp_details_right = [
+        ['<b>Bank Details</b>', ''],
+        ['PAN:', payslip_data.get('pan', 'N/A')],
+        ['Bank Account:', '***' + str(payslip_data.get('bank_account', 'N/A'))[-4:] if payslip_data.get('bank_account') else 'N/A'],
+        ['IFSC Code:', payslip_data.get('ifsc', 'N/A')],
+        ['Days Worked:', f"{payslip_data.get('days_worked', 30)} of {payslip_data.get('days_in_month', 30)}"],
+    ]
+
+    left_table = Table(emp_details_left, colWidths=[1.3*inch, 2*inch])
+    left_table.setStyle(DETAILS_STYLE)
+    right_table = Table(emp_details_right, colWidths=[1.3*inch, 2*inch])
+    right_table.setStyle(DETAILS_STYLE)
+
+    combined_emp_table = Table([[left_table, right_table]], colWidths=[3.6*inch, 3.6*inch])
+    combined_emp_table.setStyle(TOP_ALIGNED_STYLE)
+    elements.append(combined_emp_table)
+    elements.append(Spacer(1, 0.2*inch))
+
+    # Earnings Section
+    earnings_data = [
+        ['💰 Earnings', ''],
+        ['Basic Salary:', _money(payslip_data.get('basic_salary', 0))],
+        ['House Rent Allowance:', _money(payslip_data.get('hra', 0))],
+        ['Medical Allowance:', _money(payslip_data.get('medical_allowance', 0))],
+        ['Leave Travel Allowance:', _money(payslip_data.get('lta', 0))],
+        ['Bonus:', _money(payslip_data.get('conveyance', 0))],
+        ['Performance Incentive:', _money(payslip_data.get('performance_incentive', 0))],
+        ['Other Benefits:', _money(payslip_data.get('other_benefits', 0))],
+        ['<b>Gross Earnings:</b>', f"<b>{_money(payslip_data.get('gross_salary', 0))}</b>"],
+    ]
+    earnings_table = Table(earnings_data, colWidths=[2.3*inch, 1.3*inch])
+    earnings_table.setStyle(EARNINGS_STYLE)
+
+    # Deductions Section
+    deductions_data = [
+        ['💸 Deductions', ''],
+        ['PF (Employee):', _money(payslip_data.get('pf_employee', 0))],
+        ['ESI (Employee):', _money(payslip_data.get('esi_employee', 0))],
+        ['Professional Tax:', _money(payslip_data.get('professional_tax', 0))],
+        ['TDS:', _money(payslip_data.get('tds', 0))],
+        ['Loan Deductions:', _money(payslip_data.get('loan_deductions', 0))],
+        ['Others:', _money(payslip_data.get('others', 0))],
+        ['', ''],  # Spacer
+        ['<b>Total Deductions:</b>', f"<b>{_money(payslip_data.get('total_deductions', 0))}</b>"],
+    ]
+    deductions_table = Table(deductions_data, colWidths=[2.3*inch, 1.3*inch])
+    deductions_table.setStyle(DEDUCTIONS_STYLE)
+
+    # Combine earnings and deductions side by side
+    combined_salary_table = Table([[earnings_table, deductions_table]], colWidths=[3.6*inch, 3.6*inch])
+    combined_salary_table.setStyle(TOP_ALIGNED_STYLE)
+    elements.append(combined_salary_table)
+    elements.append(Spacer(1, 0.25*inch))
+
+    # Net Salary Section
+    net_table = Table([[
+        Paragraph('<font size=12><b>Net Salary:</b></font>', normal),
+        Paragraph(f'<font size=16 color="#10b981"><b>{_money(payslip_data.get("net_salary", 0))}</b></font>', right)
+    ]], colWidths=[4*inch, 3.2*inch])
+    net_table.setStyle(NET_SALARY_STYLE)
+    elements.append(net_table)
+    elements.append(Spacer(1, 0.1*inch))
+
+    # Generated date
+    elements.append(Paragraph(
+        f'<font size=8 color="#6b7280">Generated on: {datetime.now().strftime("%d %B %Y")}</font>',
+        normal
+    ))
+
+    doc.build(elements)
+    return buffer.getvalue(), doc.page
+
+
+def generate_payslip_pdf(payslip_data: dict, company_settings: dict) -> bytes:
+    """Generate PDF payslip matching frontend format using reportlab"""
+    pdf_bytes, _ = render_payslip(payslip_data, company_settings)
+    return pdf_bytes
+
+
+def render_payslip_batch(payslips: List[dict], company_settings: dict) -> List[Tuple[bytes, int]]:
+    """
+    Render several payslips of one company in a single worker call, so company
+    settings are sent to the worker once per batch instead of once per payslip.
+    """
+    return [render_payslip(payslip_data, company_settings) for payslip_data in payslips]
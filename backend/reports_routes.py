@@ -0,0 +1,910 @@
+"""
+Report Routes
+Dashboard statistics, payroll export and bank advice generation
+
+openpyxl is imported inside the endpoints that build spreadsheets.
+"""
+
+import logging
+import asyncio
+import io
+import base64
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from server import (
+    BankAdvice, BankAdviceGenerate, DashboardStats, db, get_company_filter,
+    get_dashboard_counters, require_role, sum_counters_since, User, UserRole,
+)
+
+router = APIRouter(tags=["Reports"])
+
+async def company_employee_ids(company_filter: dict) -> Optional[List[str]]:
+    """Ids of every employee in the filtered company, or None when the filter spans all companies"""
+    if not company_filter:
+        return None
+    employees = await db.employees.find(company_filter, {"_id": 0, "employee_id": 1}).to_list(length=None)
+    return [employee["employee_id"] for employee in employees]
+
+@router.get("/dashboard/pending-actions")
+async def get_pending_actions(company_filter: dict = Depends(get_company_filter)):
+    """Get counts of items requiring admin action"""
+    try:
+        counters = await get_dashboard_counters(company_filter)
+        pending_leaves = counters["pending_leaves"]
+        pending_loans = counters["pending_loans"]
+        pending_ot = counters["pending_ot"]
+        
+        # Late arrivals from last 7 days (for review)
+        seven_days_ago = (date.today() - timedelta(days=7)).isoformat()
+        recent_late_arrivals = sum_counters_since(counters["late_arrivals_by_date"], seven_days_ago)
+        
+        return {
+            "pending_leaves": pending_leaves,
+            "pending_loans": pending_loans,
+            "pending_ot": pending_ot,
+            "recent_late_arrivals": recent_late_arrivals,
+            "total_pending": pending_leaves + pending_loans + pending_ot
+        }
+    except Exception as e:
+        logging.error(f"Error fetching pending actions: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch pending actions"
+        )
+
+@router.get("/dashboard/leave-statistics")
+async def get_leave_statistics(company_filter: dict = Depends(get_company_filter)):
+    """Get leave statistics for dashboard"""
+    try:
+        now = datetime.now()
+        month_start = date(now.year, now.month, 1)
+        
+        counters = await get_dashboard_counters(company_filter)
+        
+        # Pending leaves
+        pending = counters["pending_leaves"]
+        
+        # Approved leaves this month
+        approved_this_month = sum_counters_since(counters["approved_leaves_by_month"], month_start.isoformat()[:7])
+        
+        # Total leave balance utilization (average across all employees); approved days
+        # are summed per employee inside the lookup, so only totals leave the server
+        totals = await db.employees.aggregate([
+            {"$match": {"status": "active", **company_filter}},
+            {"$lookup": {
+                "from": "leave_requests",
+                "let": {"employee_id": "$employee_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$eq": ["$employee_id", "$$employee_id"]}, "status": "approved"}},
+                    {"$group": {"_id": None, "days": {"$sum": "$days"}}}
+                ],
+                "as": "approved"
+            }},
+            {"$group": {
+                "_id": None,
+                "total_available": {"$sum": {"$ifNull": ["$total_leave_balance", 12]}},
+                "total_used": {"$sum": {"$sum": "$approved.days"}}
+            }}
+        ]).to_list(length=1)
+        if totals and totals[0]["total_available"] > 0:
+            utilization = totals[0]["total_used"] / totals[0]["total_available"] * 100
+        else:
+            utilization = 0
+        
+        return {
+            "pending_leaves": pending,
+            "approved_this_month": approved_this_month,
+            "utilization_percentage": round(utilization, 1)
+        }
+    except Exception as e:
+        logging.error(f"Error fetching leave statistics: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch leave statistics"
+        )
+
+@router.get("/dashboard/loan-overview")
+async def get_loan_overview(company_filter: dict = Depends(get_company_filter)):
+    """Get loan overview for dashboard"""
+    try:
+        # Active loans (approved status - loans that have been approved and disbursed)
+        loan_query = {"status": "approved"}
+        employee_ids = await company_employee_ids(company_filter)
+        if employee_ids is not None:
+            loan_query["employee_id"] = {"$in": employee_ids}
+        active_loans = await db.loan_requests.find(
+            loan_query,
+            {"_id": 0, "outstanding_amount": 1, "disbursed_amount": 1, "amount": 1, "monthly_emi": 1}
+        ).to_list(length=None)
+        
+        # Calculate totals from disbursed and outstanding amounts
+        total_outstanding = 0
+        monthly_deductions = 0
+        
+        for loan in active_loans:
+            # Use outstanding_amount (set when approved) or fall back to disbursed_amount or original amount
+            outstanding = loan.get("outstanding_amount") or loan.get("disbursed_amount") or loan.get("amount", 0)
+            total_outstanding += outstanding
+            
+            # Use monthly_emi field
+            emi = loan.get("monthly_emi", 0)
+            monthly_deductions += emi
+        
+        return {
+            "active_loans": len(active_loans),
+            "total_outstanding": round(total_outstanding, 2),
+            "monthly_deductions": round(monthly_deductions, 2)
+        }
+    except Exception as e:
+        logging.error(f"Error fetching loan overview: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch loan overview"
+        )
+
+@router.get("/dashboard/employee-distribution")
+async def get_employee_distribution(company_filter: dict = Depends(get_company_filter)):
+    """Get employee distribution by department and designation"""
+    try:
+        # Group by department and designation in one pass
+        facets = await db.employees.aggregate([
+            {"$match": {"status": "active", **company_filter}},
+            {"$facet": {
+                "by_department": [
+                    {"$group": {"_id": {"$ifNull": ["$department", "Unassigned"]}, "count": {"$sum": 1}}}
+                ],
+                "by_designation": [
+                    {"$group": {"_id": {"$ifNull": ["$designation", "Unassigned"]}, "count": {"$sum": 1}}}
+                ]
+            }}
+        ]).to_list(length=1)
+        facets = facets[0] if facets else {"by_department": [], "by_designation": []}
+        
+        dept_counts = {row["_id"]: row["count"] for row in facets["by_department"]}
+        designation_counts = {row["_id"]: row["count"] for row in facets["by_designation"]}
+        
+        return {
+            "by_department": [{"name": k, "count": v} for k, v in dept_counts.items()],
+            "by_designation": [{"name": k, "count": v} for k, v in designation_counts.items()]
+        }
+    except Exception as e:
+        logging.error(f"Error fetching employee distribution: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch employee distribution"
+        )
+
+@router.get("/dashboard/payroll-trends")
+async def get_payroll_trends(company_filter: dict = Depends(get_company_filter)):
+    """Get payroll trends for last 6 months"""
+    try:
+        now = datetime.now()
+        
+        periods = []
+        for i in range(5, -1, -1):  # Last 6 months
+            month = now.month - i
+            year = now.year
+            
+            # Handle year rollback
+            if month <= 0:
+                month += 12
+                year -= 1
+            periods.append((year, month))
+        
+        period_match = {"$or": [{"month": month, "year": year} for year, month in periods]}
+        employee_ids = await company_employee_ids(company_filter)
+        totals = {}
+        if employee_ids is None:
+            payroll_runs = await db.payroll_runs.find(
+                period_match,
+                {"_id": 0, "month": 1, "year": 1, "total_net": 1}
+            ).to_list(length=None)
+            for payroll_run in payroll_runs:
+                totals.setdefault((payroll_run.get("year"), payroll_run.get("month")), payroll_run.get("total_net", 0))
+        else:
+            # Payroll runs span companies; total only this company's employees
+            company_totals = await db.payroll_runs.aggregate([
+                {"$match": period_match},
+                {"$unwind": "$employees"},
+                {"$match": {"employees.employee_id": {"$in": employee_ids}}},
+                {"$group": {
+                    "_id": {"year": "$year", "month": "$month"},
+                    "amount": {"$sum": "$employees.net_salary"}
+                }}
+            ]).to_list(length=None)
+            for row in company_totals:
+                totals[(row["_id"]["year"], row["_id"]["month"])] = row["amount"]
+        
+        trends = [
+            {
+                "month": datetime(year, month, 1).strftime("%b %Y"),
+                "amount": totals.get((year, month), 0)
+            }
+            for year, month in periods
+        ]
+        
+        return {"trends": trends}
+    except Exception as e:
+        logging.error(f"Error fetching payroll trends: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch payroll trends"
+        )
+
+@router.get("/dashboard/attendance-overview")
+async def get_attendance_overview(company_filter: dict = Depends(get_company_filter)):
+    """Get today's attendance overview for dashboard"""
+    try:
+        today = date.today()
+        counters = await get_dashboard_counters(company_filter)
+        
+        # Count today's attendance records by status
+        status_counts = counters["attendance_by_date"].get(today.isoformat(), {})
+        
+        present = status_counts.get("present", 0)
+        leave = status_counts.get("leave", 0)
+        half_day = status_counts.get("half-day", 0)
+        
+        # Get late arrivals for today
+        late_arrivals = counters["late_arrivals_by_date"].get(today.isoformat(), 0)
+        
+        # Calculate total active employees
+        total_active = await db.employees.count_documents({"status": "active", **company_filter})
+        
+        # Calculate absent (active employees not in any attendance status)
+        accounted_for = present + leave + half_day
+        absent = max(0, total_active - accounted_for) if total_active > 0 else 0
+        
+        # Calculate rates
+        present_rate = (present / total_active * 100) if total_active > 0 else 0
+        on_time_rate = ((present - late_arrivals) / present * 100) if present > 0 else 0
+        
+        return {
+            "present": present,
+            "absent": absent,
+            "late": late_arrivals,
+            "leave": leave + half_day,
+            "present_rate": round(present_rate, 1),
+            "on_time_rate": round(on_time_rate, 1),
+            "total_active": total_active
+        }
+    except Exception as e:
+        logging.error(f"Error fetching attendance overview: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch attendance overview"
+        )
+
+@router.get("/dashboard/summary")
+async def get_dashboard_summary(company_filter: dict = Depends(get_company_filter)):
+    """
+    Get every admin dashboard tile in a single call, computed concurrently. A tile
+    that fails is returned as null with its error under "errors", so the rest of
+    the dashboard still loads.
+    """
+    tiles = {
+        "pending_actions": get_pending_actions(company_filter),
+        "leave_statistics": get_leave_statistics(company_filter),
+        "loan_overview": get_loan_overview(company_filter),
+        "employee_distribution": get_employee_distribution(company_filter),
+        "payroll_trends": get_payroll_trends(company_filter),
+        "attendance_overview": get_attendance_overview(company_filter)
+    }
+    results = await asyncio.gather(*tiles.values(), return_exceptions=True)
+    
+    summary = {}
+    errors = {}
+    for name, result in zip(tiles, results):
+        if isinstance(result, Exception):
+            logging.error(f"Error computing dashboard tile {name}: {str(result)}")
+            summary[name] = None
+            errors[name] = result.detail if isinstance(result, HTTPException) else str(result)
+        else:
+            summary[name] = result
+    summary["errors"] = errors
+    return summary
+
+# Dashboard endpoint
+@router.get("/dashboard/stats", response_model=DashboardStats)
+async def get_dashboard_stats(company_filter: dict = Depends(get_company_filter)):
+    # Get total and active employees
+    total_employees = await db.employees.count_documents({**company_filter})
+    active_employees = await db.employees.count_documents({"status": "active", **company_filter})
+    counters = await get_dashboard_counters(company_filter)
+    
+    # Calculate this month's payroll
+    now = datetime.now()
+    month_start = date(now.year, now.month, 1)
+    if now.month == 12:
+        month_end = date(now.year + 1, 1, 1) - timedelta(days=1)
+    else:
+        month_end = date(now.year, now.month + 1, 1) - timedelta(days=1)
+    
+    # Get payroll run for current month
+    payroll_run = await db.payroll_runs.find_one({
+        "month": now.month,
+        "year": now.year
+    })
+    
+    this_month_payroll = 0
+    if payroll_run:
+        # Sum net salary of the company's employees in the payroll run
+        employee_ids = await company_employee_ids(company_filter)
+        if employee_ids is not None:
+            employee_ids = set(employee_ids)
+        this_month_payroll = sum(
+            emp.get("net_salary", 0) for emp in payroll_run.get("employees", [])
+            if employee_ids is None or emp.get("employee_id") in employee_ids
+        )
+    
+    # Count payslips generated this month
+    payslips_generated = counters["payslips_by_period"].get(f"{now.year}-{now.month:02d}", 0)
+    
+    # Calculate upcoming deadlines (pending leave requests + pending loan requests)
+    upcoming_deadlines = counters["pending_leaves"] + counters["pending_loans"]
+    
+    return DashboardStats(
+        total_employees=total_employees,
+        active_employees=active_employees,
+        this_month_payroll=this_month_payroll,
+        payslips_generated=payslips_generated,
+        upcoming_deadlines=upcoming_deadlines
+    )
+
+@router.get("/employees/export/payroll")
+async def export_payroll_data(
+    current_user: User = Depends(require_role(UserRole.ADMIN)),
+    company_filter: dict = Depends(get_company_filter)
+):
+    """Export payroll data for all employees"""
+    try:
+        employees = await db.employees.find(company_filter).to_list(length=None)
+        
+        payroll_data = []
+        for emp in employees:
+            if emp.get('salary_structure'):
+                salary = emp['salary_structure']
+                
+                # Calculate totals
+                gross_salary = (
+                    salary.get('basic_salary', 0) +
+                    salary.get('hra', 0) +
+                    salary.get('medical_allowance', 0) +
+                    salary.get('travel_allowance', 0) +
+                    salary.get('food_allowance', 0) +
+                    salary.get('internet_allowance', 0) +
+                    salary.get('special_allowance', 0)
+                )
+                
+                total_deductions = (
+                    salary.get('pf_employee', 0) +
+                    salary.get('esi_employee', 0) +
+                    salary.get('professional_tax', 0) +
+                    salary.get('tds', 0)
+                )
+                
+                net_salary = gross_salary - total_deductions
+                
+                payroll_data.append({
+                    'Employee ID': emp.get('employee_id', ''),
+                    'Name': emp.get('name', ''),
+                    'Department': emp.get('department', ''),
+                    'Designation': emp.get('designation', ''),
+                    'Status': emp.get('status', ''),
+                    'Basic Salary': salary.get('basic_salary', 0),
+                    'HRA': salary.get('hra', 0),
+                    'Medical Allowance': salary.get('medical_allowance', 0),
+                    'Travel Allowance': salary.get('travel_allowance', 0),
+                    'Food Allowance': salary.get('food_allowance', 0),
+                    'Internet Allowance': salary.get('internet_allowance', 0),
+                    'Special Allowance': salary.get('special_allowance', 0),
+                    'Gross Salary': gross_salary,
+                    'PF Employee': salary.get('pf_employee', 0),
+                    'PF Employer': salary.get('pf_employer', 0),
+                    'ESI Employee': salary.get('esi_employee', 0),
+                    'ESI Employer': salary.get('esi_employer', 0),
+                    'Professional Tax': salary.get('professional_tax', 0),
+                    'TDS': salary.get('tds', 0),
+                    'Total Deductions': total_deductions,
+                    'Net Salary': net_salary,
+                    'Bank Name': emp.get('bank_info', {}).get('bank_name', ''),
+                    'Account Number': emp.get('bank_info', {}).get('account_number', ''),
+                    'IFSC Code': emp.get('bank_info', {}).get('ifsc_code', ''),
+                })
+        
+        return {"payroll_data": payroll_data}
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to export payroll data: {str(e)}"
+        )
+
+# ==================== Bank Advice Generation API ====================
+
+@router.post("/bank-advice/generate")
+async def generate_bank_advice(
+    request: BankAdviceGenerate,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Generate bank advice for salary disbursement"""
+    try:
+        # Get all active employees
+        employees = await db.employees.find({"status": "active"}, {"_id": 0}).to_list(length=None)
+        
+        if not employees:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No active employees found"
+            )
+        
+        # Get employee source mappings
+        mappings = await db.employee_source_mapping.find({}, {"_id": 0}).to_list(length=None)
+        mapping_dict = {m["employee_id"]: m["company_account_id"] for m in mappings}
+        
+        # Get company accounts
+        company_accounts = await db.company_bank_accounts.find({"is_active": True}, {"_id": 0}).to_list(length=None)
+        account_dict = {acc["id"]: acc for acc in company_accounts}
+        
+        # Get payroll data for the month
+        payroll_data = await db.payroll_runs.find_one(
+            {"month": request.month, "year": request.year},
+            {"_id": 0}
+        )
+        
+        # Group employees by company account
+        accounts_data = {}
+        unmapped_employees = []
+        
+        for employee in employees:
+            emp_id = employee["employee_id"]
+            company_account_id = mapping_dict.get(emp_id)
+            
+            if not company_account_id:
+                unmapped_employees.append(emp_id)
+                continue
+            
+            if company_account_id not in accounts_data:
+                accounts_data[company_account_id] = {
+                    "account": account_dict.get(company_account_id),
+                    "employees": []
+                }
+            
+            # Calculate salary
+            salary_structure = employee.get("salary_structure", {})
+            gross_salary = (
+                salary_structure.get("basic_salary", 0) +
+                salary_structure.get("hra", 0) +
+                salary_structure.get("medical_allowance", 0) +
+                salary_structure.get("travel_allowance", 0) +
+                salary_structure.get("food_allowance", 0) +
+                salary_structure.get("internet_allowance", 0) +
+                salary_structure.get("special_allowance", 0)
+            )
+            
+            total_deductions = (
+                salary_structure.get("pf_employee", 0) +
+                salary_structure.get("esi_employee", 0) +
+                salary_structure.get("professional_tax", 0) +
+                salary_structure.get("tds", 0)
+            )
+            
+            net_salary = gross_salary - total_deductions
+            
+            accounts_data[company_account_id]["employees"].append({
+                "employee_id": emp_id,
+                "employee_name": employee.get("name"),
+                "account_number": employee.get("bank_info", {}).get("account_number"),
+                "ifsc_code": employee.get("bank_info", {}).get("ifsc_code"),
+                "bank_name": employee.get("bank_info", {}).get("bank_name"),
+                "net_salary": net_salary
+            })
+        
+        # Filter by specific account if requested
+        if request.company_account_id:
+            if request.company_account_id not in accounts_data:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="No employees mapped to the selected company account"
+                )
+            accounts_data = {request.company_account_id: accounts_data[request.company_account_id]}
+        
+        # Create bank advice records
+        bank_advices = []
+        for account_id, data in accounts_data.items():
+            if not data["account"]:
+                continue
+            
+            account = data["account"]
+            employees_list = data["employees"]
+            
+            total_amount = sum(emp["net_salary"] for emp in employees_list)
+            employee_count = len(employees_list)
+            
+            logging.info(f"Bank Advice - Account: {account['account_name']}, Employees: {employee_count}, Total Amount: {total_amount}")
+            
+            # Get unique banks from employees
+            unique_banks = len(set(emp["bank_name"] for emp in employees_list if emp["bank_name"]))
+            
+            # Generate reference number
+            month_abbr = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", 
+                         "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"][request.month - 1]
+            
+            existing_count = await db.bank_advices.count_documents({
+                "month": request.month,
+                "year": request.year
+            })
+            
+            reference_number = f"BA/{month_abbr}{request.year}/{str(existing_count + 1).zfill(3)}"
+            
+            # Create bank advice record
+            bank_advice = BankAdvice(
+                month=request.month,
+                year=request.year,
+                reference_number=reference_number,
+                company_account_id=account_id,
+                template_id=request.template_id,
+                total_amount=total_amount,
+                employee_count=employee_count,
+                status="generated"
+            )
+            
+            # Save to database
+            await db.bank_advices.insert_one(bank_advice.dict())
+            
+            bank_advices.append({
+                **bank_advice.dict(),
+                "company_account_name": account["account_name"],
+                "bank_name": account["bank_name"],
+                "bank_count": unique_banks
+            })
+        
+        return {
+            "message": f"Generated {len(bank_advices)} bank advice(s) successfully",
+            "bank_advices": bank_advices,
+            "unmapped_employees": unmapped_employees if unmapped_employees else None
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error generating bank advice: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to generate bank advice: {str(e)}"
+        )
+
+@router.get("/bank-advice")
+async def get_bank_advices(
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Get all bank advices"""
+    try:
+        advices = await db.bank_advices.find({}, {"_id": 0}).sort("generated_date", -1).to_list(length=None)
+        
+        # Enrich with company account details
+        for advice in advices:
+            account = await db.company_bank_accounts.find_one(
+                {"id": advice["company_account_id"]},
+                {"_id": 0}
+            )
+            if account:
+                advice["company_account_name"] = account.get("account_name")
+                advice["company_bank_name"] = account.get("bank_name")
+        
+        return advices
+    except Exception as e:
+        logging.error(f"Error fetching bank advices: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch bank advices"
+        )
+
+@router.get("/bank-advice/{advice_id}/download")
+async def download_bank_advice(
+    advice_id: str,
+    current_user: User = Depends(require_role(UserRole.ADMIN))
+):
+    """Download bank advice as Excel file"""
+    from openpyxl import Workbook, load_workbook
+    from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+    try:
+        # Get bank advice
+        advice = await db.bank_advices.find_one({"id": advice_id}, {"_id": 0})
+        if not advice:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Bank advice not found"
+            )
+        
+        # Get company account
+        account = await db.company_bank_accounts.find_one(
+            {"id": advice["company_account_id"]},
+            {"_id": 0}
+        )
+        
+        # Get employee source mappings for this account
+        mappings = await db.employee_source_mapping.find(
+            {"company_account_id": advice["company_account_id"]},
+            {"_id": 0}
+        ).to_list(length=None)
+        
+        employee_ids = [m["employee_id"] for m in mappings]
+        
+        # Get employees
+        employees = await db.employees.find(
+            {"employee_id": {"$in": employee_ids}, "status": "active"},
+            {"_id": 0}
+        ).to_list(length=None)
+        
+        # Check if template was used
+        template = None
+        if advice.get("template_id"):
+            template = await db.bank_templates.find_one(
+                {"id": advice["template_id"]},
+                {"_id": 0}
+            )
+        
+        # If template exists, use it; otherwise use standard format
+        if template:
+            # Decode base64 template
+            template_data = base64.b64decode(template["template_data"])
+            template_file = io.BytesIO(template_data)
+            wb = load_workbook(template_file)
+            ws = wb.active
+            
+            # Find the header row by searching for specific keywords
+            header_row = None
+            header_mapping = {}
+            
+            for row in range(1, 30):  # Check first 30 rows
+                row_values = []
+                for col in range(1, 20):  # Check first 20 columns
+                    cell_value = str(ws.cell(row=row, column=col).value or "").strip()
+                    row_values.append(cell_value.lower())
+                
+                # Check if this row contains header keywords
+                if any("debit account" in val for val in row_values) or \
+                   any("beneficiary name" in val for val in row_values) or \
+                   any("transaction amount" in val for val in row_values):
+                    header_row = row
+                    
+                    # Map headers to column numbers
+                    for col in range(1, 20):
+                        cell_value = str(ws.cell(row=row, column=col).value or "").strip().lower()
+                        
+                        if "debit account" in cell_value and "number" in cell_value:
+                            header_mapping["debit_account"] = col
+                        elif "transaction amount" in cell_value:
+                            header_mapping["transaction_amount"] = col
+                        elif "transaction currency" in cell_value or ("currency" in cell_value and "transaction" in cell_value):
+                            header_mapping["currency"] = col
+                        elif "beneficiary name" in cell_value and "nickname" not in cell_value:
+                            header_mapping["beneficiary_name"] = col
+                        elif "beneficiary account" in cell_value and "number" in cell_value:
+                            header_mapping["beneficiary_account"] = col
+                        elif ("beneficiary ifsc" in cell_value or "ifsc code" in cell_value) and "beneficiary" in cell_value:
+                            header_mapping["ifsc_code"] = col
+                        elif "transaction date" in cell_value:
+                            header_mapping["transaction_date"] = col
+                        elif "payment mode" in cell_value:
+                            header_mapping["payment_mode"] = col
+                        elif "reference number" in cell_value and "customer" in cell_value:
+                            header_mapping["reference_number"] = col
+                        elif ("nickname" in cell_value or "beneficiary nickname" in cell_value) and "beneficiary" in cell_value:
+                            header_mapping["beneficiary_code"] = col
+                            logging.info(f"Found Beneficiary Nickname/Code at column {col}: {cell_value}")
+                    
+                    break
+            
+            if not header_row:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Could not identify template headers. Please ensure the template has proper headers."
+                )
+            
+            logging.info(f"Header row found at: {header_row}")
+            logging.info(f"Header mapping: {header_mapping}")
+            
+            # Data starts from the row after header
+            data_start_row = header_row + 1
+            
+            # Get company account number for debit account
+            company_account_number = account.get("account_number", "") if account else ""
+            
+            # Populate employee data
+            current_row = data_start_row
+            for idx, employee in enumerate(employees, 1):
+                salary_structure = employee.get("salary_structure", {})
+                
+                # Calculate net salary
+                gross_salary = (
+                    salary_structure.get("basic_salary", 0) +
+                    salary_structure.get("hra", 0) +
+                    salary_structure.get("medical_allowance", 0) +
+                    salary_structure.get("travel_allowance", 0) +
+                    salary_structure.get("food_allowance", 0) +
+                    salary_structure.get("internet_allowance", 0) +
+                    salary_structure.get("special_allowance", 0)
+                )
+                
+                total_deductions = (
+                    salary_structure.get("pf_employee", 0) +
+                    salary_structure.get("esi_employee", 0) +
+                    salary_structure.get("professional_tax", 0) +
+                    salary_structure.get("tds", 0)
+                )
+                
+                net_salary = gross_salary - total_deductions
+                bank_info = employee.get("bank_info", {})
+                
+                # Populate data based on header mapping
+                if "debit_account" in header_mapping:
+                    ws.cell(row=current_row, column=header_mapping["debit_account"], value=company_account_number)
+                
+                if "transaction_amount" in header_mapping:
+                    ws.cell(row=current_row, column=header_mapping["transaction_amount"], value=net_salary)
+                
+                if "currency" in header_mapping:
+                    ws.cell(row=current_row, column=header_mapping["currency"], value="INR")
+                
+                if "beneficiary_name" in header_mapping:
+                    ws.cell(row=current_row, column=header_mapping["beneficiary_name"], value=employee.get("name", ""))
+                
+                if "beneficiary_account" in header_mapping:
+                    ws.cell(row=current_row, column=header_mapping["beneficiary_account"], value=bank_info.get("account_number", ""))
+                
+                if "ifsc_code" in header_mapping:
+                    ws.cell(row=current_row, column=header_mapping["ifsc_code"], value=bank_info.get("ifsc_code", ""))
+                
+                if "transaction_date" in header_mapping:
+                    # Use current date or last day of the month
+                    from datetime import date
+                    transaction_date = date(advice["year"], advice["month"], 1)
+                    # Get last day of month
+                    if advice["month"] == 12:
+                        next_month = date(advice["year"] + 1, 1, 1)
+                    else:
+                        next_month = date(advice["year"], advice["month"] + 1, 1)
+                    last_day = (next_month - timedelta(days=1)).strftime("%d/%m/%Y")
+                    ws.cell(row=current_row, column=header_mapping["transaction_date"], value=last_day)
+                
+                if "payment_mode" in header_mapping:
+                    ws.cell(row=current_row, column=header_mapping["payment_mode"], value="NEFT")
+                
+                if "reference_number" in header_mapping:
+                    ws.cell(row=current_row, column=header_mapping["reference_number"], value=employee.get("employee_id", ""))
+                
+                if "beneficiary_code" in header_mapping:
+                    ws.cell(row=current_row, column=header_mapping["beneficiary_code"], value=employee.get("name", ""))
+                
+                current_row += 1
+        else:
+            # Use standard format (existing code)
+            wb = Workbook()
+            ws = wb.active
+            ws.title = "Bank Advice"
+            
+            # Style definitions
+            header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+            header_font = Font(color="FFFFFF", bold=True)
+            border = Border(
+                left=Side(style='thin'),
+                right=Side(style='thin'),
+                top=Side(style='thin'),
+                bottom=Side(style='thin')
+            )
+            
+            # Add header information
+            ws.merge_cells('A1:G1')
+            ws['A1'] = f"Bank Advice - {advice['reference_number']}"
+            ws['A1'].font = Font(size=14, bold=True)
+            ws['A1'].alignment = Alignment(horizontal='center')
+            
+            ws['A2'] = f"Company Account: {account['account_name'] if account else 'N/A'}"
+            ws['A3'] = f"Bank: {account['bank_name'] if account else 'N/A'}"
+            ws['A4'] = f"Period: {advice['month']}/{advice['year']}"
+            ws['A5'] = f"Total Amount: ₹{advice['total_amount']:,.2f}"
+            ws['A6'] = f"Total Employees: {advice['employee_count']}"
+            
+            # Add empty row
+            current_row = 8
+            
+            # Add table headers
+            headers = ["S.No", "Employee ID", "Employee Name", "Bank Name", "Account Number", "IFSC Code", "Amount"]
+            for col, header in enumerate(headers, 1):
+                cell = ws.cell(row=current_row, column=col, value=header)
+                cell.fill = header_fill
+                cell.font = header_font
+                cell.border = border
+                cell.alignment = Alignment(horizontal='center')
+            
+            # Add employee data
+            current_row += 1
+            for idx, employee in enumerate(employees, 1):
+                salary_structure = employee.get("salary_structure", {})
+                
+                # Calculate net salary
+                gross_salary = (
+                    salary_structure.get("basic_salary", 0) +
+                    salary_structure.get("hra", 0) +
+                    salary_structure.get("medical_allowance", 0) +
+                    salary_structure.get("travel_allowance", 0) +
+                    salary_structure.get("food_allowance", 0) +
+                    salary_structure.get("internet_allowance", 0) +
+                    salary_structure.get("special_allowance", 0)
+                )
+                
+                total_deductions = (
+                    salary_structure.get("pf_employee", 0) +
+                    salary_structure.get("esi_employee", 0) +
+                    salary_structure.get("professional_tax", 0) +
+                    salary_structure.get("tds", 0)
+                )
+                
+                net_salary = gross_salary - total_deductions
+                
+                bank_info = employee.get("bank_info", {})
+                
+                row_data = [
+                    idx,
+                    employee.get("employee_id", ""),
+                    employee.get("name", ""),
+                    bank_info.get("bank_name", ""),
+                    bank_info.get("account_number", ""),
+                    bank_info.get("ifsc_code", ""),
+                    net_salary
+                ]
+                
+                for col, value in enumerate(row_data, 1):
+                    cell = ws.cell(row=current_row, column=col, value=value)
+                    cell.border = border
+                    if col == 7:  # Amount column
+                        cell.number_format = '₹#,##0.00'
+                
+                current_row += 1
+            
+            # Add total row
+            ws.cell(row=current_row, column=6, value="Total:").font = Font(bold=True)
+            total_cell = ws.cell(row=current_row, column=7, value=advice['total_amount'])
+            total_cell.font = Font(bold=True)
+            total_cell.number_format = '₹#,##0.00'
+            total_cell.border = border
+            
+            # Adjust column widths
+            ws.column_dimensions['A'].width = 8
+            ws.column_dimensions['B'].width = 15
+            ws.column_dimensions['C'].width = 25
+            ws.column_dimensions['D'].width = 20
+            ws.column_dimensions['E'].width = 18
+            ws.column_dimensions['F'].width = 15
+            ws.column_dimensions['G'].width = 15
+        
+        # Save to BytesIO
+        excel_file = io.BytesIO()
+        wb.save(excel_file)
+        excel_file.seek(0)
+        
+        # Create filename
+        template_name = template["bank_name"] if template else "Standard"
+        filename = f"Bank_Advice_{advice['reference_number'].replace('/', '_')}_{template_name}.xlsx"
+        
+        # Return as streaming response
+        return StreamingResponse(
+            excel_file,
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error downloading bank advice: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to download bank advice: {str(e)}"
+        )
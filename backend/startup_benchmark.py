@@ -0,0 +1,122 @@
+"""
+Startup benchmark for the API server
+Measures how long `import server` takes in a fresh interpreter and how long a
+freshly started uvicorn process takes to answer its first request, so cold-start
+regressions (a heavy library imported at module level again) are caught.
+
+Usage:
+    python startup_benchmark.py                      # import time and time-to-first-request
+    python startup_benchmark.py --skip-serve         # import time only, no database needed
+    python startup_benchmark.py --max-import-ms 1500 --max-first-request-ms 4000
+
+Time-to-first-request runs the app's startup hooks, so it needs the MongoDB that
+MONGO_URL in backend/.env points at. Exits with status 1 when a limit is exceeded.
+"""
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+
+# Libraries the server should only load when an endpoint needs them
+LAZY_MODULES = ["pandas", "reportlab", "openpyxl", "razorpay", "aiosmtplib", "httpx"]
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import server
+elapsed = time.perf_counter() - started
+lazy = sorted(name for name in {modules!r} if name in sys.modules)
+print(json.dumps({{"import_ms": elapsed * 1000, "eagerly_loaded": lazy}}))
+"""
+
+
+def measure_import(runs: int) -> dict:
+    """Median time to import server in a fresh interpreter, plus heavy modules it pulled in"""
+    timings, eagerly_loaded = [], []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE.format(modules=LAZY_MODULES)],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        )
+        probe = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(probe["import_ms"])
+        eagerly_loaded = probe["eagerly_loaded"]
+    return {
+        "runs": runs,
+        "import_ms_median": round(statistics.median(timings), 1),
+        "import_ms_min": round(min(timings), 1),
+        "import_ms_max": round(max(timings), 1),
+        "eagerly_loaded": eagerly_loaded,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(timeout: float) -> dict:
+    """Time from spawning uvicorn until GET /api/ answers 200"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with status {process.returncode}: {process.stderr.read()[-2000:]}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return {"first_request_ms": round((time.perf_counter() - started) * 1000, 1)}
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.05)
+        raise RuntimeError(f"Server did not answer {url} within {timeout:.0f}s")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure server import time and time-to-first-request")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh-interpreter imports to take the median of")
+    parser.add_argument("--skip-serve", action="store_true", help="Only measure import time")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for the first response")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="Fail when the median import is slower")
+    parser.add_argument("--max-first-request-ms", type=float, default=None, help="Fail when the first response is slower")
+    args = parser.parse_args()
+
+    report = measure_import(args.runs)
+    if not args.skip_serve:
+        report.update(measure_first_request(args.timeout))
+
+    failures = []
+    if args.max_import_ms is not None and report["import_ms_median"] > args.max_import_ms:
+        failures.append(f"import took {report['import_ms_median']} ms, limit {args.max_import_ms} ms")
+    if args.max_first_request_ms is not None and report.get("first_request_ms", 0) > args.max_first_request_ms:
+        failures.append(f"first request took {report['first_request_ms']} ms, limit {args.max_first_request_ms} ms")
+    if report["eagerly_loaded"]:
+        failures.append(f"heavy modules loaded at import: {', '.join(report['eagerly_loaded'])}")
+    report["failures"] = failures
+
+    print(json.dumps(report, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -73,12 +73,7 @@ const Dashboard = () => {
 
   useEffect(() => {
     fetchDashboardStats();
-    fetchAttendanceOverview();
-    fetchPendingActions();
-    fetchLeaveStats();
-    fetchLoanOverview();
-    fetchEmployeeDistribution();
-    fetchPayrollTrends();
+    fetchDashboardSummary();
     fetchRecentActivities();
     fetchSubscriptionStatus();
   }, []);
@@ -95,58 +90,24 @@ const Dashboard = () => {
     }
   };
 
-  const fetchAttendanceOverview = async () => {
+  const fetchDashboardSummary = async () => {
     try {
-      const response = await axios.get(`${API}/dashboard/attendance-overview`);
-      setAttendanceOverview(response.data);
+      const response = await axios.get(`${API}/dashboard/summary`);
+      const { errors = {}, ...tiles } = response.data;
+      // Tiles that failed on the server come back as null; keep their defaults
+      if (tiles.attendance_overview) setAttendanceOverview(tiles.attendance_overview);
+      if (tiles.pending_actions) setPendingActions(tiles.pending_actions);
+      if (tiles.leave_statistics) setLeaveStats(tiles.leave_statistics);
+      if (tiles.loan_overview) setLoanOverview(tiles.loan_overview);
+      if (tiles.employee_distribution) setEmployeeDistribution(tiles.employee_distribution);
+      if (tiles.payroll_trends) setPayrollTrends(tiles.payroll_trends);
+      if (Object.keys(errors).length > 0) {
+        console.error('Dashboard tiles failed to load:', errors);
+        toast.warning('Some dashboard sections could not be loaded');
+      }
     } catch (error) {
-      console.error('Error fetching attendance overview:', error);
-      toast.error('Failed to load attendance overview');
-    }
-  };
-
-  const fetchPendingActions = async () => {
-    try {
-      const response = await axios.get(`${API}/dashboard/pending-actions`);
-      setPendingActions(response.data);
-    } catch (error) {
-      console.error('Error fetching pending actions:', error);
-    }
-  };
-
-  const fetchLeaveStats = async () => {
-    try {
-      const response = await axios.get(`${API}/dashboard/leave-statistics`);
-      setLeaveStats(response.data);
-    } catch (error) {
-      console.error('Error fetching leave statistics:', error);
-    }
-  };
-
-  const fetchLoanOverview = async () => {
-    try {
-      const response = await axios.get(`${API}/dashboard/loan-overview`);
-      setLoanOverview(response.data);
-    } catch (error) {
-      console.error('Error fetching loan overview:', error);
-    }
-  };
-
-  const fetchEmployeeDistribution = async () => {
-    try {
-      const response = await axios.get(`${API}/dashboard/employee-distribution`);
-      setEmployeeDistribution(response.data);
-    } catch (error) {
-      console.error('Error fetching employee distribution:', error);
-    }
-  };
-
-  const fetchPayrollTrends = async () => {
-    try {
-      const response = await axios.get(`${API}/dashboard/payroll-trends`);
-      setPayrollTrends(response.data);
-    } catch (error) {
-      console.error('Error fetching payroll trends:', error);
+      console.error('Error fetching dashboard summary:', error);
+      toast.error('Failed to load dashboard overview');
     }
   };
 
@@ -197,6 +197,31 @@ const Payslips = () => {
     }
   };
 
+  // Bulk emails run as a background job on the server; poll it until it finishes,
+  // giving up once it has made no progress for EMAIL_JOB_STALL_TIMEOUT_MS
+  const EMAIL_JOB_STALL_TIMEOUT_MS = 5 * 60 * 1000;
+  const waitForEmailJob = async (jobId, onProgress) => {
+    let lastProcessed = -1;
+    let lastProgressAt = Date.now();
+    while (true) {
+      const { data: job } = await axios.get(`${API}/payslips/email-jobs/${jobId}`);
+      onProgress(job);
+      if (job.status === 'completed') {
+        return job;
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Email job failed');
+      }
+      if (job.processed !== lastProcessed) {
+        lastProcessed = job.processed;
+        lastProgressAt = Date.now();
+      } else if (Date.now() - lastProgressAt > EMAIL_JOB_STALL_TIMEOUT_MS) {
+        throw new Error(`Email job stopped responding after ${job.processed} of ${job.total} emails`);
+      }
+      await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+  };
+
   const handleEmailAllPayslips = async (selectedEmployeeIds = null) => {
     if (!selectedMonth || !selectedYear) {
       toast.error('Please select month and year');
@@ -307,19 +332,21 @@ const Payslips = () => {
         }
       });
 
-      setEmailResults(response.data.results);
-      setEmailProgress({
-        sent: response.data.successful,
-        failed: response.data.failed,
-        total: response.data.total
+      const job = await waitForEmailJob(response.data.job_id, (progress) => {
+        setEmailResults(progress.results);
+        setEmailProgress({
+          sent: progress.successful,
+          failed: progress.failed,
+          total: progress.total
+        });
       });
 
-      if (response.data.successful > 0) {
-        toast.success(`Successfully sent ${response.data.successful} emails!`);
+      if (job.successful > 0) {
+        toast.success(`Successfully sent ${job.successful} emails!`);
         await fetchPayslips(); // Refresh to show email_sent status
       }
-      if (response.data.failed > 0) {
-        toast.warning(`${response.data.failed} emails failed to send`);
+      if (job.failed > 0) {
+        toast.warning(`${job.failed} emails failed to send`);
       }
     } catch (error) {
       console.error('Error sending emails:', error);
@@ -365,21 +392,22 @@ const Payslips = () => {
         year: parseInt(selectedYear),
         employee_ids: failedEmployeeIds
       });
+      const job = await waitForEmailJob(response.data.job_id, () => {});
 
       // Update results
       const updatedResults = emailResults.map(result => {
-        const newResult = response.data.results.find(r => r.employee_id === result.employee_id);
+        const newResult = job.results.find(r => r.employee_id === result.employee_id);
         return newResult || result;
       });
       setEmailResults(updatedResults);
 
       setEmailProgress({
-        sent: emailProgress.sent + response.data.successful,
+        sent: emailProgress.sent + job.successful,
         failed: updatedResults.filter(r => r.status === 'failed').length,
         total: emailProgress.total
       });
 
-      toast.success(`Retried ${response.data.successful} emails successfully`);
+      toast.success(`Retried ${job.successful} emails successfully`);
       await fetchPayslips();
     } catch (error) {
       console.error('Error retrying emails:', error);
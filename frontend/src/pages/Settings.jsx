@@ -42,6 +42,7 @@ const Settings = () => {
   const [backupInfo, setBackupInfo] = useState(null);
   const [downloading, setDownloading] = useState(false);
   const [restoring, setRestoring] = useState(false);
+  const [restoreProgress, setRestoreProgress] = useState(null);
   const fileInputRef = React.useRef(null);
   const [companySettings, setCompanySettings] = useState({
     company_name: 'PayrollPro Company',
@@ -171,11 +172,11 @@ const Settings = () => {
       });
       
       // Create download link
-      const blob = new Blob([response.data], { type: 'application/json' });
+      const blob = new Blob([response.data], { type: 'application/gzip' });
       const url = window.URL.createObjectURL(blob);
       const link = document.createElement('a');
       link.href = url;
-      link.download = `payroll_backup_${new Date().toISOString().split('T')[0]}.json`;
+      link.download = `payroll_backup_${new Date().toISOString().split('T')[0]}.ndjson.gz`;
       document.body.appendChild(link);
       link.click();
       document.body.removeChild(link);
@@ -195,8 +196,8 @@ const Settings = () => {
     const file = event.target.files[0];
     if (!file) return;
     
-    if (!file.name.endsWith('.json')) {
-      toast.error('Please select a valid JSON backup file');
+    if (!['.json', '.ndjson', '.gz'].some(extension => file.name.endsWith(extension))) {
+      toast.error('Please select a valid backup file (.ndjson.gz or .json)');
       return;
     }
     
@@ -206,9 +207,20 @@ const Settings = () => {
     }
     
     setRestoring(true);
+    const restoreId = `restore_${Date.now()}_${Math.random().toString(36).slice(2, 10)}`;
+    // Poll restore progress while the upload is being applied
+    const progressTimer = setInterval(async () => {
+      try {
+        const { data: job } = await axios.get(`${API}/backup/restore-jobs/${restoreId}`);
+        setRestoreProgress(job.progress_percent);
+      } catch (error) {
+        // The job record appears once the server starts reading the upload
+      }
+    }, 2000);
     try {
       const formData = new FormData();
       formData.append('file', file);
+      formData.append('restore_id', restoreId);
       
       const response = await axios.post(`${API}/backup/restore`, formData, {
         headers: {
@@ -216,7 +228,11 @@ const Settings = () => {
         }
       });
       
-      toast.success(`Backup restored successfully! ${response.data.stats.total_documents} documents restored.`);
+      if (response.data.status === 'completed_with_errors') {
+        toast.warning(`${response.data.message}. ${response.data.stats.total_documents} documents processed.`);
+      } else {
+        toast.success(`Backup restored successfully! ${response.data.stats.total_documents} documents restored.`);
+      }
       await fetchBackupInfo();
       
       // Optionally reload the page to reflect changes
@@ -227,6 +243,8 @@ const Settings = () => {
       console.error('Error restoring backup:', error);
       toast.error(error.response?.data?.detail || 'Failed to restore backup');
     } finally {
+      clearInterval(progressTimer);
+      setRestoreProgress(null);
       setRestoring(false);
       event.target.value = null;
     }
@@ -1109,7 +1127,7 @@ const Settings = () => {
                 <input
                   ref={fileInputRef}
                   type="file"
-                  accept=".json"
+                  accept=".json,.ndjson,.gz"
                   onChange={handleRestoreBackup}
                   className="hidden"
                 />
@@ -1120,7 +1138,9 @@ const Settings = () => {
                   disabled={restoring}
                 >
                   <Upload className="w-4 h-4 mr-2" />
-                  {restoring ? 'Restoring...' : 'Restore Backup'}
+                  {restoring
+                    ? (restoreProgress != null ? `Restoring... ${Math.round(restoreProgress)}%` : 'Restoring...')
+                    : 'Restore Backup'}
                 </Button>
               </div>
             </div>
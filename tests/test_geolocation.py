@@ -0,0 +1,177 @@
+"""
+GeolocationResolver and enrich_pending_logins against a local stand-in for the
+ip-api.com batch endpoint (POST /batch), served from a thread on localhost.
+"""
+import asyncio
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from geolocation import (  # noqa: E402
+    LOCATION_PENDING,
+    LOCATION_RESOLVED,
+    LOCATION_UNAVAILABLE,
+    GeolocationCache,
+    GeolocationResolver,
+    enrich_pending_logins,
+)
+
+# 9.9.9.9 is one the stand-in cannot place
+LOCATIONS = {
+    "8.8.8.8": {"city": "Mountain View", "regionName": "California", "country": "United States", "lat": 37.4, "lon": -122.1},
+    "1.1.1.1": {"city": "Sydney", "regionName": "New South Wales", "country": "Australia", "lat": -33.9, "lon": 151.2},
+    "208.67.222.222": {"city": "San Francisco", "regionName": "California", "country": "United States", "lat": 37.8, "lon": -122.4},
+    "80.80.80.80": {"city": "Amsterdam", "regionName": "North Holland", "country": "Netherlands", "lat": 52.4, "lon": 4.9},
+}
+
+
+class BatchStandIn(BaseHTTPRequestHandler):
+    batches = []
+
+    def do_POST(self):
+        if not self.path.startswith("/batch"):
+            self.send_error(404)
+            return
+        ip_addresses = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).batches.append(ip_addresses)
+        answers = [
+            {"status": "success", **LOCATIONS[ip_address]} if ip_address in LOCATIONS
+            else {"status": "fail", "message": "reserved range"}
+            for ip_address in ip_addresses
+        ]
+        body = json.dumps(answers).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def batch_server():
+    BatchStandIn.batches = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), BatchStandIn)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", BatchStandIn.batches
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_resolver(base_url: str, batch_size: int = 2) -> GeolocationResolver:
+    return GeolocationResolver(base_url, GeolocationCache(max_size=100, ttl_seconds=3600), batch_size=batch_size)
+
+
+def test_resolve_many_batches_deduplicates_and_caches(batch_server):
+    base_url, batches = batch_server
+    resolver = make_resolver(base_url)
+
+    async def scenario():
+        first = await resolver.resolve_many(
+            ["8.8.8.8", "1.1.1.1", "8.8.8.8", "192.168.1.10", "9.9.9.9", "208.67.222.222", "1.1.1.1", "80.80.80.80"]
+        )
+        requests_after_first = len(batches)
+        # Every IP is cached now, including 9.9.9.9 as "no location"
+        second = await resolver.resolve_many(["9.9.9.9", "8.8.8.8", "80.80.80.80"])
+        await resolver.close()
+        return first, requests_after_first, second
+
+    first, requests_after_first, second = asyncio.run(scenario())
+
+    # Five distinct public IPs in batches of two; the private one is never sent
+    assert batches == [["8.8.8.8", "1.1.1.1"], ["9.9.9.9", "208.67.222.222"], ["80.80.80.80"]]
+    assert requests_after_first == 3
+    assert first["8.8.8.8"]["city"] == "Mountain View"
+    assert first["192.168.1.10"] is None
+    assert first["9.9.9.9"] is None
+
+    assert len(batches) == 3
+    assert second == {"9.9.9.9": None, "8.8.8.8": first["8.8.8.8"], "80.80.80.80": first["80.80.80.80"]}
+    stats = resolver.stats()
+    assert stats["lookups"] == 5
+    assert stats["requests"] == 3
+    assert stats["hits"] == 3
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents
+
+
+class FakeLoginHistory:
+    """The subset of a motor collection enrich_pending_logins uses"""
+    def __init__(self, entries):
+        self.entries = entries
+        self.bulk_writes = 0
+
+    def find(self, query, projection):
+        matching = [entry for entry in self.entries if entry["location_status"] == query["location_status"]]
+        return FakeCursor([{field: entry.get(field) for field in ("id", "ip_address")} for entry in matching])
+
+    async def bulk_write(self, updates, ordered=True):
+        self.bulk_writes += 1
+        for update in updates:
+            query, change = update._filter, update._doc
+            for entry in self.entries:
+                if entry["id"] in query["id"]["$in"] and entry["location_status"] == query["location_status"]:
+                    entry.update(change["$set"])
+
+
+class FakeDatabase:
+    def __init__(self, entries):
+        self.login_history = FakeLoginHistory(entries)
+
+
+def test_enrich_pending_logins_resolves_or_marks_unavailable(batch_server):
+    base_url, batches = batch_server
+    entries = [
+        {"id": "login-1", "ip_address": "8.8.8.8", "location_status": LOCATION_PENDING},
+        {"id": "login-2", "ip_address": "8.8.8.8", "location_status": LOCATION_PENDING},
+        {"id": "login-3", "ip_address": "9.9.9.9", "location_status": LOCATION_PENDING},
+        {"id": "login-4", "ip_address": "10.0.0.4", "location_status": LOCATION_PENDING},
+        {"id": "login-5", "ip_address": "1.1.1.1", "location_status": LOCATION_PENDING},
+        {"id": "login-6", "ip_address": "80.80.80.80", "location_status": LOCATION_RESOLVED,
+         "location": {"city": "Amsterdam"}},
+    ]
+    db = FakeDatabase(entries)
+    resolver = make_resolver(base_url, batch_size=100)
+
+    async def scenario():
+        pending = await enrich_pending_logins(db, resolver, limit=50)
+        pending_again = await enrich_pending_logins(db, resolver, limit=50)
+        await resolver.close()
+        return pending, pending_again
+
+    pending, pending_again = asyncio.run(scenario())
+
+    assert pending == 5
+    assert pending_again == 0
+    # One lookup for the three distinct public IPs; login-6 was already resolved
+    assert batches == [["8.8.8.8", "9.9.9.9", "1.1.1.1"]]
+    assert db.login_history.bulk_writes == 1
+
+    by_id = {entry["id"]: entry for entry in entries}
+    for login_id in ("login-1", "login-2"):
+        assert by_id[login_id]["location_status"] == LOCATION_RESOLVED
+        assert by_id[login_id]["location"]["city"] == "Mountain View"
+    assert by_id["login-5"]["location"]["country"] == "Australia"
+    for login_id in ("login-3", "login-4"):
+        assert by_id[login_id]["location_status"] == LOCATION_UNAVAILABLE
+        assert by_id[login_id]["location"] is None
+    assert by_id["login-6"]["location"] == {"city": "Amsterdam"}
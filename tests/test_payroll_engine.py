@@ -0,0 +1,215 @@
+"""
+payroll_engine must produce the same amounts as the per-employee code it replaced.
+The reference_* functions below are that code, kept verbatim apart from being
+lifted out of the endpoints.
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from payroll_engine import (  # noqa: E402
+    compute_payroll_run,
+    compute_prorated_payslips,
+    compute_salary_payslips,
+)
+
+
+def reference_earnings(salary: dict) -> dict:
+    return {
+        "basic_salary": salary.get('basic_salary', 0),
+        "house_rent_allowance": salary.get('house_rent_allowance', 0) or salary.get('hra', 0),
+        "medical_allowance": salary.get('medical_allowance', 0),
+        "leave_travel_allowance": salary.get('leave_travel_allowance', 0) or salary.get('travel_allowance', 0),
+        "conveyance_allowance": salary.get('conveyance_allowance', 0) or salary.get('food_allowance', 0),
+        "performance_incentive": salary.get('performance_incentive', 0) or salary.get('internet_allowance', 0),
+        "other_benefits": salary.get('other_benefits', 0) or salary.get('special_allowance', 0)
+    }
+
+
+def reference_salary_payslip(salary: dict) -> dict:
+    earnings = reference_earnings(salary)
+    deductions = {
+        "pf_employee": salary.get('pf_employee', 0),
+        "esi_employee": salary.get('esi_employee', 0),
+        "professional_tax": salary.get('professional_tax', 0),
+        "tds": salary.get('tds', 0),
+        "loan_deductions": salary.get('loan_deductions', 0),
+        "others": salary.get('others', 0)
+    }
+    gross_salary = sum(earnings.values())
+    total_deductions = sum(deductions.values())
+    return {
+        "earnings": earnings,
+        "deductions": deductions,
+        "gross_salary": gross_salary,
+        "total_deductions": total_deductions,
+        "net_salary": gross_salary - total_deductions
+    }
+
+
+def reference_payroll_row(salary: dict, tds, loan_deductions, bonus, adjustments) -> dict:
+    earnings = reference_earnings(salary)
+    deductions = {
+        "pf_employee": salary.get('pf_employee', 0),
+        "esi_employee": salary.get('esi_employee', 0),
+        "professional_tax": salary.get('professional_tax', 0),
+        "tds": tds,
+        "loan_deductions": loan_deductions,
+        "others": salary.get('others', 0)
+    }
+    gross = sum(earnings.values())
+    deductions_total = sum(deductions.values())
+    return {
+        "earnings": earnings,
+        "deductions": deductions,
+        "gross_salary": gross,
+        "total_deductions": deductions_total,
+        "net_salary": gross - deductions_total + bonus + adjustments
+    }
+
+
+def reference_prorated_payslip(emp_data: dict, actual_days_in_month: int) -> dict:
+    days_worked = emp_data.get("days_worked", actual_days_in_month)
+    original_earnings = emp_data.get("earnings", {})
+    bonus = emp_data.get("bonus", 0)
+    adjustments = emp_data.get("adjustments", 0)
+
+    if days_worked >= actual_days_in_month:
+        prorated_earnings = {
+            "basic_salary": original_earnings.get("basic_salary", 0),
+            "house_rent_allowance": original_earnings.get("house_rent_allowance", 0),
+            "medical_allowance": original_earnings.get("medical_allowance", 0),
+            "leave_travel_allowance": original_earnings.get("leave_travel_allowance", 0),
+            "conveyance_allowance": original_earnings.get("conveyance_allowance", 0),
+            "performance_incentive": original_earnings.get("performance_incentive", 0),
+            "other_benefits": original_earnings.get("other_benefits", 0) + bonus
+        }
+    else:
+        prorated_earnings = {
+            "basic_salary": round((original_earnings.get("basic_salary", 0) / actual_days_in_month) * days_worked, 2),
+            "house_rent_allowance": round((original_earnings.get("house_rent_allowance", 0) / actual_days_in_month) * days_worked, 2),
+            "medical_allowance": round((original_earnings.get("medical_allowance", 0) / actual_days_in_month) * days_worked, 2),
+            "leave_travel_allowance": round((original_earnings.get("leave_travel_allowance", 0) / actual_days_in_month) * days_worked, 2),
+            "conveyance_allowance": round((original_earnings.get("conveyance_allowance", 0) / actual_days_in_month) * days_worked, 2),
+            "performance_incentive": round((original_earnings.get("performance_incentive", 0) / actual_days_in_month) * days_worked, 2),
+            "other_benefits": round((original_earnings.get("other_benefits", 0) / actual_days_in_month) * days_worked + bonus, 2)
+        }
+
+    original_deductions = emp_data.get("deductions", {})
+    deductions = {
+        "pf_employee": original_deductions.get("pf_employee", 0),
+        "esi_employee": original_deductions.get("esi_employee", 0),
+        "professional_tax": original_deductions.get("professional_tax", 0),
+        "tds": original_deductions.get("tds", 0),
+        "loan_deductions": original_deductions.get("loan_deductions", 0),
+        "others": original_deductions.get("others", 0) + abs(adjustments)
+    }
+
+    gross_salary = sum(prorated_earnings.values())
+    total_deductions = sum(deductions.values())
+    return {
+        "earnings": prorated_earnings,
+        "deductions": deductions,
+        "gross_salary": round(gross_salary, 2),
+        "total_deductions": round(total_deductions, 2),
+        "net_salary": round(gross_salary - total_deductions, 2)
+    }
+
+
+SALARY_STRUCTURES = [
+    # Current field names throughout
+    {
+        "basic_salary": 30000, "house_rent_allowance": 12000, "medical_allowance": 1250,
+        "leave_travel_allowance": 2500, "conveyance_allowance": 1600, "performance_incentive": 3000,
+        "other_benefits": 4650.5, "pf_employee": 1800, "esi_employee": 0, "professional_tax": 200,
+        "tds": 2500, "loan_deductions": 1000, "others": 150
+    },
+    # Legacy names only
+    {
+        "basic_salary": 18000, "hra": 7200, "travel_allowance": 900, "food_allowance": 1100,
+        "internet_allowance": 500, "special_allowance": 2333.33, "pf_employee": 1800, "professional_tax": 200
+    },
+    # Current names set to 0 fall back to the legacy ones
+    {
+        "basic_salary": 22000, "house_rent_allowance": 0, "hra": 8800, "leave_travel_allowance": 0,
+        "travel_allowance": 1200, "other_benefits": 0, "special_allowance": 999.99, "esi_employee": 165
+    },
+    # None on a current name also falls back
+    {"basic_salary": 15000, "house_rent_allowance": None, "hra": 6000, "others": 75.25},
+    # Missing components
+    {"basic_salary": 12500},
+    {},
+]
+
+
+def assert_rows_equal(expected: dict, actual: dict):
+    assert actual["earnings"] == pytest.approx(expected["earnings"])
+    assert actual["deductions"] == pytest.approx(expected["deductions"])
+    for field in ("gross_salary", "total_deductions", "net_salary"):
+        assert actual[field] == pytest.approx(expected[field]), field
+
+
+def rows(result: dict, index: int) -> dict:
+    return {
+        "earnings": result["earnings"][index],
+        "deductions": result["deductions"][index],
+        "gross_salary": result["gross_salary"][index],
+        "total_deductions": result["total_deductions"][index],
+        "net_salary": result["net_salary"][index],
+    }
+
+
+def test_salary_payslips_match_per_employee_code():
+    result = compute_salary_payslips(SALARY_STRUCTURES)
+    for index, salary in enumerate(SALARY_STRUCTURES):
+        assert_rows_equal(reference_salary_payslip(salary), rows(result, index))
+
+
+def test_payroll_run_matches_per_employee_code():
+    tds = [2500, 0, 1200.5, 0, 300, 0]
+    loan_deductions = [1000, 0, 0, 500, 0, 0]
+    bonus = [0, 5000, 0, 250.75, 0, 0]
+    adjustments = [0, -300, 150, 0, -99.99, 0]
+    result = compute_payroll_run(SALARY_STRUCTURES, tds, loan_deductions, bonus, adjustments)
+    for index, salary in enumerate(SALARY_STRUCTURES):
+        expected = reference_payroll_row(salary, tds[index], loan_deductions[index], bonus[index], adjustments[index])
+        assert_rows_equal(expected, rows(result, index))
+
+
+@pytest.mark.parametrize("days_in_month", [28, 30, 31])
+def test_prorated_payslips_match_per_employee_code(days_in_month):
+    run = compute_payroll_run(
+        SALARY_STRUCTURES,
+        tds=[2500, 0, 0, 0, 0, 0],
+        loan_deductions=[0, 0, 0, 0, 0, 0],
+        bonus=[0, 0, 0, 0, 0, 0],
+        adjustments=[0, 0, 0, 0, 0, 0],
+    )
+    # Full month, over a full month, partial, a zero-day month, fractional days and no run row data
+    days_worked = [days_in_month, days_in_month + 1, 17, 0, 12.5, 10]
+    bonus = [1000, 0, 250.5, 0, 0, 0]
+    adjustments = [0, -500, 120, 0, 33.33, 0]
+    employees = [
+        {
+            "days_worked": days_worked[index],
+            "earnings": run["earnings"][index] if index < 5 else {},
+            "deductions": run["deductions"][index] if index < 5 else {},
+            "bonus": bonus[index],
+            "adjustments": adjustments[index],
+        }
+        for index in range(len(SALARY_STRUCTURES))
+    ]
+
+    result = compute_prorated_payslips(
+        [emp["earnings"] for emp in employees],
+        [emp["deductions"] for emp in employees],
+        days_worked,
+        days_in_month,
+        bonus,
+        adjustments,
+    )
+    for index, emp in enumerate(employees):
+        assert_rows_equal(reference_prorated_payslip(emp, days_in_month), rows(result, index))
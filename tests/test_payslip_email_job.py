@@ -0,0 +1,170 @@
+"""
+Bulk payslip email delivery end to end against a local SMTP server (aiosmtpd):
+connections are pooled and reused, sends are rate limited, a rejected message
+fails only its own result, and the job document ends up with the right progress
+and results. MongoDB is replaced by an in-memory stand-in for the two collections
+the job writes to.
+"""
+import asyncio
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from aiosmtpd.controller import Controller
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:1")
+os.environ.setdefault("DB_NAME", "payslip_email_job_test")
+os.environ.setdefault("SECRET_KEY", "test")
+
+import server  # noqa: E402,F401  (payroll_routes imports from server)
+import payroll_routes  # noqa: E402
+
+
+class RecordingHandler:
+    """Accepts every message except ones addressed to a "bounce" mailbox"""
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, smtp_server, session, envelope):
+        self.sessions.add(id(session))
+        if any(recipient.startswith("bounce") for recipient in envelope.rcpt_tos):
+            return "554 Message rejected"
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+class FakeCollection:
+    """The subset of a motor collection PayslipEmailJob uses"""
+    def __init__(self):
+        self.documents = []
+        self.update_many_calls = []
+
+    async def insert_one(self, document):
+        self.documents.append(dict(document))
+
+    async def update_one(self, query, update):
+        for document in self.documents:
+            if all(document.get(field) == value for field, value in query.items()):
+                document.update(update.get("$set", {}))
+                for field, pushed in update.get("$push", {}).items():
+                    document.setdefault(field, []).extend(pushed["$each"])
+                return
+
+    async def update_many(self, query, update):
+        self.update_many_calls.append((query, update))
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.email_jobs = FakeCollection()
+        self.payslips = FakeCollection()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+def test_email_job_reuses_pooled_connections(smtp_server, monkeypatch):
+    controller, handler = smtp_server
+    fake_db = FakeDatabase()
+    monkeypatch.setattr(payroll_routes, "db", fake_db)
+    monkeypatch.setattr(payroll_routes, "SMTP_HOST", controller.hostname)
+    monkeypatch.setattr(payroll_routes, "SMTP_PORT", controller.port)
+    monkeypatch.setattr(payroll_routes, "SMTP_USER", None)
+    monkeypatch.setattr(payroll_routes, "SMTP_PASSWORD", None)
+    monkeypatch.setattr(payroll_routes, "SMTP_START_TLS", False)
+    monkeypatch.setattr(payroll_routes, "SMTP_FROM", "payroll@example.com")
+    monkeypatch.setattr(payroll_routes, "SMTP_BCC", "archive@example.com")
+    monkeypatch.setattr(payroll_routes, "EMAIL_JOB_PROGRESS_INTERVAL", 2)
+
+    # One connection, so sends are serialized; 2 at once, then 20 per second
+    pool = payroll_routes.SMTPConnectionPool(1, payroll_routes.TokenBucket(20, 2))
+    monkeypatch.setattr(payroll_routes, "smtp_pool", pool)
+    connects = []
+    connect = pool._connect
+
+    async def counting_connect():
+        connects.append(1)
+        return await connect()
+
+    monkeypatch.setattr(pool, "_connect", counting_connect)
+
+    # The rejected message goes first, so its dropped connection must be replaced
+    employees = [
+        {"employee_id": "EMP000", "name": "Bounce Test", "email": "bounce@example.com"},
+        *(
+            {"employee_id": f"EMP00{index}", "name": f"Employee {index}", "email": f"employee{index}@example.com"}
+            for index in range(1, 5)
+        ),
+    ]
+    payslip_data = {"month_name": "March", "year": 2026, "company_name": "Test Co"}
+
+    async def send_one(job, employee):
+        success, error = await payroll_routes.send_payslip_email(
+            employee["email"], employee["name"], employee["employee_id"], payslip_data, b"%PDF-1.4 test"
+        )
+        await job.record({
+            "employee_id": employee["employee_id"],
+            "employee_name": employee["name"],
+            "email": employee["email"],
+            "status": "sent" if success else "failed",
+            "error": error
+        })
+
+    async def worker(job):
+        await payroll_routes.send_in_slots(job, employees, send_one)
+
+    async def run_job():
+        job = payroll_routes.PayslipEmailJob(len(employees), 3, 2026, "admin")
+        await job.create()
+        started = time.monotonic()
+        payroll_routes.start_email_job(job, worker)
+        await payroll_routes.email_job_tasks[job.id]
+        elapsed = time.monotonic() - started
+        await pool.close()
+        return job, elapsed
+
+    job, elapsed = asyncio.run(run_job())
+
+    assert len(handler.messages) == 4
+    assert all("archive@example.com" in message.rcpt_tos for message in handler.messages)
+    # One connection carried the rejected message, one reused connection the other four
+    assert len(connects) == 2
+    assert len(handler.sessions) == 2
+    # Five sends with a burst of 2 at 20 per second take at least 0.15 s
+    assert elapsed >= 0.14
+
+    [document] = fake_db.email_jobs.documents
+    assert document["status"] == "completed"
+    assert document["processed"] == 5
+    assert document["successful"] == 4
+    assert document["failed"] == 1
+    assert len(document["results"]) == 5
+    assert sorted(result["employee_id"] for result in document["results"]) == [employee["employee_id"] for employee in employees]
+    [failed] = [result for result in document["results"] if result["status"] == "failed"]
+    assert failed["employee_id"] == "EMP000"
+    assert "554" in failed["error"]
+
+    sent_ids = [
+        employee_id
+        for query, _ in fake_db.payslips.update_many_calls
+        for employee_id in query["employee_id"]["$in"]
+    ]
+    assert sorted(sent_ids) == ["EMP001", "EMP002", "EMP003", "EMP004"]
+    assert job.id not in payroll_routes.email_job_tasks